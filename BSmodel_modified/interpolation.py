@@ -39,7 +39,7 @@ def cubic_spline_interpolation(Y, X, X_new):
     mu_value.iloc[-1] = 0
 
     # 将上述数据构建为矩阵求解 M
-    intermediate_df = pd.DataFrame(index=range(number), columns=range(number), data=0)
+    intermediate_df = pd.DataFrame(index=range(number), columns=range(number), data=0.)
     for i in range(number):
         intermediate_df.loc[i, i] = 2
         if i+1 < number:
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import json
+import click
+from .hot_paths import CASES
+from .runner import run_benchmarks, save_results, load_results, compare_results
+from .accuracy import run_harness, print_report, save_report
+from .import_time import MODULES, run_import_times
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command(name='run')
+@click.option('-s', '--sizes', default='100,1000,10000', help='comma separated chain sizes, up to 1000000')
+@click.option('-c', '--case', 'names', multiple=True, type=click.Choice(sorted(CASES)), help='default all cases')
+@click.option('-o', '--output', default=None, help='save the results as json')
+@click.option('-l', '--label', default=None)
+@click.option('--seed', default=0)
+@click.option('--repeat', default=3)
+@click.option('--budget', default=30.0, help='seconds per case and size, larger sizes are skipped beyond it')
+@click.option('--no-memory', is_flag=True)
+def run(sizes, names, output, label, seed, repeat, budget, no_memory):
+    sizes = [int(x) for x in sizes.split(',')]
+    results = run_benchmarks(sizes, list(names) or None, seed, repeat, budget, not no_memory)
+    if output:
+        save_results(results, output, label)
+
+
+@cli.command(name='compare')
+@click.argument('base')
+@click.argument('new')
+def compare(base, new):
+    for name, size, old, cur, speedup in compare_results(load_results(base), load_results(new)):
+        print('{:<36} {:>9} {:>12} {:>12} {:>8}'.format(
+            name, size,
+            '-' if old is None else '{:.6f}'.format(old),
+            '-' if cur is None else '{:.6f}'.format(cur),
+            '-' if speedup is None else '{:.2f}x'.format(speedup)))
+
+
+@cli.command(name='accuracy')
+@click.option('-c', '--candidate', default='table_cdf', help='name in accuracy.CANDIDATES or a module path')
+@click.option('-n', default=10000, help='contracts per input case')
+@click.option('-o', '--output', default=None, help='save the report as json')
+@click.option('--seed', default=0)
+@click.option('--tol', default=1e-4, help='implied volatility agreement tolerance')
+@click.option('--reference-sample', default=2000, help='contracts solved by the slow reference solver')
+@click.option('--no-iv', is_flag=True)
+def accuracy(candidate, n, output, seed, tol, reference_sample, no_iv):
+    report = run_harness(candidate, n, seed, iv=not no_iv, tol=tol, reference_sample=reference_sample)
+    print_report(report)
+    if output:
+        save_report(report, output)
+
+
+@cli.command(name='imports')
+@click.option('-m', '--module', 'modules', multiple=True, help='default the package entry points')
+@click.option('--repeat', default=3)
+@click.option('-o', '--output', default=None, help='save the results as json')
+def imports(modules, repeat, output):
+    results = run_import_times(list(modules) or MODULES, repeat)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    cli()
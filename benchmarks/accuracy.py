@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+import json
+import timeit
+import importlib
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+"""
+    Accuracy versus speed harness for fast kernels.
+    The reference is the scipy norm.cdf implementation in BSmodel_modified/BS_model.py, a candidate is any module
+    exposing the same get_<greek>(...) and get_implied_volatility(...) functions. Both are run side by side on random
+    and edge case inputs, and the max absolute / relative error per greek, the implied volatility agreement and the
+    speedup are reported.
+"""
+
+REFERENCE = 'BSmodel_modified.BS_model'
+GREEKS = ['delta', 'gamma', 'theta', 'vega', 'rho']
+_TYPED_GREEKS = ['delta', 'theta', 'rho']
+
+# candidates known to the harness, any importable module path works as well
+CANDIDATES = {
+    'table_cdf': 'option_greeks.bs_model.bs_model',
+    'kernel': 'benchmarks.kernel_adapter',
+}
+
+# relative errors are only measured where the reference is larger than this
+REL_FLOOR = 1e-8
+
+
+def _uniform(rng, low, high, n):
+    return rng.uniform(low, high, n)
+
+
+def _log_uniform(rng, low, high, n):
+    return np.exp(rng.uniform(np.log(low), np.log(high), n))
+
+
+def make_inputs(n, seed=0, case='random'):
+    """
+    :param n: number of contracts
+    :param seed: random seed
+    :param case: one of 'random', 'deep_itm_otm', 'tiny_t', 'extreme_vol'
+    :return: pandas DataFrame, columns: spot, strike, rate, dividend, vol, ttm, type
+    """
+    rng = np.random.RandomState(seed)
+    spot = _log_uniform(rng, 1, 50000, n)
+    moneyness = _uniform(rng, 0.7, 1.3, n)
+    ttm = _uniform(rng, 1 / 365, 2, n)
+    vol = _uniform(rng, 0.05, 1, n)
+    if case == 'deep_itm_otm':
+        moneyness = np.where(rng.rand(n) < 0.5, _uniform(rng, 0.2, 0.5, n), _uniform(rng, 2, 4, n))
+    elif case == 'tiny_t':
+        ttm = _uniform(rng, 1 / 365 / 24, 2 / 365, n)
+    elif case == 'extreme_vol':
+        vol = np.where(rng.rand(n) < 0.5, _uniform(rng, 0.005, 0.03, n), _uniform(rng, 1.5, 4, n))
+    elif case != 'random':
+        raise ValueError('case {} is not supported'.format(case))
+    ids = ['{:08d}'.format(i) for i in range(n)]
+    return pd.DataFrame({
+        'spot': spot,
+        'strike': spot * moneyness,
+        'rate': _uniform(rng, -0.01, 0.08, n),
+        'dividend': _uniform(rng, 0, 0.05, n),
+        'vol': vol,
+        'ttm': ttm,
+        'type': np.where(rng.rand(n) < 0.5, 'C', 'P'),
+    }, index=ids)
+
+
+def exact_price(inputs):
+    """scipy priced black-scholes value, used as the market price the solvers have to invert"""
+    sqrt_t = np.sqrt(inputs['ttm'])
+    d1 = (np.log(inputs['spot'] / inputs['strike']) +
+          (inputs['rate'] - inputs['dividend'] + 0.5 * inputs['vol'] ** 2) * inputs['ttm']) / (inputs['vol'] * sqrt_t)
+    d2 = d1 - inputs['vol'] * sqrt_t
+    spot_pv = inputs['spot'] * np.exp(-inputs['dividend'] * inputs['ttm'])
+    strike_pv = inputs['strike'] * np.exp(-inputs['rate'] * inputs['ttm'])
+    call = spot_pv * norm.cdf(d1) - strike_pv * norm.cdf(d2)
+    put = strike_pv * norm.cdf(-d2) - spot_pv * norm.cdf(-d1)
+    return pd.Series(np.where(inputs['type'] == 'C', call, put), index=inputs.index)
+
+
+def _greek_args(inputs):
+    return [inputs['spot'], inputs['strike'], inputs['rate'], inputs['dividend'], inputs['vol'], inputs['ttm']]
+
+
+def _timed(_func, *args):
+    start = timeit.default_timer()
+    result = _func(*args)
+    return result, timeit.default_timer() - start
+
+
+def _as_array(result, index):
+    return pd.Series(result).reindex(index).astype(float).values
+
+
+def _errors(reference, candidate):
+    valid = np.isfinite(reference) & np.isfinite(candidate)
+    abs_error = np.abs(candidate[valid] - reference[valid])
+    rel_mask = np.abs(reference[valid]) > REL_FLOOR
+    rel_error = abs_error[rel_mask] / np.abs(reference[valid][rel_mask])
+    return {
+        'max_abs_error': float(abs_error.max()) if abs_error.size else None,
+        'max_rel_error': float(rel_error.max()) if rel_error.size else None,
+        # contracts where only one side produced a number
+        'mismatched_nan': int((np.isfinite(reference) != np.isfinite(candidate)).sum()),
+    }
+
+
+def compare_greeks(reference, candidate, inputs):
+    report = {}
+    for greek in GREEKS:
+        args = _greek_args(inputs)
+        if greek in _TYPED_GREEKS:
+            args.append(inputs['type'])
+        ref, ref_seconds = _timed(getattr(reference, 'get_' + greek), *args)
+        cand, cand_seconds = _timed(getattr(candidate, 'get_' + greek), *args)
+        report[greek] = _errors(_as_array(ref, inputs.index), _as_array(cand, inputs.index))
+        report[greek].update(reference_seconds=ref_seconds, candidate_seconds=cand_seconds,
+                             speedup=ref_seconds / cand_seconds if cand_seconds > 0 else None)
+    return report
+
+
+def compare_implied_volatility(reference, candidate, inputs, tol=1e-4, reference_sample=2000, seed=0):
+    """
+    the candidate solver is compared with the volatility the prices were generated with, and with the reference
+    solver on a sample of reference_sample contracts (the reference solver is slow)
+    """
+    price = exact_price(inputs)
+    args = [price, inputs['spot'], inputs['strike'], inputs['rate'], inputs['dividend'], inputs['ttm'], inputs['type']]
+    cand, cand_seconds = _timed(candidate.get_implied_volatility, *args)
+    cand = _as_array(cand, inputs.index)
+    truth = inputs['vol'].values
+
+    sample = inputs.index
+    if reference_sample is not None and len(sample) > reference_sample:
+        sample = pd.Index(np.random.RandomState(seed).choice(sample, reference_sample, replace=False))
+    ref, ref_seconds = _timed(reference.get_implied_volatility, *[x[sample] for x in args])
+    ref = _as_array(ref, sample)
+    cand_on_sample = pd.Series(cand, index=inputs.index)[sample].values
+
+    report = _errors(truth, cand)
+    report.update(
+        solved_rate=float(np.isfinite(cand).mean()),
+        agreement_with_truth=float((np.abs(cand - truth) < tol).mean()),
+        agreement_with_reference=float(((np.abs(cand_on_sample - ref) < tol) |
+                                        (~np.isfinite(cand_on_sample) & ~np.isfinite(ref))).mean()),
+        reference_seconds_per_contract=ref_seconds / len(sample),
+        candidate_seconds_per_contract=cand_seconds / len(inputs),
+    )
+    report['speedup'] = report['reference_seconds_per_contract'] / report['candidate_seconds_per_contract'] \
+        if cand_seconds > 0 else None
+    return report
+
+
+def run_harness(candidate, n=10000, seed=0, cases=('random', 'deep_itm_otm', 'tiny_t', 'extreme_vol'),
+                iv=True, tol=1e-4, reference_sample=2000):
+    """
+    :param candidate: name in CANDIDATES or a module path
+    :param n: contracts per input case
+    :return: dict, case -> {greek -> error report, 'iv' -> solver report}
+    """
+    reference = importlib.import_module(REFERENCE)
+    candidate = importlib.import_module(CANDIDATES.get(candidate, candidate))
+    report = {}
+    for i, case in enumerate(cases):
+        inputs = make_inputs(n, seed + i, case)
+        report[case] = compare_greeks(reference, candidate, inputs)
+        if iv:
+            report[case]['iv'] = compare_implied_volatility(reference, candidate, inputs, tol, reference_sample, seed)
+    return report
+
+
+def print_report(report):
+    for case, greeks in report.items():
+        print(case)
+        for greek, r in greeks.items():
+            print('    {:<6} max abs {:<12} max rel {:<12} speedup {:<8}{}'.format(
+                greek, _fmt(r['max_abs_error']), _fmt(r['max_rel_error']), _fmt(r['speedup'], '{:.2f}x'),
+                '' if greek != 'iv' else ' agreement {:.4f} / reference {:.4f}'.format(
+                    r['agreement_with_truth'], r['agreement_with_reference'])))
+
+
+def _fmt(value, pattern='{:.3e}'):
+    return '-' if value is None else pattern.format(value)
+
+
+def save_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+"""
+    Benchmark cases for the hot paths of the engine.
+    Every case takes a SyntheticChain and returns a callable without arguments, so that only the call itself is
+    timed and the preparation is not.
+"""
+
+CASES = {}
+
+
+def case(name):
+    def register(_func):
+        CASES[name] = _func
+        return _func
+    return register
+
+
+def _warm_cdf_table():
+    # the legacy greeks build their cdf table on first use, keep that out of the timings
+    from option_greeks.bs_model.utils import get_cdf_table
+    get_cdf_table()
+
+
+def _greek_args(chain):
+    _warm_cdf_table()
+    return [chain.udp_series, chain.sp_series, chain.rf_series, chain.dd_series, chain.vol_series,
+            chain.ttm_series]
+
+
+@case('get_implied_volatility')
+def implied_volatility_case(chain):
+    from option_greeks.bs_model.bs_model import get_implied_volatility
+    _warm_cdf_table()
+    para = [chain.option_price, chain.udp_series, chain.sp_series, chain.rf_series, chain.dd_series,
+            chain.ttm_series, chain.type_series]
+    return lambda: get_implied_volatility(*para)
+
+
+@case('get_d1')
+def d1_case(chain):
+    from option_greeks.bs_model.bs_model import get_d1
+    args = _greek_args(chain)
+    return lambda: get_d1(*args)
+
+
+@case('get_delta')
+def delta_case(chain):
+    from option_greeks.bs_model.bs_model import get_delta
+    args = _greek_args(chain)
+    return lambda: get_delta(*args, chain.type_series)
+
+
+@case('get_gamma')
+def gamma_case(chain):
+    from option_greeks.bs_model.bs_model import get_gamma
+    args = _greek_args(chain)
+    return lambda: get_gamma(*args)
+
+
+@case('get_theta')
+def theta_case(chain):
+    from option_greeks.bs_model.bs_model import get_theta
+    args = _greek_args(chain)
+    return lambda: get_theta(*args, chain.type_series)
+
+
+@case('get_vega')
+def vega_case(chain):
+    from option_greeks.bs_model.bs_model import get_vega
+    args = _greek_args(chain)
+    return lambda: get_vega(*args)
+
+
+@case('get_rho')
+def rho_case(chain):
+    from option_greeks.bs_model.bs_model import get_rho
+    args = _greek_args(chain)
+    return lambda: get_rho(*args, chain.type_series)
+
+
+@case('check_cdf')
+def check_cdf_case(chain):
+    from option_greeks.bs_model.utils import check_cdf
+    _warm_cdf_table()
+    # the greeks call check_cdf one float at a time
+    values = np.random.RandomState(0).normal(0, 2, len(chain)).tolist()
+    return lambda: [check_cdf(x) for x in values]
+
+
+@case('cal_risk_free_for_underlying_id')
+def risk_free_case(chain):
+    from option_greeks.bs_model.toolkit import cal_risk_free_for_underlying_id
+    underlying_ids = chain.info['underlying_order_book_id'].unique().tolist()
+
+    def run():
+        return [cal_risk_free_for_underlying_id(_id, chain.info, chain.distinct_price, chain.sp_series,
+                                                chain.type_series, chain.ttm_series, chain.option_price,
+                                                chain.udp_series) for _id in underlying_ids]
+    return run
+
+
+@case('get_option_status')
+def option_status_case(chain):
+    from option_greeks.bs_model.toolkit import get_option_status, get_status_type
+    groups = [(chain.distinct_price[_id], part['order_book_id'].tolist(), get_status_type(_id))
+              for _id, part in chain.info.groupby('underlying_order_book_id')]
+
+    def run():
+        return [get_option_status(price, ids, chain.sp_series, chain.type_series, status_type)
+                for price, ids, status_type in groups]
+    return run
+
+
+@case('cubic_spline_interpolation')
+def cubic_spline_case(chain):
+    from BSmodel_modified.interpolation import cubic_spline_interpolation
+    # fit the smile of the first (underlying, expiry) group, evaluate at one point per contract
+    first = chain.info[(chain.info['underlying_order_book_id'] == chain.info['underlying_order_book_id'].iloc[0]) &
+                       (chain.info['de_listed_date'] == chain.info['de_listed_date'].iloc[0]) &
+                       (chain.info['option_type'] == 'C')]
+    # the legacy interpolation writes float results into frames of the input dtype
+    x = pd.Series(first['strike_price'].values, dtype=np.float64)
+    y = pd.Series(chain.vol_series[first['order_book_id']].values, dtype=np.float64)
+    x_new = np.random.RandomState(0).uniform(x.min() * 0.9, x.max() * 1.1, len(chain))
+    return lambda: cubic_spline_interpolation(y, x, x_new)
+
+
+def _root_finder_case(root_finder, derivative=False):
+    """solve the implied volatility of every contract with root_finder, using the exact norm.cdf pricing"""
+    def build(chain):
+        from scipy.stats import norm
+        rows = list(zip(chain.option_price, chain.udp_series, chain.sp_series, chain.rf_series, chain.ttm_series,
+                        chain.type_series == 'C'))
+
+        def solve(price, spot, strike, rate, ttm, is_call):
+            sqrt_t = np.sqrt(ttm)
+            discount = np.exp(-rate * ttm)
+
+            def target(vol):
+                d1 = (np.log(spot / strike) + (rate + 0.5 * vol * vol) * ttm) / (vol * sqrt_t)
+                d2 = d1 - vol * sqrt_t
+                if is_call:
+                    return spot * norm.cdf(d1) - strike * discount * norm.cdf(d2) - price
+                return strike * discount * norm.cdf(-d2) - spot * norm.cdf(-d1) - price
+
+            def vega(vol):
+                d1 = (np.log(spot / strike) + (rate + 0.5 * vol * vol) * ttm) / (vol * sqrt_t)
+                return spot * sqrt_t * norm.pdf(d1)
+
+            try:
+                if derivative:
+                    return root_finder(target, vega, 0.3)
+                return root_finder(target, 1e-4, 2)
+            except Exception:
+                return np.nan
+
+        return lambda: [solve(*row) for row in rows]
+    return build
+
+
+def _register_root_finders():
+    from option_greeks.bs_model import algorithm
+    from BSmodel_modified import root_finding_algorithms as legacy
+    CASES['algorithm.brent_iteration'] = _root_finder_case(algorithm.brent_iteration)
+    CASES['root_finding.brent_iteration'] = _root_finder_case(legacy.brent_iteration)
+    CASES['root_finding.bisection_iteration'] = _root_finder_case(legacy.bisection_iteration)
+    CASES['root_finding.newton_iteration'] = _root_finder_case(legacy.newton_iteration, derivative=True)
+
+
+_register_root_finders()
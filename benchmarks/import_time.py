@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import sys
+import json
+import subprocess
+"""
+    Import time of the package entry points.
+    Every module is imported in a fresh interpreter, as a short lived worker or a cli invocation would, and the
+    heavy dependencies found in sys.modules afterwards are reported next to the best wall time.
+"""
+
+MODULES = (
+    'option_greeks.bs_model.kernel',
+    'option_greeks.scenario',
+    'option_greeks.streaming',
+    'option_greeks.bs_model.bs_model',
+    'option_greeks.bs_model.computation',
+    'option_greeks.mongo_insert',
+    'option_greeks.__main__',
+)
+HEAVY = ('pandas', 'scipy', 'rqdatac', 'rqanalysis', 'pymongo')
+
+_SCRIPT = """
+import sys, json, timeit
+start = timeit.default_timer()
+import {module}
+seconds = timeit.default_timer() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [x for x in {heavy!r} if x in sys.modules]}}))
+"""
+
+
+def time_import(module, repeat=3):
+    """
+    :return: dict, seconds (best of repeat fresh interpreters), loaded (heavy dependencies imported), error
+    """
+    best, loaded = None, []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-c', _SCRIPT.format(module=module, heavy=HEAVY)],
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            return {'module': module, 'seconds': None, 'loaded': [],
+                    'error': process.stderr.strip().splitlines()[-1] if process.stderr.strip() else 'failed'}
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best:
+            best, loaded = result['seconds'], result['loaded']
+    return {'module': module, 'seconds': best, 'loaded': loaded, 'error': None}
+
+
+def run_import_times(modules=MODULES, repeat=3):
+    results = []
+    for module in modules:
+        result = time_import(module, repeat)
+        results.append(result)
+        print('{:<40} {:>10} {}'.format(
+            module, '-' if result['seconds'] is None else '{:.4f}s'.format(result['seconds']),
+            result['error'] or ','.join(result['loaded']) or '-'))
+    return results
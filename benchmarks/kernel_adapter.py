@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+from option_greeks.bs_model.kernel import bs_greeks, implied_volatility
+"""
+    The vectorized kernel (option_greeks/bs_model/kernel.py) behind the get_<greek>(...) and get_implied_volatility(...)
+    functions of bs_model.py, so that the accuracy harness can run it as a candidate. Series in, Series out, the type
+    series ('C' / 'P') becomes the is_call array of the kernel.
+"""
+
+
+def _greek(greek, underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity,
+           _type=None):
+    is_call = True if _type is None else (pd.Series(_type) == 'C').values
+    values = bs_greeks(*[np.asarray(x, dtype=float) for x in (underlying_price, strike_price, risk_free_rate,
+                                                              dividend_yield, volatility, time_to_maturity)],
+                       is_call, (greek,))[greek]
+    return pd.Series(values, index=pd.Series(underlying_price).index)
+
+
+def get_delta(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, _type):
+    return _greek('delta', underlying_price, strike_price, risk_free_rate, dividend_yield, volatility,
+                  time_to_maturity, _type)
+
+
+def get_gamma(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity):
+    return _greek('gamma', underlying_price, strike_price, risk_free_rate, dividend_yield, volatility,
+                  time_to_maturity)
+
+
+def get_theta(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, _type):
+    return _greek('theta', underlying_price, strike_price, risk_free_rate, dividend_yield, volatility,
+                  time_to_maturity, _type)
+
+
+def get_vega(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity):
+    return _greek('vega', underlying_price, strike_price, risk_free_rate, dividend_yield, volatility,
+                  time_to_maturity)
+
+
+def get_rho(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, _type):
+    return _greek('rho', underlying_price, strike_price, risk_free_rate, dividend_yield, volatility,
+                  time_to_maturity, _type)
+
+
+def get_implied_volatility(option_price, underlying_price, strike_price, risk_free_rate, dividend_yield,
+                           time_to_maturity, _type, max_iteration=100, tol=1e-7):
+    values = implied_volatility(*[np.asarray(x, dtype=float) for x in (option_price, underlying_price, strike_price,
+                                                                       risk_free_rate, dividend_yield,
+                                                                       time_to_maturity)],
+                                (pd.Series(_type) == 'C').values, max_iteration=max_iteration, tol=tol)
+    return pd.Series(values, index=pd.Series(option_price).index)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import gc
+import sys
+import json
+import timeit
+import platform
+import tracemalloc
+import subprocess
+import datetime as dt
+import numpy as np
+from .synthetic import make_chain
+from .hot_paths import CASES
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _time_call(_func, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        gc.collect()
+        start = timeit.default_timer()
+        _func()
+        best = min(best, timeit.default_timer() - start)
+    return best
+
+
+def _peak_memory(_func):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        _func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_benchmarks(sizes, names=None, seed=0, repeat=3, budget=30.0, memory=True):
+    """
+    :param sizes: chain sizes, e.g. [100, 1000, 10000, 100000, 1000000]
+    :param names: case names, default all of benchmarks.hot_paths.CASES
+    :param seed: seed of the synthetic chains
+    :param repeat: the best of repeat runs is reported
+    :param budget: seconds, a case is skipped at the sizes where its extrapolated time exceeds the budget
+    :param memory: if True, measure the peak traced memory with an extra run
+    :return: list of dict, one per (case, size)
+    """
+    names = list(CASES) if names is None else names
+    sizes = sorted(sizes)
+    results = []
+    last_seconds = {}
+    for size in sizes:
+        chain = make_chain(size, seed=seed)
+        for name in names:
+            record = {'case': name, 'size': size}
+            previous = last_seconds.get(name)
+            if previous is not None and previous[1] * size / previous[0] > budget:
+                record['skipped'] = 'over budget'
+                results.append(record)
+                print('{:<36} {:>9} skipped'.format(name, size))
+                continue
+            _func = CASES[name](chain)
+            try:
+                # single slow runs are not repeated
+                seconds = _time_call(_func, 1)
+            except Exception as e:
+                record['error'] = repr(e)
+                results.append(record)
+                print('{:<36} {:>9} failed: {!r}'.format(name, size, e))
+                continue
+            if seconds * repeat < budget and repeat > 1:
+                seconds = min(seconds, _time_call(_func, repeat - 1))
+            last_seconds[name] = (size, seconds)
+            record['seconds'] = seconds
+            record['throughput'] = size / seconds if seconds > 0 else None
+            if memory and seconds < budget:
+                record['peak_memory'] = _peak_memory(_func)
+            results.append(record)
+            print('{:<36} {:>9} {:>12.6f}s {:>14.1f}/s'.format(name, size, seconds, record['throughput'] or 0))
+    return results
+
+
+def save_results(results, path, label=None):
+    meta = {
+        'label': label,
+        'time': dt.datetime.now().isoformat(),
+        'revision': _git_revision(),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+    }
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(base, new):
+    """
+    :param base: dict loaded by load_results
+    :param new: dict loaded by load_results
+    :return: list of (case, size, base seconds, new seconds, speedup), speedup > 1 means new is faster
+    """
+    base_seconds = {(r['case'], r['size']): r.get('seconds') for r in base['results']}
+    rows = []
+    for r in new['results']:
+        old = base_seconds.get((r['case'], r['size']))
+        cur = r.get('seconds')
+        speedup = old / cur if old and cur else None
+        rows.append((r['case'], r['size'], old, cur, speedup))
+    return rows
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import datetime as dt
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+from option_greeks.bs_model.toolkit import STATUS_MAP
+"""
+    Seeded generator of realistic option chains, so the engine can be run without rqdatac.
+    A chain is made of (underlying, expiry) groups, each with calls and puts on the same strike ladder around the
+    money. Strike steps follow toolkit.STATUS_MAP so that get_option_status finds proper ATM contracts.
+"""
+
+# product: underlying price range
+PRODUCTS = {
+    '510050.XSHG': (2.2, 3.6),
+    'M': (2500, 3500),
+    'SR': (4800, 6000),
+    'CU': (42000, 55000),
+    'RU': (10000, 15000),
+    'CF': (12000, 16000),
+    'C': (1700, 2200),
+}
+
+TRADING_DATE = dt.datetime(2020, 1, 6)
+
+
+class SyntheticChain:
+    """same attributes as computation.MarketData plus the risk free rate and the volatility used for pricing"""
+    def __init__(self, info, _date, option_price, udp_series, distinct_price, sp_series, ttm_series, dd_series,
+                 type_series, rf_series, vol_series):
+        self.info = info
+        self.date = _date
+        self.option_price = option_price
+        self.udp_series = udp_series
+        self.distinct_price = distinct_price
+        self.sp_series = sp_series
+        self.ttm_series = ttm_series
+        self.dd_series = dd_series
+        self.type_series = type_series
+        self.rf_series = rf_series
+        self.vol_series = vol_series
+
+    @property
+    def id_list(self):
+        return self.info['order_book_id'].tolist()
+
+    def __len__(self):
+        return len(self.info)
+
+
+def make_chain(n_contracts, seed=0, strikes_per_side=5, expiries=4, _date=TRADING_DATE):
+    """
+    :param n_contracts: approximate number of contracts, the chain is cut to exactly this size
+    :param seed: random seed, same seed same chain
+    :param strikes_per_side: strikes below and above the money for each (underlying, expiry) group
+    :param expiries: expiries per underlying
+    :param _date: trading date of the chain
+    :return: SyntheticChain
+    """
+    rng = np.random.RandomState(seed)
+    products = list(PRODUCTS)
+    group_size = 2 * (2 * strikes_per_side + 1)
+    n_groups = int(np.ceil(n_contracts / group_size))
+
+    rows = []
+    distinct_price = {}
+    for g in range(n_groups):
+        product = products[g % len(products)]
+        serial = g // len(products)
+        expiry_number = serial % expiries
+        if product == '510050.XSHG':
+            underlying_id = product
+        else:
+            # several futures months, each with its own option expiries
+            underlying_id = '{}{:04d}'.format(product, 2001 + serial // expiries)
+        if underlying_id not in distinct_price:
+            low, high = PRODUCTS[product]
+            distinct_price[underlying_id] = float(np.round(rng.uniform(low, high), 3))
+        spot = distinct_price[underlying_id]
+
+        step = STATUS_MAP[product].get_interval(spot)
+        atm = np.round(spot / step) * step
+        de_listed_date = _date + dt.timedelta(days=int(7 + 30 * expiry_number + rng.randint(0, 5)))
+        for k in range(-strikes_per_side, strikes_per_side + 1):
+            strike = float(np.round(atm + k * step, 3))
+            if strike <= 0:
+                strike = step
+            for option_type in ('C', 'P'):
+                rows.append((strike, underlying_id, de_listed_date, option_type, product))
+
+    info = pd.DataFrame(rows[:n_contracts], columns=['strike_price', 'underlying_order_book_id', 'de_listed_date',
+                                                     'option_type', 'underlying_symbol'])
+    info.insert(0, 'order_book_id', ['{:08d}'.format(10000001 + i) for i in range(len(info))])
+    info['listed_date'] = _date - dt.timedelta(days=180)
+    ids = info['order_book_id'].tolist()
+
+    strike = info['strike_price'].values
+    spot = info['underlying_order_book_id'].map(distinct_price).values
+    ttm = np.array([(x - _date).days / 365 for x in info['de_listed_date']])
+    is_call = (info['option_type'] == 'C').values
+    rate = np.full(len(info), 0.03)
+    moneyness = np.log(strike / spot)
+    vol = 0.18 + 0.6 * moneyness ** 2 - 0.1 * moneyness + rng.normal(0, 0.01, len(info))
+    vol = np.clip(vol, 0.05, 1.5)
+
+    sqrt_t = np.sqrt(ttm)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * vol ** 2) * ttm) / (vol * sqrt_t)
+    d2 = d1 - vol * sqrt_t
+    discount = np.exp(-rate * ttm)
+    call = spot * norm.cdf(d1) - strike * discount * norm.cdf(d2)
+    put = strike * discount * norm.cdf(-d2) - spot * norm.cdf(-d1)
+    # quotes are on the exchange tick
+    tick = np.where(info['underlying_symbol'] == '510050.XSHG', 1e-4, 0.5)
+    price = np.maximum(np.round(np.where(is_call, call, put) / tick) * tick, tick)
+
+    return SyntheticChain(
+        info, _date,
+        pd.Series(price, index=ids, name='option_price'),
+        pd.Series(spot, index=ids, name='udp_series'),
+        pd.Series(distinct_price, name='close'),
+        pd.Series(strike, index=ids, name='sp_series'),
+        pd.Series(ttm, index=ids, name='ttm_series'),
+        pd.Series(0.0, index=ids, name='dd_series'),
+        pd.Series(info['option_type'].tolist(), index=ids, name='type_series'),
+        pd.Series(rate, index=ids, name='rf_series'),
+        pd.Series(vol, index=ids, name='vol_series'),
+    )
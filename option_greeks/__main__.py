@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
+import contextlib
+import datetime as dt
 import click
-from option_greeks.mongo_insert import get_work
+from option_greeks.profiling import metrics
 
 
 @click.group()
@@ -8,15 +10,79 @@ def cli():
     pass
 
 
+def use_rate_curve(directory=None, enabled=True):
+    """
+    discount every contract at its maturity on the yield curve of the date, curves kept in directory if given
+    :param enabled: False discounts every contract at the one spot risk free rate of the date
+    """
+    from option_greeks import rate_curve
+    from option_greeks.bs_model import computation
+    computation.RATE_CURVE = enabled
+    if enabled:
+        rate_curve.curve_cache = rate_curve.CurveCache(directory)
+
+
 @cli.command(name='update')
 @click.option('-m', '--mongo-url', required=True)
 @click.option('-r', '--rqdata-uri', required=True)
 @click.option('-d', '--days', required=True)
-def update(mongo_url, rqdata_uri, days):
+@click.option('--metrics', 'metrics_file', default=None, help='append stage timings and counters as a json line')
+@click.option('--profile', 'profile_file', default=None, help='dump cProfile stats of the whole run to this file')
+@click.option('--cache-dir', default=None, help='reuse the results of days whose inputs did not change')
+@click.option('--cache-size', default=1024, help='megabytes of results kept in --cache-dir')
+@click.option('--rate-curve/--flat-rate', default=True,
+              help='rate of every contract from the yield curve at its maturity (default) or one rate for all')
+@click.option('--rate-curve-dir', default=None, help='keep the yield curves of past days in this directory')
+def update(mongo_url, rqdata_uri, days, metrics_file, profile_file, cache_dir, cache_size, rate_curve,
+           rate_curve_dir):
+    # the data and storage clients are only loaded by the command that runs, not by --help
+    from option_greeks.mongo_insert import get_work
+    use_rate_curve(rate_curve_dir, rate_curve)
     print('work start')
-    get_work(mongo_url, rqdata_uri, days)
+    metrics.reset()
+    with contextlib.ExitStack() as stack:
+        if metrics_file:
+            stack.enter_context(metrics.track_memory())
+        if profile_file:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.runcall(get_work, mongo_url, rqdata_uri, days, cache_dir, cache_size << 20)
+            profiler.dump_stats(profile_file)
+        else:
+            get_work(mongo_url, rqdata_uri, days, cache_dir, cache_size << 20)
+    if metrics_file:
+        metrics.dump(metrics_file, command='update', days=days)
+    print(metrics.to_dict())
+
+
+@cli.command(name='backfill')
+@click.option('-m', '--mongo-url', required=True)
+@click.option('-r', '--rqdata-uri', required=True)
+@click.option('-s', '--start-date', required=True, help='YYYY-MM-DD')
+@click.option('-e', '--end-date', required=True, help='YYYY-MM-DD')
+@click.option('-w', '--window', default=20, help='trading dates fetched and computed in one panel')
+@click.option('--hdf5', 'hdf5_file', default=None, help='read the closes from this local daybar archive')
+@click.option('--hdf5-underlying', 'hdf5_underlying', default=None, help='archive of the underlyings, default --hdf5')
+@click.option('--rate-curve/--flat-rate', default=True,
+              help='rate of every contract from the yield curve at its maturity (default) or one rate for all')
+@click.option('--rate-curve-dir', default=None, help='keep the yield curves of past days in this directory')
+def backfill(mongo_url, rqdata_uri, start_date, end_date, window, hdf5_file, hdf5_underlying, rate_curve,
+             rate_curve_dir):
+    import rqdatac
+    from option_greeks.mongo_insert import backfill_panel, database
+    rqdatac.init(uri=rqdata_uri)
+    use_rate_curve(rate_curve_dir, rate_curve)
+    price_source = None
+    if hdf5_file:
+        from option_greeks.hdf5_source import HDF5PriceSource
+        price_source = HDF5PriceSource(hdf5_file, hdf5_underlying)
+    try:
+        backfill_panel(mongo_url, database, dt.datetime.strptime(start_date, '%Y-%m-%d'),
+                       dt.datetime.strptime(end_date, '%Y-%m-%d'), window, price_source)
+    finally:
+        if price_source is not None:
+            price_source.close()
 
 
 if __name__ == '__main__':
     cli()
-
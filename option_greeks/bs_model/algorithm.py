@@ -1,5 +1,5 @@
 
-from scipy import optimize
+from ..profiling import metrics
 
 
 class BoundException(Exception):
@@ -30,12 +30,23 @@ def bound_adjustment(target_function, lower_bound, upper_bound):
     return lower_bound, upper_bound
 
 
+def counted(target_function):
+    """count every evaluation of target_function as a solver evaluation"""
+    def _target_function(x):
+        metrics.count('solver_evaluations')
+        return target_function(x)
+    return _target_function
+
+
 # brent's method https://en.wikipedia.org/wiki/Brent%27s_method#Algorithm
 def brent_iteration(target_function, x0, x1, max_iteration=100, tol=1e-7):
+    target_function = counted(target_function)
+
     # 首先判断求解区间是否为异号，若上下界函数取值不合理，调整上下界：
     if target_function(x0) * target_function(x1) > 0:
         x0, x1 = bound_adjustment(target_function, x0, x1)
 
+    from scipy import optimize
     x1 = optimize.brenth(target_function, x0, x1, xtol=tol, rtol=tol, maxiter=max_iteration)
     return x1
 
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from .kernel import bs_price, bs_greeks, norm_cdf, norm_pdf, get_d1, broadcast_inputs, bracketed_root, GREEKS
+from ..profiling import metrics
+"""
+    Vectorized Barone-Adesi and Whaley (1987) approximation of american options, for the commodity options that can be
+    exercised early. Same inputs as kernel.py, numpy arrays of any (broadcastable) shape, the cost of carry is
+    risk_free_rate - dividend_yield.
+    The critical price of every contract is solved at once by a vectorized newton iteration (as in Haug, "The Complete
+    Guide to Option Pricing Formulas"), delta and gamma are analytic, theta, vega and rho are central differences
+    computed in one batched call over the bumped inputs.
+"""
+
+CRITICAL_TOL = 1e-10
+CRITICAL_MAX_ITERATION = 100
+# bumps of the finite differences: volatility, rate (absolute), time to maturity (years, capped at half of it)
+VOL_BUMP = 1e-4
+RATE_BUMP = 1e-4
+TIME_BUMP = 1e-4
+
+
+def _exponents(risk_free_rate, dividend_yield, volatility, time_to_maturity):
+    """(q1, q2) of the quadratic approximation, q1 < 0 for the puts, q2 > 0 for the calls"""
+    variance = np.square(volatility)
+    n = 2 * (risk_free_rate - dividend_yield) / variance
+    rate_time = risk_free_rate * time_to_maturity
+    # 2r / (sigma^2 (1 - exp(-rT))), 2 / (sigma^2 T) in the limit r -> 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m_over_k = np.where(np.abs(rate_time) > 1e-12, 2 * risk_free_rate / (variance * -np.expm1(-rate_time)),
+                            2 / (variance * time_to_maturity))
+    root = np.sqrt(np.square(n - 1) + 4 * m_over_k)
+    return 0.5 * (-(n - 1) - root), 0.5 * (-(n - 1) + root)
+
+
+def _never_exercised(risk_free_rate, dividend_yield, is_call):
+    # a call is not exercised early without a dividend yield, a put is not exercised early without a positive rate
+    return np.where(is_call, dividend_yield <= 0, risk_free_rate <= 0)
+
+
+def critical_price(strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, is_call,
+                   tol=CRITICAL_TOL, max_iteration=CRITICAL_MAX_ITERATION, initial_guess=None):
+    """
+    the underlying price beyond which early exercise is optimal (above it for a call, below it for a put), solved for
+    all contracts at once
+    :param initial_guess: optional critical prices to start from, e.g. those of a close volatility
+    :return: numpy array, nan for the contracts that are never exercised early
+    """
+    shape, (strike, rate, dividend, vol, ttm, call) = broadcast_inputs(strike_price, risk_free_rate, dividend_yield,
+                                                                 volatility, time_to_maturity, is_call)
+    q1, q2 = _exponents(rate, dividend, vol, ttm)
+    q = np.where(call, q2, q1)
+    sign = np.where(call, 1.0, -1.0)
+    sqrt_t = np.sqrt(ttm)
+    dividend_discount = np.exp(-dividend * ttm)
+
+    # seed of Barone-Adesi and Whaley: the critical price of the perpetual option, pulled towards the strike
+    n = 2 * (rate - dividend) / np.square(vol)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        q_infinite = 0.5 * (-(n - 1) + sign * np.sqrt(np.square(n - 1) + 8 * rate / np.square(vol)))
+        s_infinite = strike / (1 - 1 / q_infinite)
+        h = -((rate - dividend) * ttm + sign * 2 * vol * sqrt_t) * strike / (s_infinite - strike)
+        seed = np.where(call, strike + (s_infinite - strike) * (1 - np.exp(h)),
+                        s_infinite + (strike - s_infinite) * np.exp(h))
+    if initial_guess is not None:
+        guess = np.broadcast_to(np.asarray(initial_guess, dtype=float), shape).ravel()
+        seed = np.where(np.isfinite(guess) & (guess > 0), guess, seed)
+    seed = np.where(np.isfinite(seed) & (seed > 0), seed, strike)
+
+    result = np.full(strike.shape, np.nan)
+    index = np.flatnonzero(~_never_exercised(rate, dividend, call) & (ttm > 0) & (vol > 0) & np.isfinite(q))
+    price = seed[index]
+    for _ in range(max_iteration):
+        if index.size == 0:
+            break
+        metrics.count('critical_evaluations', index.size)
+        s, k, q_, discount = sign[index], strike[index], q[index], dividend_discount[index]
+        d1 = get_d1(price, k, rate[index], dividend[index], vol[index], ttm[index])
+        cdf = norm_cdf(s * d1)
+        european = bs_price(price, k, rate[index], dividend[index], vol[index], ttm[index], call[index])
+        # s (S - X) = v(S) + s (1 - e^{(b-r)T} N(s d1)) S / q, each step solves its linearization in S
+        right = european + s * (1 - discount * cdf) * price / q_
+        slope = s * discount * cdf * (1 - 1 / q_) + (s - discount * norm_pdf(d1) / (vol[index] * sqrt_t[index])) / q_
+        done = np.abs(s * (price - k) - right) <= tol * k
+        result[index[done]] = price[done]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            next_price = (k + s * right - s * slope * price) / (1 - s * slope)
+        next_price = np.where(np.isfinite(next_price) & (next_price > 0), next_price, 0.5 * (price + k))
+        keep = ~done
+        index, price = index[keep], next_price[keep]
+    # the contracts that did not reach tol keep their last iterate
+    result[index] = price
+    return result.reshape(shape)
+
+
+def _premium(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, is_call,
+             critical=None):
+    """
+    :return: (early exercise premium coefficient A, exponent q, critical price, exercised now), arrays of the
+             broadcast shape; A is 0 for the contracts that are never exercised early
+    """
+    shape, (spot, strike, rate, dividend, vol, ttm, call) = broadcast_inputs(
+        underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, is_call)
+    if critical is None:
+        critical = critical_price(strike, rate, dividend, vol, ttm, call)
+    else:
+        critical = np.broadcast_to(np.asarray(critical, dtype=float), shape).ravel()
+    q1, q2 = _exponents(rate, dividend, vol, ttm)
+    q = np.where(call, q2, q1)
+    sign = np.where(call, 1.0, -1.0)
+    early = np.isfinite(critical)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d1 = get_d1(critical, strike, rate, dividend, vol, ttm)
+        coefficient = sign * critical / q * (1 - np.exp(-dividend * ttm) * norm_cdf(sign * d1))
+    coefficient = np.where(early, coefficient, 0.)
+    exercised = early & (sign * (spot - critical) >= 0)
+    return [x.reshape(shape) for x in (coefficient, q, critical, exercised)]
+
+
+def baw_price(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, is_call,
+              critical=None):
+    """
+    :param critical: optional critical prices of critical_price, solved here otherwise
+    :return: numpy array of american option prices
+    """
+    coefficient, q, critical, exercised = _premium(underlying_price, strike_price, risk_free_rate, dividend_yield,
+                                                   volatility, time_to_maturity, is_call, critical)
+    european = bs_price(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity,
+                        is_call)
+    sign = np.where(is_call, 1.0, -1.0)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        continuation = european + np.where(coefficient != 0, coefficient * np.power(
+            np.asarray(underlying_price, dtype=float) / critical, q), 0.)
+    return np.where(exercised, sign * (np.asarray(underlying_price, dtype=float) - strike_price), continuation)
+
+
+def baw_greeks(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, is_call,
+               greeks=GREEKS, futures=False):
+    """
+    :param futures: boolean (array), the underlying is a futures contract priced with a dividend yield equal to the
+                    rate (black 76 carry), its rho moves both so that the futures price stays fixed
+    :return: dict, greek name -> array, the same greeks as kernel.bs_greeks; delta and gamma are analytic, theta, vega
+             and rho are central differences of baw_price, all bumped inputs are priced in one batched call
+    """
+    shape, (spot, strike, rate, dividend, vol, ttm, call) = broadcast_inputs(
+        underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, is_call)
+    unknown = set(greeks) - set(GREEKS)
+    if unknown:
+        raise ValueError('greek {} is not supported'.format(sorted(unknown)[0]))
+    result = {}
+    if 'delta' in greeks or 'gamma' in greeks:
+        coefficient, q, critical, exercised = _premium(spot, strike, rate, dividend, vol, ttm, call)
+        european = bs_greeks(spot, strike, rate, dividend, vol, ttm, call, greeks=('delta', 'gamma'))
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            premium = np.where(coefficient != 0, coefficient * np.power(spot / critical, q), 0.)
+        if 'delta' in greeks:
+            result['delta'] = np.where(exercised, np.where(call, 1., -1.), european['delta'] + premium * q / spot)
+        if 'gamma' in greeks:
+            result['gamma'] = np.where(exercised, 0., european['gamma'] + premium * q * (q - 1) / np.square(spot))
+
+    bumps = [x for x in ('theta', 'vega', 'rho') if x in greeks]
+    if bumps:
+        time_bump = np.minimum(TIME_BUMP, 0.5 * ttm)
+        dividend_bump = RATE_BUMP * np.broadcast_to(np.asarray(futures, dtype=float), shape).ravel()
+        up = {'theta': (rate, dividend, vol, ttm + time_bump), 'vega': (rate, dividend, vol + VOL_BUMP, ttm),
+              'rho': (rate + RATE_BUMP, dividend + dividend_bump, vol, ttm)}
+        down = {'theta': (rate, dividend, vol, ttm - time_bump),
+                'vega': (rate, dividend, np.maximum(vol - VOL_BUMP, 0.5 * vol), ttm),
+                'rho': (rate - RATE_BUMP, dividend - dividend_bump, vol, ttm)}
+        stacked = [np.concatenate([x[i] for name in bumps for x in (up[name], down[name])]) for i in range(4)]
+        copies = 2 * len(bumps)
+        prices = baw_price(np.tile(spot, copies), np.tile(strike, copies), stacked[0], stacked[1], stacked[2],
+                           stacked[3], np.tile(call, copies)).reshape(copies, -1)
+        for i, name in enumerate(bumps):
+            width = {'theta': 2 * time_bump, 'vega': vol + VOL_BUMP - np.maximum(vol - VOL_BUMP, 0.5 * vol),
+                     'rho': 2 * RATE_BUMP}[name]
+            difference = (prices[2 * i] - prices[2 * i + 1]) / width
+            # theta is the decay with calendar time, the opposite of the sensitivity to time to maturity
+            result[name] = -difference if name == 'theta' else difference
+    return {name: result[name].reshape(shape) for name in greeks}
+
+
+def implied_volatility(option_price, underlying_price, strike_price, risk_free_rate, dividend_yield, time_to_maturity,
+                       is_call, lower_bound=1e-4, upper_bound=2, max_iteration=100, tol=1e-7):
+    """
+    implied volatility of american prices, all contracts at once with kernel.bracketed_root, which needs no
+    derivative of baw_price. The critical prices of the last evaluation seed the critical price solve of the next one.
+    Prices outside the american no arbitrage bounds (intrinsic value, underlying / strike) give nan.
+    :return: numpy array of implied volatility, same shape as the broadcast inputs
+    """
+    shape, (price, spot, strike, rate, dividend, ttm, call) = broadcast_inputs(
+        option_price, underlying_price, strike_price, risk_free_rate, dividend_yield, time_to_maturity, is_call)
+    intrinsic = np.where(call, np.maximum(spot - strike, 0), np.maximum(strike - spot, 0))
+    ceiling = np.where(call, spot, strike)
+    valid = np.isfinite(price) & (ttm > 0) & (price > intrinsic) & (price < ceiling)
+    result = np.full(price.shape, np.nan)
+    active = np.flatnonzero(valid)
+    if active.size == 0:
+        return result.reshape(shape)
+    last_critical = np.full(price.shape, np.nan)
+
+    def _target(vol, index):
+        metrics.count('solver_evaluations', index.size)
+        critical = critical_price(strike[index], rate[index], dividend[index], vol, ttm[index], call[index],
+                                  initial_guess=last_critical[index])
+        last_critical[index] = critical
+        return baw_price(spot[index], strike[index], rate[index], dividend[index], vol, ttm[index], call[index],
+                         critical) - price[index]
+
+    result[active] = bracketed_root(_target, active, lower_bound, upper_bound, max_iteration, tol)
+    return result.reshape(shape)
@@ -1,14 +1,41 @@
 # -*- coding: utf-8 -*-
-import rqdatac
+import os
 import datetime as dt
-from rqanalysis.risk import get_risk_free_rate
 import warnings
-from .toolkit import cal_risk_free_for_underlying_id
+import functools
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from .toolkit import cal_risk_free_for_underlying_id, get_status, construct_option_data, select_forward_options, \
+    calc_implied_forward_and_risk_free, STATUS_MAP
 from .bs_model import *
+from .kernel import implied_volatility, implied_volatility_fields, bs_greeks, black76_implied_volatility, \
+    black76_greeks, group_discount, GREEKS, HIGHER_GREEKS
+from . import american as _american, lattice as _lattice
+from ..profiling import metrics
+from ..lazy import lazy_import
+from ..cache import hash_inputs
+from .. import rate_curve as _rate_curve
+from ..trading_calendar import get_calendar, calendar_ttm
 import timeit
+# data clients are only imported on first use
+rqdatac = lazy_import('rqdatac')
+_risk = lazy_import('rqanalysis.risk')
 _FILTER_MAP = 'C|SR|RU|M|CU|510050.XSHG|CF'
 _REQUEST_ATTR = ['order_book_id', 'strike_price', 'underlying_order_book_id', 'de_listed_date', 'listed_date',
                  'option_type', 'underlying_symbol']
+# option prices the implied volatility can be solved from: daybar fields, and the last quotes of the day for bid / ask
+PRICE_FIELDS = ('close', 'settlement', 'bid', 'ask')
+_QUOTE_FIELDS = {'bid': 'b1', 'ask': 'a1'}
+# independent data requests of one date run concurrently: number of threads and timeout (seconds) of each request
+FETCH_WORKERS = 4
+FETCH_TIMEOUT = 120
+# threads of the per underlying shards
+SHARD_WORKERS = os.cpu_count() or 1
+# products whose options are exercisable before expiry, priced with american.py when passed as american=: every
+# commodity product of toolkit.STATUS_MAP (M, C, SR, CF, CU, RU), the ETF options are european
+AMERICAN_PRODUCTS = tuple(x for x in STATUS_MAP if x.isalpha())
+# spot risk free rate of every contract interpolated at its maturity on the yield curve of the date (rate_curve.py),
+# instead of one rate for the whole market; False gives every contract the rate of get_risk_free_rate
+RATE_CURVE = True
 """
     According to closed price, calculate implied volatility, and greeks(delta, gamma, vega, theta, rho) of all the
     options from listed date to current date in the specified market
@@ -22,11 +49,13 @@ def get_basic_information(_date) -> pd.DataFrame:
     :return: pandas dataframe, index[ nan ]: [[], [], .... ]
     """
     try:
-        _origin_data = rqdatac.all_instruments(type='Option', date=_date)[_REQUEST_ATTR]
+        with metrics.stage('fetch_instruments'):
+            _origin_data = rqdatac.all_instruments(type='Option', date=_date)[_REQUEST_ATTR]
     except ConnectionAbortedError:
         raise ConnectionAbortedError('Connection error happens')
     _origin_data['de_listed_date'] = _origin_data['de_listed_date'].apply(lambda x: dt.datetime.strptime(x, '%Y-%m-%d'))
-    _origin_data = _origin_data[_origin_data['de_listed_date'] > _date]
+    # _date may be a datetime.date (the daily update), which pandas does not compare with datetime64
+    _origin_data = _origin_data[_origin_data['de_listed_date'] > pd.Timestamp(_date)]
     _origin_data['listed_date'] = _origin_data['listed_date'].apply(lambda x: dt.datetime.strptime(x, '%Y-%m-%d'))
     _origin_data = _origin_data[_origin_data['underlying_order_book_id'].str.contains(_FILTER_MAP)]
     return _origin_data
@@ -43,6 +72,28 @@ def get_option_price_each_day(_date, all_ids_) -> pd.Series:
         return pd.Series()
 
 
+def get_option_prices_each_day(_date, all_ids_, fields=PRICE_FIELDS) -> pd.DataFrame:
+    """
+    :param fields: names of PRICE_FIELDS, bid and ask are the last quotes of the day (one tick request)
+    :return: pandas DataFrame, index = ids, one column per field, nan where a contract has no such price
+    """
+    bar_fields = [x for x in fields if x not in _QUOTE_FIELDS]
+    quote_fields = [x for x in fields if x in _QUOTE_FIELDS]
+    prices = pd.DataFrame(index=pd.Index(all_ids_))
+    if bar_fields:
+        bars = rqdatac.get_price(all_ids_, _date, _date, fields=bar_fields, expect_df=True)
+        if bars is not None:
+            prices = prices.join(bars[bar_fields].reset_index(level=1, drop=True))
+    if quote_fields:
+        ticks = rqdatac.get_price(all_ids_, _date, _date, frequency='tick',
+                                  fields=[_QUOTE_FIELDS[x] for x in quote_fields], expect_df=True)
+        if ticks is not None:
+            last = ticks.groupby(level=0).last()
+            prices = prices.join(last.rename(columns={v: k for k, v in _QUOTE_FIELDS.items()})[quote_fields])
+    # an empty quote side is sent as 0
+    return prices.reindex(columns=list(fields)).astype(float).replace(0, np.nan)
+
+
 def check_if_missing_items(new_array, ori_array, msg):
     remained = list(set(ori_array) - set(new_array))
     if not remained:
@@ -51,18 +102,28 @@ def check_if_missing_items(new_array, ori_array, msg):
         warnings.warn("{} {}".format(remained, msg))
 
 
-def get_risk_free_series(_date, order_id) -> pd.Series:
+def get_risk_free_series(_date, order_id, ttm_series=None) -> pd.Series:
+    """
+    :param ttm_series: time to maturity of order_id, with RATE_CURVE every contract takes the rate of its maturity;
+                       a date without yield curve falls back to one rate for every contract
+    """
+    if RATE_CURVE and ttm_series is not None:
+        try:
+            return _rate_curve.curve_cache.rate_series(_date, ttm_series.reindex(order_id))
+        except ValueError:
+            warnings.warn('{} yield curve is not available, one risk free rate for every contract'.format(_date))
     rate = []
     try:
-        rate = get_risk_free_rate(_date, _date)
+        rate = _risk.get_risk_free_rate(_date, _date)
     except TypeError:
         warnings.warn('{} risk free rate data is not available'.format(_date))
     return pd.Series(rate, index=order_id, name='rf_series')
 
 
 def get_date2maturity(_partial, _date) -> pd.Series:
-    value_list = map(lambda x: (x - _date).days / 365, _partial['de_listed_date'].tolist())
-    return pd.Series(value_list, index=_partial['order_book_id'].tolist(), name='ttm_series')
+    """calendar days to the de listed date / 365, all contracts at once (see trading_calendar.calendar_ttm)"""
+    return pd.Series(calendar_ttm(_partial['de_listed_date'].values, _date), index=_partial['order_book_id'].tolist(),
+                     name='ttm_series')
 
 
 def get_dividend(_ids) -> pd.Series:
@@ -92,7 +153,7 @@ def get_trading_dates_all_option(end_date, start_date=None) -> list:
     """
     :param start_date: define start date yourself
     :param end_date: datetime, the end date
-    :return: list if trading dates
+    :return: list if trading dates, from the cached trading calendar (see trading_calendar.get_calendar)
     """
     if start_date is None:
         _ori_date = rqdatac.all_instruments(type='Option')
@@ -104,88 +165,882 @@ def get_trading_dates_all_option(end_date, start_date=None) -> list:
         return []
 
     # get trading date
-    trading_dates = rqdatac.get_trading_dates(earliest_list_date, end_date)
-    return trading_dates
+    return get_calendar(end_date).trading_dates(earliest_list_date, end_date)
+
+
+def map_shards(_func, shards, max_workers=None):
+    """
+    _func applied to every shard on a thread pool of max_workers (default SHARD_WORKERS)
+    :return: list of results in the order of shards, whatever order the threads finish in
+    """
+    max_workers = SHARD_WORKERS if max_workers is None else max_workers
+    if max_workers <= 1 or len(shards) <= 1:
+        return [_func(x) for x in shards]
+    with ThreadPoolExecutor(min(max_workers, len(shards))) as executor:
+        return list(executor.map(_func, shards))
 
 
 def get_forward_risk_rate(_data, distinct_price, strike_price, option_type, time_to_maturity, option_price,
-                          underlying_price):
+                          underlying_price, max_workers=None):
+    """the implied forward rate of every underlying, one underlying per thread (see map_shards)"""
     distinct_underlying_id = _data['underlying_order_book_id'].unique().tolist()
     forward_risk_free_series = pd.Series(index=_data['order_book_id'])
 
-    for _id in distinct_underlying_id:
-        tmp_rf = cal_risk_free_for_underlying_id(_id, _data, distinct_price, strike_price, option_type,
-                                                 time_to_maturity, option_price, underlying_price)
+    def shard(_id):
+        return cal_risk_free_for_underlying_id(_id, _data, distinct_price, strike_price, option_type,
+                                               time_to_maturity, option_price, underlying_price)
+
+    for tmp_rf in map_shards(shard, distinct_underlying_id, max_workers):
         forward_risk_free_series[tmp_rf.index.tolist()] = tmp_rf.tolist()
 
     return forward_risk_free_series
 
 
-def get_all_para_ready(options_on_market_info, _date, implied_price=False):
+class _RQDataPriceSource:
+    """the default price source, the module level rqdatac functions"""
+    @staticmethod
+    def get_option_price_each_day(_date, all_ids_):
+        return get_option_price_each_day(_date, all_ids_)
+
+    @staticmethod
+    def get_underlying_price(_partial, _date):
+        return get_underlying_price(_partial, _date)
+
+    @staticmethod
+    def get_window_close(ids, start_date, end_date):
+        return get_window_close(ids, start_date, end_date)
+
+
+def _get_price_source(price_source=None):
+    return _RQDataPriceSource if price_source is None else price_source
+
+
+def fetch_concurrently(calls, max_workers=None, timeout=None):
+    """
+    run independent requests on a thread pool
+    :param calls: dict, name -> (function, args)
+    :param max_workers: concurrency limit, default FETCH_WORKERS, 1 runs the calls one after another
+    :param timeout: seconds to wait for each result, default FETCH_TIMEOUT
+    :return: dict, name -> result; an exception of a call is raised here, TimeoutError if a call is too slow
+    """
+    max_workers = FETCH_WORKERS if max_workers is None else max_workers
+    timeout = FETCH_TIMEOUT if timeout is None else timeout
+    if max_workers <= 1 or len(calls) <= 1:
+        return {name: _func(*args) for name, (_func, args) in calls.items()}
+    executor = ThreadPoolExecutor(min(max_workers, len(calls)))
+    futures = {name: executor.submit(_func, *args) for name, (_func, args) in calls.items()}
+    try:
+        result = {}
+        for name, future in futures.items():
+            try:
+                result[name] = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                raise TimeoutError('{} did not return within {} seconds'.format(name, timeout))
+        return result
+    finally:
+        # a failed or timed out call does not wait for the others
+        for future in futures.values():
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+class MarketData:
+    """
+    Everything needed to price the options of one date except the implied rate, so that the implied forward
+    run and the spot rate run can share one fetch. risk_free is the spot risk free rate series when it was fetched
+    along with the prices.
+    """
+    def __init__(self, info, _date, option_price, udp_series, distinct_price, sp_series, ttm_series, dd_series,
+                 type_series, risk_free=None):
+        self.info = info
+        self.date = _date
+        self.option_price = option_price
+        self.udp_series = udp_series
+        self.distinct_price = distinct_price
+        self.sp_series = sp_series
+        self.ttm_series = ttm_series
+        self.dd_series = dd_series
+        self.type_series = type_series
+        self.risk_free = risk_free
+
+    @property
+    def id_list(self):
+        return self.info['order_book_id'].tolist()
+
+    def take(self, ids):
+        """the MarketData of the contracts in ids only"""
+        info = self.info[self.info['order_book_id'].isin(ids)]
+
+        def keep(series):
+            return None if series is None else series[series.index.isin(info['order_book_id'])]
+        return MarketData(info, self.date, keep(self.option_price), keep(self.udp_series), self.distinct_price,
+                          keep(self.sp_series), keep(self.ttm_series), keep(self.dd_series), keep(self.type_series),
+                          keep(getattr(self, 'risk_free', None)))
+
+
+def _fetch_risk_free(_date, order_id, ttm_series=None):
+    with metrics.stage('rates'):
+        return get_risk_free_series(_date, order_id, ttm_series)
+
+
+def get_market_data(options_on_market_info, _date, price_source=None, risk_free=False, distinct_price=None):
+    """
+    the option closes, the underlying closes and, with risk_free, the spot risk free rate are requested concurrently
+    (see fetch_concurrently)
+    :param price_source: None for rqdatac, or an object with get_option_price_each_day and get_underlying_price of the
+                         same signature, e.g. hdf5_source.HDF5PriceSource over a local archive
+    :param risk_free: also fetch the spot risk free rate, kept as MarketData.risk_free
+    :param distinct_price: underlying closes already fetched, index = underlying id, they are not requested again
+    """
     if options_on_market_info is None or options_on_market_info.empty:
         return None
+    source = _get_price_source(price_source)
     id_list = options_on_market_info['order_book_id'].tolist()
-    option_price = get_option_price_each_day(_date, id_list)
-    sp_series = pd.Series(options_on_market_info['strike_price'].tolist(), index=id_list, name='sp_series')
     ttm_series = get_date2maturity(options_on_market_info, _date)
-    dd_series = get_dividend(id_list)
+    calls = {'option_price': (source.get_option_price_each_day, (_date, id_list))}
+    if distinct_price is None:
+        calls['underlying_price'] = (source.get_underlying_price, (options_on_market_info, _date))
+    if risk_free:
+        calls['risk_free'] = (_fetch_risk_free, (_date, id_list, ttm_series))
     try:
-        udp_series, distinct_price = get_underlying_price(options_on_market_info, _date)
+        with metrics.stage('fetch_prices'):
+            fetched = fetch_concurrently(calls)
     except AttributeError:
-        raise AttributeError('{} data is missing, perhaps it\'s not a trading date')
+        raise AttributeError('{} data is missing, perhaps it\'s not a trading date'.format(_date))
+    option_price = fetched['option_price']
+    if distinct_price is None:
+        udp_series, distinct_price = fetched['underlying_price']
+    else:
+        udp_series = pd.Series(options_on_market_info['underlying_order_book_id'].map(distinct_price).values,
+                               index=id_list, name='udp_series').dropna()
+    sp_series = pd.Series(options_on_market_info['strike_price'].tolist(), index=id_list, name='sp_series')
+    dd_series = get_dividend(id_list)
 
     type_series = get_type(options_on_market_info)
+    return MarketData(options_on_market_info, _date, option_price, udp_series, distinct_price, sp_series,
+                      ttm_series, dd_series, type_series, fetched.get('risk_free'))
+
+
+def get_rate_series(market_data, implied_price=False, black76=False):
+    """
+    :param black76: the options on futures take the spot risk free rate even with implied_price, their underlying
+                    price is already the forward, so no implied forward is fitted for them
+    """
     if implied_price:
-        rf_series = get_forward_risk_rate(options_on_market_info, distinct_price, sp_series, type_series, ttm_series,
-                                          option_price, udp_series)
-    else:
-        rf_series = get_risk_free_series(_date, id_list)
-    para = [option_price, udp_series, sp_series, rf_series, dd_series, ttm_series, type_series]
+        info = market_data.info
+        if black76:
+            info = info[~is_futures_option(info['underlying_order_book_id'].values)]
+        with metrics.stage('implied_forward'):
+            forward_rate = get_forward_risk_rate(info, market_data.distinct_price, market_data.sp_series,
+                                                 market_data.type_series, market_data.ttm_series,
+                                                 market_data.option_price, market_data.udp_series)
+        if len(info) == len(market_data.info):
+            return forward_rate
+        return fill_futures_rate(market_data, forward_rate)
+    if market_data.risk_free is not None:
+        return market_data.risk_free
+    return _fetch_risk_free(market_data.date, market_data.id_list, market_data.ttm_series)
+
+
+def fill_futures_rate(market_data, forward_rate):
+    """
+    :param forward_rate: implied forward rate series of the options that are not on futures
+    :return: rate series of every contract of market_data, the options on futures take the spot risk free rate
+    """
+    spot_rate = get_rate_series(market_data)
+    futures = is_futures_option(market_data.info['underlying_order_book_id'].values)
+    futures_ids = market_data.info['order_book_id'][futures]
+    rate = pd.Series(forward_rate, dtype=float).reindex(market_data.id_list)
+    rate[futures_ids.tolist()] = pd.Series(spot_rate).reindex(futures_ids).values
+    return rate
+
+
+def result_columns(greeks=GREEKS):
+    """:return: the columns of a result frame, iv and then greeks"""
+    return ['iv'] + list(greeks)
+
+
+def get_result_index(ids, _date):
+    """
+    index[ id, date ] of one date, built from integer codes: the ids are a categorical level and the date level holds
+    the single date instead of one copy per row
+    """
+    order_book_id = pd.Categorical(ids)
+    return pd.MultiIndex(levels=[pd.CategoricalIndex(order_book_id.categories), pd.Index([_date])],
+                         codes=[order_book_id.codes, np.zeros(len(order_book_id), dtype=np.int8)],
+                         names=('order_book_id', 'trading_date'), verify_integrity=False)
+
+
+def compact_result(pd_data, dtype=np.float32):
+    """
+    cast the greek columns of a result frame, e.g. to float32 for storage and transport, the index is kept
+    """
+    if pd_data is None or dtype is None:
+        return pd_data
+    return pd_data.astype({x: dtype for x in pd_data.columns if pd_data[x].dtype.kind == 'f'}, copy=False)
+
+
+def calc_greeks(market_data, rf_series, dtype=np.float64, greeks=GREEKS):
+    """
+    :param dtype: dtype of the greek columns, np.float32 halves the size of the result
+    :param greeks: the greek columns, see get_greeks; the ones of kernel.HIGHER_GREEKS are computed by
+                   kernel.bs_greeks from the same iv, the first order columns do not depend on them
+    """
+    _date = market_data.date
+    udp_series, sp_series = market_data.udp_series, market_data.sp_series
+    dd_series, ttm_series, type_series = market_data.dd_series, market_data.ttm_series, market_data.type_series
+    para = [market_data.option_price, udp_series, sp_series, rf_series, dd_series, ttm_series, type_series]
 
     # Calculate Geeks
-    vol_series = get_implied_volatility(*para).rename('iv')
+    metrics.count('contracts', len(market_data.option_price))
+    with metrics.stage('iv'):
+        vol_series = get_implied_volatility(*para).rename('iv')
     args = [udp_series, sp_series, rf_series, dd_series, vol_series, ttm_series]
-    delta = get_delta(*args, type_series).rename('delta')
-    gamma = get_gamma(*args).rename('gamma')
-    theta = get_theta(*args, type_series).rename('theta')
-    vega = get_vega(*args).rename('vega')
-    rho = get_rho(*args, type_series).rename('rho')
-    _col = ['iv', 'delta', 'gamma', 'theta', ]
+    with metrics.stage('greeks'):
+        delta = get_delta(*args, type_series).rename('delta')
+        gamma = get_gamma(*args).rename('gamma')
+        theta = get_theta(*args, type_series).rename('theta')
+        vega = get_vega(*args).rename('vega')
+        rho = get_rho(*args, type_series).rename('rho')
     pd_data = pd.concat([vol_series, delta, gamma, theta, vega, rho], axis=1, sort=True)
+    higher = [x for x in greeks if x not in GREEKS]
+    if higher:
+        ids = pd_data.index
+        with metrics.stage('greeks'):
+            values = bs_greeks(*[pd.Series(x).reindex(ids).values.astype(float) for x in args],
+                               (type_series.reindex(ids) == 'C').values, higher)
+        for greek in higher:
+            pd_data[greek] = values[greek]
+    pd_data = pd_data[result_columns(greeks)]
 
     # multi-index
-    date_array = [_date for _ in range(len(pd_data.index))]
-    mul_index = pd.MultiIndex.from_arrays([pd_data.index.tolist(), date_array], names=('order_book_id', 'trading_date'))
-    pd_data.index = mul_index
+    pd_data.index = get_result_index(pd_data.index, _date)
+    return compact_result(pd_data, dtype)
+
+
+def calc_iv_fields(market_data, rf_series, option_prices, dtype=np.float64):
+    """
+    implied volatility of every price field in one call of kernel.implied_volatility_fields, the contract constants
+    are computed once for all the fields
+    :param option_prices: DataFrame, index = ids, one column per price field, as get_option_prices_each_day
+    :return: a data frame: index[ id (categorical), date ] : columns[iv_<field> of every field]
+    """
+    ids = pd.Index(sorted(market_data.id_list))
+    is_call = (market_data.type_series.reindex(ids) == 'C').values
+    metrics.count('contracts', len(ids))
+    with metrics.stage('iv'):
+        iv = implied_volatility_fields(option_prices.reindex(ids).values, market_data.udp_series.reindex(ids).values,
+                                       market_data.sp_series.reindex(ids).values,
+                                       pd.Series(rf_series).reindex(ids).values,
+                                       market_data.dd_series.reindex(ids).values,
+                                       market_data.ttm_series.reindex(ids).values, is_call)
+    return pd.DataFrame(iv.astype(dtype, copy=False), columns=['iv_{}'.format(x) for x in option_prices.columns],
+                        index=get_result_index(ids, market_data.date))
+
+
+def join_results(frames, _date):
+    """one result frame of _date from the frames of disjoint sets of contracts, ids sorted"""
+    pd_data = pd.concat([x.reset_index(level=1, drop=True) for x in frames if x is not None])
+    pd_data = pd_data.set_axis(pd.Index(pd_data.index.tolist()), axis=0).sort_index()
+    pd_data.index = get_result_index(pd_data.index, _date)
     return pd_data
 
 
-def get_greeks(_date, ids=None, sc_only='true', implied_price=False):
+def calc_greeks_routed(market_data, rf_series, dtype=np.float64, american=(), black76=False, greeks=GREEKS):
+    """
+    calc_greeks for the european contracts and calc_greeks_sharded for the american products (and with black76 the
+    options on futures) only, so that these flags leave the results of the other contracts unchanged
+    :param american: products priced as american options, e.g. AMERICAN_PRODUCTS
+    :param black76: price the options on futures with black 76
+    :param greeks: the greek columns, see get_greeks
+    """
+    ids = market_data.info['order_book_id']
+    underlying = market_data.info['underlying_order_book_id'].values
+    routed = np.isin(get_product(underlying), list(american))
+    if black76:
+        routed |= is_futures_option(underlying)
+    if not routed.any():
+        return calc_greeks(market_data, rf_series, dtype, greeks)
+    rf_series = pd.Series(rf_series)
+    routed_ids, european_ids = ids[routed].tolist(), ids[~routed].tolist()
+    frames = [calc_greeks_sharded(market_data.take(routed_ids), rf_series.reindex(routed_ids), american=american,
+                                  black76=black76, greeks=greeks)]
+    if european_ids:
+        frames.append(calc_greeks(market_data.take(european_ids), rf_series.reindex(european_ids), greeks=greeks))
+    return compact_result(join_results(frames, market_data.date), dtype)
+
+
+def calc_greeks_cached(market_data, rf_series, dtype=np.float64, cache=None, sharded=False, american=(),
+                       black76=False, greeks=GREEKS, **flags):
+    """
+    calc_greeks (calc_greeks_sharded with sharded) memoized in cache (cache.ResultCache) by a hash of the inputs and
+    flags, the hash is kept in attrs['input_hash'] of the result so that writers can skip dates they already wrote
+    :param american: products priced as american options, e.g. AMERICAN_PRODUCTS; only their contracts go to the
+                     vectorized engines (see calc_greeks_routed), the european ones keep the calc_greeks results
+    :param black76: price the options on futures with black 76, these contracts are routed the same way
+    :param greeks: the greek columns, names of kernel.GREEKS and HIGHER_GREEKS; the extra columns leave the
+                   others unchanged
+    """
+    if american:
+        flags['american'] = sorted(american)
+    if black76:
+        flags['black76'] = True
+    if tuple(greeks) != GREEKS:
+        flags['greeks'] = list(greeks)
+
+    def _calc(*args):
+        if sharded:
+            return calc_greeks_sharded(*args, american=american, black76=black76, greeks=greeks)
+        return calc_greeks_routed(*args, american=american, black76=black76, greeks=greeks)
+
+    if cache is None:
+        return _calc(market_data, rf_series, dtype)
+    key = hash_inputs(market_data, rf_series, dtype=np.dtype(dtype).name, sharded=sharded, **flags)
+    pd_data = cache.get(key)
+    if pd_data is None:
+        pd_data = _calc(market_data, rf_series, dtype)
+        cache.put(key, pd_data)
+    pd_data.attrs['input_hash'] = key
+    return pd_data
+
+
+def get_all_para_ready(options_on_market_info, _date, implied_price=False, dtype=np.float64, price_source=None,
+                       cache=None, sharded=False, american=(), black76=False, greeks=GREEKS):
+    market_data = get_market_data(options_on_market_info, _date, price_source,
+                                  risk_free=not implied_price or black76)
+    if market_data is None:
+        return None
+    return calc_greeks_cached(market_data, get_rate_series(market_data, implied_price, black76), dtype, cache,
+                              sharded, american, black76, greeks, implied_price=implied_price)
+
+
+def get_all_para_ready_both(options_on_market_info, _date, dtype=np.float64, price_source=None, cache=None,
+                            sharded=False, american=(), black76=False, greeks=GREEKS):
+    """
+    fetch and prepare the chain once, then calculate with both the implied forward rate and the spot risk free rate
+    :return: (implied forward result, risk free rate result), both None if there is nothing on the market
+    """
+    market_data = get_market_data(options_on_market_info, _date, price_source, risk_free=True)
+    if market_data is None:
+        return None, None
+    return calc_greeks_cached(market_data, get_rate_series(market_data, True, black76), dtype, cache, sharded,
+                              american, black76, greeks, implied_price=True), \
+        calc_greeks_cached(market_data, get_rate_series(market_data, False), dtype, cache, sharded, american,
+                           black76, greeks, implied_price=False)
+
+
+def filter_sc(all_data, sc_only='true'):
+    if sc_only == 'true':
+        all_data = all_data[all_data['underlying_symbol'] == '510050.XSHG']
+    elif sc_only == 'false':
+        all_data = all_data[all_data['underlying_symbol'] != '510050.XSHG']
+    return all_data
+
+
+def filter_market(_date, sc_only='true'):
+    return filter_sc(get_basic_information(_date), sc_only)
+
+
+def select_contracts(all_data, ids=None, underlying=None, expiry=None):
+    """
+    :param ids: id list or str
+    :param underlying: underlying id list or str, e.g. 'M2005'
+    :param expiry: de listed date(s) of the contracts
+    :return: the rows of all_data matching every given filter
+    """
+    mask = pd.Series(True, index=all_data.index)
+    if ids is not None:
+        mask &= all_data['order_book_id'].isin([ids] if isinstance(ids, str) else ids)
+    if underlying is not None:
+        mask &= all_data['underlying_order_book_id'].isin([underlying] if isinstance(underlying, str) else underlying)
+    if expiry is not None:
+        expiry = pd.to_datetime([expiry] if isinstance(expiry, (str, dt.date)) else list(expiry))
+        mask &= pd.to_datetime(all_data['de_listed_date']).isin(expiry)
+    return all_data[mask]
+
+
+def get_forward_selection(all_data, requested, distinct_price, _date):
+    """
+    the ATM neighbourhood (see toolkit.select_option) giving the implied forward of every underlying and maturity of
+    the requested contracts; the status is taken on the whole market, exactly as get_forward_risk_rate does
+    :return: dict, underlying id -> {time to maturity -> {call option id: put option id}}
+    """
+    sp_series = pd.Series(all_data['strike_price'].tolist(), index=all_data['order_book_id'].tolist(),
+                          name='sp_series')
+    type_series = get_type(all_data)
+    ttm_series = get_date2maturity(all_data, _date)
+    selection = {}
+    for _id, group in requested.groupby('underlying_order_book_id', sort=False):
+        status = get_status(_id, all_data, distinct_price, sp_series, type_series)
+        option_data = construct_option_data(ttm_series, sp_series, status, type_series)
+        selection[_id] = select_forward_options(option_data, ttm_series[group['order_book_id']].unique())
+    return selection
+
+
+def get_forward_risk_rate_selected(market_data, requested_ids, selection):
+    """the implied forward rate of requested_ids from the pairs of get_forward_selection"""
+    forward_risk_free_series = pd.Series(np.nan, index=requested_ids)
+    requested = market_data.info.set_index('order_book_id').loc[requested_ids]
+    ttm = market_data.ttm_series.reindex(requested_ids)
+    for _id, pairs in selection.items():
+        for cur_time2mature, selected_option in pairs.items():
+            tmp_rf = calc_implied_forward_and_risk_free(selected_option, market_data.option_price,
+                                                        market_data.sp_series, market_data.udp_series,
+                                                        cur_time2mature)
+            cur_contract = (requested['underlying_order_book_id'] == _id).values & (ttm == cur_time2mature).values
+            forward_risk_free_series[cur_contract] = tmp_rf
+    return forward_risk_free_series
+
+
+def get_selected_market_data(all_data, requested, _date, implied_price=False, price_source=None, risk_free=False,
+                             black76=False):
+    """
+    fetch the prices of the requested contracts only, plus, for the implied forward, the ATM neighbourhood of their
+    maturities
+    :param black76: no implied forward is needed for the options on futures, nor their neighbourhood
+    :return: (MarketData of requested and neighbourhood, forward selection or None)
+    """
+    if not implied_price:
+        return get_market_data(requested, _date, price_source, risk_free), None
+    source = _get_price_source(price_source)
+    with metrics.stage('fetch_prices'):
+        _, distinct_price = source.get_underlying_price(requested, _date)
+    forward_requested = requested
+    if black76:
+        forward_requested = requested[~is_futures_option(requested['underlying_order_book_id'].values)]
+    selection = get_forward_selection(all_data, forward_requested, distinct_price, _date)
+    needed = set(requested['order_book_id'])
+    for pairs in selection.values():
+        for selected_option in pairs.values():
+            needed.update(selected_option.keys())
+            needed.update(selected_option.values())
+    extended = all_data[all_data['order_book_id'].isin(needed)]
+    return get_market_data(extended, _date, price_source, risk_free, distinct_price), selection
+
+
+def get_selected_para_ready(all_data, requested, _date, implied_price=False, dtype=np.float64, price_source=None,
+                            cache=None, sharded=False, american=(), black76=False, greeks=GREEKS):
+    """get_all_para_ready for the requested rows of all_data only"""
+    if requested.empty:
+        return None
+    requested_ids = requested['order_book_id'].tolist()
+    market_data, selection = get_selected_market_data(all_data, requested, _date, implied_price, price_source,
+                                                      not implied_price or black76, black76)
+    if implied_price:
+        with metrics.stage('implied_forward'):
+            rf_series = get_forward_risk_rate_selected(market_data, requested_ids, selection)
+    else:
+        rf_series = get_rate_series(market_data)
+    market_data = market_data.take(requested_ids)
+    if implied_price and black76:
+        rf_series = fill_futures_rate(market_data, rf_series)
+    return calc_greeks_cached(market_data, rf_series, dtype, cache, sharded, american, black76, greeks,
+                              implied_price=implied_price)
+
+
+def get_greeks(_date, ids=None, sc_only='true', implied_price=False, dtype=np.float64, price_source=None,
+               cache=None, underlying=None, expiry=None, sharded=False, american=(), black76=False, greeks=GREEKS):
     """
     get the greeks value of all the options.py on the market
     :param ids: id list or str, default None(return all available data)
     :param implied_price: indicator
     :param sc_only: True: only check common stock options.py, false: all the options.py
     :param _date: a specific date
-    :return: a data frame: index[ id, date ] : columns[delta, gamma, theta, vega, rho]
+    :param dtype: np.float32 for a compact result, default np.float64
+    :param price_source: where the closes come from, default rqdatac (see get_market_data)
+    :param cache: cache.ResultCache, a date whose inputs did not change is not recalculated
+    :param underlying: only the options on these underlying ids
+    :param expiry: only the options de listed on these dates
+    :param sharded: solve with the vectorized kernel, one underlying per thread (see calc_greeks_sharded)
+    :param american: products priced as american options with american.py, e.g. AMERICAN_PRODUCTS, default none
+    :param black76: price the options on futures with black 76, the futures price is the forward: they get the spot
+                    risk free rate and no implied forward, even with implied_price
+    :param greeks: the greek columns, names of kernel.GREEKS and HIGHER_GREEKS, e.g. GREEKS + ('vanna', 'volga');
+                   the second order greeks are nan for the american contracts
+    :return: a data frame: index[ id (categorical), date ] : columns[iv, delta, gamma, theta, vega, rho by default]
+    ids, underlying and expiry are applied before the fetch: only those contracts (and the ATM neighbourhood needed
+    by the implied forward) are fetched and calculated
     """
-    all_data = get_basic_information(_date)
-    if sc_only == 'true':
-        all_data = all_data[all_data['underlying_symbol'] == '510050.XSHG']
-    elif sc_only == 'false':
-        all_data = all_data[all_data['underlying_symbol'] != '510050.XSHG']
+    all_data = filter_market(_date, sc_only)
+
+    if ids is None and underlying is None and expiry is None:
+        return get_all_para_ready(all_data, _date, implied_price, dtype, price_source, cache, sharded, american,
+                                  black76, greeks)
+    pd_data = get_selected_para_ready(all_data, select_contracts(all_data, ids, underlying, expiry), _date,
+                                      implied_price, dtype, price_source, cache, sharded, american, black76, greeks)
+    if ids is None or pd_data is None:
+        return pd_data
+    return pd_data.loc[ids]
+
+
+def get_greeks_both(_date, ids=None, sc_only='true', dtype=np.float64, price_source=None, cache=None,
+                    underlying=None, expiry=None, sharded=False, american=(), black76=False, greeks=GREEKS):
+    """
+    same as get_greeks, but returns the implied forward and the risk free rate results from a single fetch
+    :return: (implied forward data frame, risk free rate data frame)
+    """
+    all_data = filter_market(_date, sc_only)
+    if ids is None and underlying is None and expiry is None:
+        return get_all_para_ready_both(all_data, _date, dtype, price_source, cache, sharded, american, black76,
+                                       greeks)
 
+    requested = select_contracts(all_data, ids, underlying, expiry)
+    if requested.empty:
+        return None, None
+    requested_ids = requested['order_book_id'].tolist()
+    market_data, selection = get_selected_market_data(all_data, requested, _date, True, price_source, True, black76)
+    with metrics.stage('implied_forward'):
+        forward_rate = get_forward_risk_rate_selected(market_data, requested_ids, selection)
+    market_data = market_data.take(requested_ids)
+    if black76:
+        forward_rate = fill_futures_rate(market_data, forward_rate)
+    implied = calc_greeks_cached(market_data, forward_rate, dtype, cache, sharded, american, black76, greeks,
+                                 implied_price=True)
+    spot = calc_greeks_cached(market_data, get_rate_series(market_data), dtype, cache, sharded, american, black76,
+                              greeks, implied_price=False)
     if ids is None:
-        return get_all_para_ready(all_data, _date, implied_price)
+        return implied, spot
+    return implied.loc[ids], spot.loc[ids]
+
+
+def get_implied_volatility_fields(_date, ids=None, sc_only='true', fields=PRICE_FIELDS, implied_price=False,
+                                  dtype=np.float64, price_source=None, underlying=None, expiry=None):
+    """
+    implied volatility from several prices of the options, e.g. close, settlement, bid and ask for the spread
+    :param fields: names of PRICE_FIELDS
+    :param price_source: where the closes (and the underlying closes) come from, the other fields come from rqdatac
+    the other parameters are as get_greeks
+    :return: a data frame: index[ id (categorical), date ] : columns[iv_close, iv_settlement, iv_bid, iv_ask]
+    """
+    all_data = filter_market(_date, sc_only)
+    requested = select_contracts(all_data, ids, underlying, expiry)
+    if requested.empty:
+        return None
+    requested_ids = requested['order_book_id'].tolist()
+    market_data, selection = get_selected_market_data(all_data, requested, _date, implied_price, price_source,
+                                                      not implied_price)
+    if implied_price:
+        with metrics.stage('implied_forward'):
+            rf_series = get_forward_risk_rate_selected(market_data, requested_ids, selection)
     else:
-        return get_all_para_ready(all_data, _date, implied_price).loc[ids]
+        rf_series = get_rate_series(market_data)
+    market_data = market_data.take(requested_ids)
+
+    # the closes are already in market_data, only the other fields are requested
+    with metrics.stage('fetch_prices'):
+        option_prices = get_option_prices_each_day(_date, requested_ids, [x for x in fields if x != 'close'])
+    if 'close' in fields:
+        option_prices['close'] = market_data.option_price.reindex(option_prices.index)
+    pd_data = calc_iv_fields(market_data, rf_series, option_prices[list(fields)], dtype)
+    if ids is None:
+        return pd_data
+    return pd_data.loc[ids]
+
+
+def get_window_close(ids, start_date, end_date) -> pd.DataFrame:
+    """
+    :return: close prices of ids between start_date and end_date in one request, index = date, columns = ids
+    """
+    price_ = rqdatac.get_price(ids, start_date, end_date, expect_df=True)
+    if price_ is None:
+        return pd.DataFrame(columns=ids)
+    return price_['close'].unstack(level=0)
+
+
+def get_window_market_data(trading_dates, sc_only='all', price_source=None):
+    """
+    fetch the instruments and the closes of a whole window of dates with one request each, then split them per date
+    :return: generator of MarketData, one per date with options on the market
+    """
+    with metrics.stage('fetch_instruments'):
+        instruments = rqdatac.all_instruments(type='Option')[_REQUEST_ATTR]
+    instruments['de_listed_date'] = pd.to_datetime(instruments['de_listed_date'], format='%Y-%m-%d')
+    instruments['listed_date'] = pd.to_datetime(instruments['listed_date'], format='%Y-%m-%d')
+    instruments = instruments[instruments['underlying_order_book_id'].str.contains(_FILTER_MAP)]
+    instruments = filter_sc(instruments, sc_only)
+
+    trading_dates = sorted(dt.datetime.combine(x, dt.time()) if not isinstance(x, dt.datetime) else x
+                           for x in trading_dates)
+    start_date, end_date = trading_dates[0], trading_dates[-1]
+    live = instruments[(instruments['listed_date'] <= end_date) & (instruments['de_listed_date'] > start_date)]
+    source = _get_price_source(price_source)
+    with metrics.stage('fetch_prices'):
+        fetched = fetch_concurrently({
+            'option_close': (source.get_window_close, (live['order_book_id'].tolist(), start_date, end_date)),
+            'underlying_close': (source.get_window_close, (live['underlying_order_book_id'].unique().tolist(),
+                                                           start_date, end_date))})
+    option_close, underlying_close = fetched['option_close'], fetched['underlying_close']
+
+    for _date in trading_dates:
+        info = live[(live['listed_date'] <= _date) & (live['de_listed_date'] > _date)]
+        if info.empty or pd.Timestamp(_date) not in option_close.index:
+            warnings.warn('{} data is missing, perhaps it\'s not a trading date'.format(_date))
+            continue
+        id_list = info['order_book_id'].tolist()
+        option_price = option_close.loc[pd.Timestamp(_date)].reindex(id_list).dropna().rename('option_price')
+        check_if_missing_items(option_price.index.tolist(), id_list, 'Option price data missing')
+        distinct_id = info['underlying_order_book_id'].drop_duplicates().tolist()
+        distinct_price = underlying_close.loc[pd.Timestamp(_date)].reindex(distinct_id).dropna().rename('close')
+        check_if_missing_items(distinct_price.index.tolist(), distinct_id,
+                               'Underlying price missing in date {}'.format(_date))
+        udp_series = pd.Series(info['underlying_order_book_id'].map(distinct_price).values, index=id_list,
+                               name='udp_series').dropna()
+        yield MarketData(info, _date, option_price, udp_series, distinct_price,
+                         pd.Series(info['strike_price'].tolist(), index=id_list, name='sp_series'),
+                         get_date2maturity(info, _date), get_dividend(id_list), get_type(info))
+
+
+def calc_greeks_panel(market_data_list, rf_list, dtype=np.float64, american=(), black76=False, greeks=GREEKS):
+    """
+    stack every (date, contract) row of the window into long arrays, solve iv and greeks in one vectorized call and
+    split the result per date
+    :param american: products priced as american options, e.g. AMERICAN_PRODUCTS
+    :param black76: price the options on futures with black 76
+    :param greeks: the greek columns, see get_greeks
+    :return: dict, date -> data frame like get_all_para_ready: index[ id, date ] : columns[iv, delta, gamma, ...]
+    """
+    if not market_data_list:
+        return {}
+    ids, lengths, arrays = stack_market_data(market_data_list, rf_list, american, black76)
+    values = solve_arrays(arrays, greeks=greeks).astype(dtype, copy=False)
+
+    result = {}
+    bounds = np.cumsum([0] + lengths)
+    for i, market_data in enumerate(market_data_list):
+        result[market_data.date] = pd.DataFrame(values[bounds[i]:bounds[i + 1]], columns=result_columns(greeks),
+                                                index=get_result_index(ids[i], market_data.date))
+    return result
+
+
+def get_product(underlying_id):
+    """
+    :param underlying_id: underlying ids, e.g. M2005, SR005, 510050.XSHG
+    :return: numpy array of the product codes (M, SR), '' for the underlyings that are not futures
+    """
+    product = pd.Series(np.asarray(underlying_id, dtype=str)).str.extract(r'^([A-Za-z]+)\d', expand=False)
+    return product.fillna('').values
+
+
+def is_futures_option(underlying_id):
+    """
+    :param underlying_id: underlying ids
+    :return: boolean numpy array, True for the options written on futures (every product but the ETF options)
+    """
+    return get_product(underlying_id) != ''
+
+
+def stack_market_data(market_data_list, rf_list, american=(), black76=False):
+    """
+    :param american: products priced as american options
+    :param black76: flag the options on futures, priced with black 76
+    :return: (sorted ids of every date, number of contracts of every date, dict of long arrays over all the dates:
+              option_price, udp, sp, rf, dd, ttm, is_call, is_american, is_futures and group, the code of the
+              (date, underlying, expiry) of every row)
+    """
+    columns = {name: [] for name in ('option_price', 'udp', 'sp', 'rf', 'dd', 'ttm', 'is_call', 'is_american',
+                                     'is_futures', 'group')}
+    ids, lengths = [], []
+    for i, (market_data, rf_series) in enumerate(zip(market_data_list, rf_list)):
+        id_index = pd.Index(sorted(market_data.id_list))
+        ids.append(id_index.values)
+        lengths.append(len(id_index))
+        columns['option_price'].append(market_data.option_price.reindex(id_index).values)
+        columns['udp'].append(market_data.udp_series.reindex(id_index).values)
+        columns['sp'].append(market_data.sp_series.reindex(id_index).values)
+        columns['rf'].append(pd.Series(rf_series).reindex(id_index).values)
+        columns['dd'].append(market_data.dd_series.reindex(id_index).values)
+        columns['ttm'].append(market_data.ttm_series.reindex(id_index).values)
+        columns['is_call'].append((market_data.type_series.reindex(id_index) == 'C').values)
+        underlying = market_data.info.set_index('order_book_id')['underlying_order_book_id'].reindex(id_index)
+        columns['is_american'].append(np.isin(get_product(underlying.values), list(american)))
+        columns['is_futures'].append(is_futures_option(underlying.values) if black76 else
+                                     np.zeros(len(id_index), dtype=bool))
+        columns['group'].append(pd.MultiIndex.from_arrays([np.full(len(id_index), i), underlying.values.astype(str),
+                                                           columns['ttm'][-1]]))
+    groups = columns.pop('group')
+    arrays = {name: np.concatenate(value).astype(bool if name.startswith('is_') else float)
+              for name, value in columns.items()}
+    arrays['group'] = pd.factorize(groups[0].append(groups[1:]) if groups else pd.Index([]))[0]
+    return ids, lengths, arrays
+
+
+def solve_arrays(arrays, position=slice(None), greeks=GREEKS):
+    """
+    iv and greeks of the rows position of the long arrays of stack_market_data, with the vectorized kernel, the
+    is_american rows with the barone-adesi whaley engine of american.py, the other is_futures rows with black 76
+    :return: 2D array, columns as result_columns(greeks)
+    """
+    arrays = {name: value[position] for name, value in arrays.items()}
+    metrics.count('contracts', len(arrays['sp']))
+    no_row = np.zeros(len(arrays['sp']), dtype=bool)
+    american = arrays.get('is_american', no_row)
+    futures = arrays.get('is_futures', no_row)
+    values = np.empty((len(arrays['sp']), len(greeks) + 1))
+    for engine, rows in ((kernel_engine, ~american & ~futures), (black76_engine, ~american & futures),
+                         (american_engine, american)):
+        if rows.any():
+            values[rows] = engine({name: value[rows] for name, value in arrays.items()}, greeks)
+    return values
+
+
+def kernel_engine(arrays, greeks=GREEKS):
+    with metrics.stage('iv'):
+        iv = implied_volatility(arrays['option_price'], arrays['udp'], arrays['sp'], arrays['rf'], arrays['dd'],
+                                arrays['ttm'], arrays['is_call'])
+    with metrics.stage('greeks'):
+        result = bs_greeks(arrays['udp'], arrays['sp'], arrays['rf'], arrays['dd'], iv, arrays['ttm'],
+                           arrays['is_call'], greeks)
+    return np.column_stack([iv] + [result[x] for x in greeks])
+
+
+def black76_engine(arrays, greeks=GREEKS):
+    """the underlying futures price is the forward, one discount factor per underlying and expiry"""
+    metrics.count('black76_contracts', len(arrays['sp']))
+    discount = group_discount(arrays['rf'], arrays['ttm'], arrays['group'])
+    with metrics.stage('iv'):
+        iv = black76_implied_volatility(arrays['option_price'], arrays['udp'], arrays['sp'], arrays['rf'],
+                                        arrays['ttm'], arrays['is_call'], discount)
+    with metrics.stage('greeks'):
+        result = black76_greeks(arrays['udp'], arrays['sp'], arrays['rf'], iv, arrays['ttm'], arrays['is_call'],
+                                greeks, discount)
+    return np.column_stack([iv] + [result[x] for x in greeks])
+
+
+def american_engine(arrays, greeks=GREEKS):
+    """the second order greeks are not approximated for american options, they are nan"""
+    metrics.count('american_contracts', len(arrays['sp']))
+    # a futures underlying carries at zero cost: its dividend yield is the rate
+    futures = arrays.get('is_futures', np.zeros(len(arrays['sp']), dtype=bool))
+    dividend = np.where(futures, arrays['rf'], arrays['dd'])
+    with metrics.stage('american_iv'):
+        iv = _american.implied_volatility(arrays['option_price'], arrays['udp'], arrays['sp'], arrays['rf'],
+                                          dividend, arrays['ttm'], arrays['is_call'])
+    with metrics.stage('american_greeks'):
+        result = _american.baw_greeks(arrays['udp'], arrays['sp'], arrays['rf'], dividend, iv, arrays['ttm'],
+                                      arrays['is_call'], [x for x in greeks if x in GREEKS], futures)
+    missing = np.full(len(iv), np.nan)
+    return np.column_stack([iv] + [result.get(x, missing) for x in greeks])
+
+
+def shard_by_underlying(underlying_id, n_shards):
+    """
+    cut contracts into at most n_shards shards of whole underlyings, an underlying is never split
+    :param underlying_id: array, underlying id of every contract
+    :return: list of int arrays, the contract positions of every shard, in underlying id order
+    """
+    codes, uniques = pd.factorize(np.asarray(underlying_id), sort=True)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    # many small underlyings are packed together, so a thread gets enough work to amortize its overhead
+    cuts = np.unique(np.linspace(0, len(uniques), min(n_shards, len(uniques)) + 1).astype(int))
+    return [order[bounds[cuts[i]]:bounds[cuts[i + 1]]] for i in range(len(cuts) - 1)]
+
+
+def calc_greeks_sharded(market_data, rf_series, dtype=np.float64, max_workers=None, american=(), black76=False,
+                        greeks=GREEKS):
+    """
+    calc_greeks with the vectorized kernel, the chain partitioned by underlying and the shards solved on a thread
+    pool (numpy releases the gil inside the kernel array operations); every shard writes its own rows of the result,
+    so the result does not depend on the number of threads
+    :param american: products priced as american options, e.g. AMERICAN_PRODUCTS
+    :param black76: price the options on futures with black 76
+    :param greeks: the greek columns, see get_greeks
+    """
+    (ids,), _, arrays = stack_market_data([market_data], [rf_series], american, black76)
+    if len(ids) == 0:
+        return None
+    max_workers = SHARD_WORKERS if max_workers is None else max_workers
+    underlying = market_data.info.set_index('order_book_id')['underlying_order_book_id'].reindex(ids).values
+    shards = shard_by_underlying(underlying.astype(str), 4 * max_workers)
+    values = np.empty((len(ids), len(greeks) + 1), dtype=dtype)
+
+    def shard(position):
+        values[position] = solve_arrays(arrays, position, greeks)
+
+    metrics.count('shards', len(shards))
+    with metrics.stage('sharded'):
+        map_shards(shard, shards, max_workers)
+    return pd.DataFrame(values, columns=result_columns(greeks), index=get_result_index(ids, market_data.date))
+
+
+def calc_american_check(market_data, rf_series, american=AMERICAN_PRODUCTS, steps=_lattice.LATTICE_STEPS,
+                        method='binomial'):
+    """
+    cross check of the american contracts: iv of the european kernel, of the barone-adesi whaley engine and of the
+    reference lattice (lattice.py), with the delta of the last two
+    :return: a data frame: index[ id (categorical), date ] : columns[iv_european, iv_baw, iv_lattice, delta_baw,
+             delta_lattice], None if there is no american contract
+    """
+    (ids,), _, arrays = stack_market_data([market_data], [rf_series], american)
+    rows = arrays['is_american']
+    if not rows.any():
+        return None
+    price, spot, strike, rate, dividend, ttm, is_call = [arrays[x][rows] for x in
+                                                         ('option_price', 'udp', 'sp', 'rf', 'dd', 'ttm', 'is_call')]
+    metrics.count('american_contracts', int(rows.sum()))
+    iv_baw = _american.implied_volatility(price, spot, strike, rate, dividend, ttm, is_call)
+    with metrics.stage('lattice_check'):
+        iv_lattice = _lattice.implied_volatility(price, spot, strike, rate, dividend, ttm, is_call, steps, method)
+        delta_lattice = _lattice.lattice_greeks(spot, strike, rate, dividend, iv_lattice, ttm, is_call, ('delta',),
+                                                steps, method)['delta']
+    return pd.DataFrame({
+        'iv_european': implied_volatility(price, spot, strike, rate, dividend, ttm, is_call),
+        'iv_baw': iv_baw,
+        'iv_lattice': iv_lattice,
+        'delta_baw': _american.baw_greeks(spot, strike, rate, dividend, iv_baw, ttm, is_call, ('delta',))['delta'],
+        'delta_lattice': delta_lattice,
+    }, index=get_result_index(ids[rows], market_data.date))
+
+
+def get_american_check(_date, sc_only='false', implied_price=False, american=AMERICAN_PRODUCTS,
+                       steps=_lattice.LATTICE_STEPS, method='binomial', price_source=None):
+    """calc_american_check of the market of _date, see get_greeks for the parameters"""
+    market_data = get_market_data(filter_market(_date, sc_only), _date, price_source, risk_free=not implied_price)
+    if market_data is None:
+        return None
+    return calc_american_check(market_data, get_rate_series(market_data, implied_price), american, steps, method)
+
+
+def load_rate_curves(market_data_list):
+    """with RATE_CURVE, request the yield curves of the whole window at once instead of one date at a time"""
+    if RATE_CURVE and market_data_list:
+        _rate_curve.curve_cache.load(market_data_list[0].date, market_data_list[-1].date)
+
+
+def get_greeks_panel(trading_dates, sc_only='all', implied_price=False, dtype=np.float64, price_source=None,
+                     american=(), black76=False, greeks=GREEKS):
+    """
+    panel mode of get_greeks for a window of dates
+    :return: dict, date -> data frame, dates that are not reachable are missing
+    """
+    market_data_list = list(get_window_market_data(trading_dates, sc_only, price_source))
+    load_rate_curves(market_data_list)
+    return calc_greeks_panel(market_data_list, [get_rate_series(x, implied_price, black76) for x in market_data_list],
+                             dtype, american, black76, greeks)
+
+
+def get_greeks_panel_both(trading_dates, sc_only='all', dtype=np.float64, price_source=None, american=(),
+                          black76=False, greeks=GREEKS):
+    """
+    :return: (implied forward dict, risk free rate dict), both date -> data frame, from one fetch of the window
+    """
+    market_data_list = list(get_window_market_data(trading_dates, sc_only, price_source))
+    load_rate_curves(market_data_list)
+    return calc_greeks_panel(market_data_list, [get_rate_series(x, True, black76) for x in market_data_list], dtype,
+                             american, black76, greeks), \
+        calc_greeks_panel(market_data_list, [get_rate_series(x, False) for x in market_data_list], dtype, american,
+                          black76, greeks)
 
 
 def check_runtime(_func):
+    """print the elapsed time of _func and record it as a stage named after it, the return value is kept"""
+    @functools.wraps(_func)
     def decorator(*args, **kwargs):
         start = timeit.default_timer()
-        _func(*args, **kwargs)
+        with metrics.stage(_func.__name__):
+            result = _func(*args, **kwargs)
         stop = timeit.default_timer()
         print('Time: ', stop - start)
+        return result
     return decorator
 
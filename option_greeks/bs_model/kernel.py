@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from ..profiling import metrics
+"""
+    Vectorized black-scholes kernels working on numpy arrays of any (broadcastable) shape.
+    Same formulas as bs_model.py, but every contract is handled in one array operation instead of a python loop,
+    is_call is a boolean array instead of the 'C'/'P' type series.
+    Only numpy is needed: scipy.special.ndtr is used for the normal cdf when scipy is installed, it is imported on
+    the first call rather than with the module.
+"""
+
+ReverseSqrtOf2Pi = 1 / np.sqrt(2 * np.pi)
+GREEKS = ('delta', 'gamma', 'theta', 'vega', 'rho')
+# second order greeks of bs_greeks: vanna = d delta / d vol, volga = d vega / d vol, charm = - d delta / d T,
+# speed = d gamma / d S, color = - d gamma / d T
+HIGHER_GREEKS = ('vanna', 'volga', 'charm', 'speed', 'color')
+
+
+_ndtr = None
+
+
+def _numpy_ndtr(x):
+    # Hart (1968) double precision approximation, as in West (2005) "Better approximations to cumulative normal
+    # functions", absolute error below 1e-15 everywhere
+    x = np.asarray(x, dtype=float)
+    a = np.abs(x)
+    e = np.exp(-0.5 * a * a)
+    numerator = ((((((3.52624965998911e-02 * a + 0.700383064443688) * a + 6.37396220353165) * a +
+                    33.912866078383) * a + 112.079291497871) * a + 221.213596169931) * a + 220.206867912376)
+    denominator = (((((((8.83883476483184e-02 * a + 1.75566716318264) * a + 16.064177579207) * a +
+                       86.7807322029461) * a + 296.564248779674) * a + 637.333633378831) * a +
+                    793.826512519948) * a + 440.413735824752)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tail = e / (a + 1 / (a + 2 / (a + 3 / (a + 4 / (a + 0.65))))) / 2.506628274631
+    lower = np.where(a < 7.07106781186547, e * numerator / denominator, tail)
+    lower = np.where(a > 37, 0., lower)
+    return np.where(x > 0, 1 - lower, lower)
+
+
+def norm_cdf(x):
+    global _ndtr
+    if _ndtr is None:
+        try:
+            from scipy.special import ndtr as _ndtr
+        except ImportError:
+            _ndtr = _numpy_ndtr
+    return _ndtr(x)
+
+
+def norm_pdf(x):
+    return ReverseSqrtOf2Pi * np.exp(-0.5 * np.square(x))
+
+
+def get_d1(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity):
+    return (np.log(underlying_price / strike_price) +
+            (risk_free_rate - dividend_yield + np.square(volatility) * 0.5) * time_to_maturity) / \
+        (volatility * np.sqrt(time_to_maturity))
+
+
+def _discount(rate, time_to_maturity, discount=None):
+    # callers holding per contract constants pass their cached discount factors
+    return np.exp(-rate * time_to_maturity) if discount is None else discount
+
+
+def bs_price(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, is_call,
+             rate_discount=None, dividend_discount=None):
+    sqrt_t = np.sqrt(time_to_maturity)
+    d1 = get_d1(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity)
+    d2 = d1 - volatility * sqrt_t
+    spot_pv = underlying_price * _discount(dividend_yield, time_to_maturity, dividend_discount)
+    strike_pv = strike_price * _discount(risk_free_rate, time_to_maturity, rate_discount)
+    # N(-x) = 1 - N(x), sign flips the call formula into the put formula
+    sign = np.where(is_call, 1.0, -1.0)
+    return sign * (spot_pv * norm_cdf(sign * d1) - strike_pv * norm_cdf(sign * d2))
+
+
+def bs_greeks(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, is_call,
+              greeks=GREEKS, rate_discount=None, dividend_discount=None):
+    """
+    :param greeks: names of GREEKS and HIGHER_GREEKS
+    :return: dict, greek name -> array, d1, d2, pdf(d1) and the discount factors are computed once for all of them
+    """
+    sqrt_t = np.sqrt(time_to_maturity)
+    d1 = get_d1(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity)
+    d2 = d1 - volatility * sqrt_t
+    pdf_d1 = norm_pdf(d1)
+    dividend_discount = _discount(dividend_yield, time_to_maturity, dividend_discount)
+    rate_discount = _discount(risk_free_rate, time_to_maturity, rate_discount)
+    sign = np.where(is_call, 1.0, -1.0)
+    cdf_d1 = norm_cdf(sign * d1)
+    cdf_d2 = norm_cdf(sign * d2)
+    vol_sqrt_t = volatility * sqrt_t
+    # the time derivative of d1, shared by charm and color
+    carry_term = (2 * (risk_free_rate - dividend_yield) * time_to_maturity - d2 * vol_sqrt_t) / \
+        (2 * time_to_maturity * vol_sqrt_t)
+
+    result = {}
+    for greek in greeks:
+        if greek == 'delta':
+            result[greek] = sign * dividend_discount * cdf_d1
+        elif greek == 'gamma':
+            result[greek] = dividend_discount * pdf_d1 / (underlying_price * volatility * sqrt_t)
+        elif greek == 'theta':
+            part_1 = 0.5 * underlying_price * volatility * dividend_discount * pdf_d1 / sqrt_t
+            part_2 = risk_free_rate * strike_price * rate_discount
+            part_3 = dividend_yield * underlying_price * dividend_discount
+            result[greek] = -part_1 - sign * part_2 * cdf_d2 + sign * part_3 * cdf_d1
+        elif greek == 'vega':
+            result[greek] = underlying_price * dividend_discount * pdf_d1 * sqrt_t
+        elif greek == 'rho':
+            result[greek] = sign * strike_price * time_to_maturity * rate_discount * cdf_d2
+        elif greek == 'vanna':
+            result[greek] = -dividend_discount * pdf_d1 * d2 / volatility
+        elif greek == 'volga':
+            result[greek] = underlying_price * dividend_discount * pdf_d1 * sqrt_t * d1 * d2 / volatility
+        elif greek == 'charm':
+            result[greek] = sign * dividend_yield * dividend_discount * cdf_d1 - \
+                dividend_discount * pdf_d1 * carry_term
+        elif greek == 'speed':
+            gamma = dividend_discount * pdf_d1 / (underlying_price * vol_sqrt_t)
+            result[greek] = -gamma / underlying_price * (d1 / vol_sqrt_t + 1)
+        elif greek == 'color':
+            result[greek] = dividend_discount * pdf_d1 / (2 * underlying_price * time_to_maturity * vol_sqrt_t) * \
+                (2 * dividend_yield * time_to_maturity + 1 + 2 * time_to_maturity * carry_term * d1)
+        else:
+            raise ValueError('greek {} is not supported'.format(greek))
+    return result
+
+
+def implied_volatility(option_price, underlying_price, strike_price, risk_free_rate, dividend_yield, time_to_maturity,
+                       is_call, lower_bound=1e-4, upper_bound=2, max_iteration=100, tol=1e-7, initial_guess=None,
+                       rate_discount=None, dividend_discount=None):
+    """
+    safeguarded newton iteration on all contracts at once: a newton step is taken when it stays inside the current
+    bracket, a bisection step otherwise. The bracket is widened like algorithm.bound_adjustment when the root is not
+    inside [lower_bound, upper_bound]. Prices outside the no arbitrage bounds give nan.
+    :param initial_guess: optional array of starting volatilities, e.g. the last solved ones
+    :param rate_discount: optional cached exp(-risk_free_rate * time_to_maturity)
+    :param dividend_discount: optional cached exp(-dividend_yield * time_to_maturity)
+    :return: numpy array of implied volatility, same shape as the broadcast inputs
+    """
+    arrays = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in
+                                   (option_price, underlying_price, strike_price, risk_free_rate, dividend_yield,
+                                    time_to_maturity)], np.asarray(is_call, dtype=bool))
+    shape = arrays[0].shape
+    price, spot, strike, rate, dividend, ttm = [x.ravel() for x in arrays[:-1]]
+    call = arrays[-1].ravel()
+    if rate_discount is not None:
+        rate_discount = np.broadcast_to(np.asarray(rate_discount, dtype=float), shape).ravel()
+    if dividend_discount is not None:
+        dividend_discount = np.broadcast_to(np.asarray(dividend_discount, dtype=float), shape).ravel()
+    if initial_guess is not None:
+        initial_guess = np.broadcast_to(np.asarray(initial_guess, dtype=float), shape).ravel()[:, None]
+    result = _solve_fields(price[:, None], spot, strike, rate, dividend, ttm, call, lower_bound, upper_bound,
+                           max_iteration, tol, initial_guess, rate_discount, dividend_discount)
+    return result.reshape(shape)
+
+
+def implied_volatility_fields(option_prices, underlying_price, strike_price, risk_free_rate, dividend_yield,
+                              time_to_maturity, is_call, lower_bound=1e-4, upper_bound=2, max_iteration=100, tol=1e-7,
+                              initial_guess=None, rate_discount=None, dividend_discount=None):
+    """
+    implied volatility of several prices of every contract, e.g. close, settlement, bid and ask, in one call.
+    The contract constants (discount factors, no arbitrage bounds, the bracket of the root) are computed once per
+    contract and shared by its price fields, only the newton iteration runs per (contract, field).
+    :param option_prices: 2D array, (contracts, price fields), nan where a field has no price
+    :param underlying_price: 1D array per contract, as strike_price, risk_free_rate, dividend_yield, time_to_maturity
+                             and is_call
+    :param initial_guess: optional starting volatilities, per contract or (contracts, price fields)
+    :return: 2D array of implied volatility, (contracts, price fields)
+    """
+    price = np.asarray(option_prices, dtype=float)
+    if price.ndim != 2:
+        raise ValueError('option_prices must be 2D (contracts, price fields), got shape {}'.format(price.shape))
+    n = price.shape[0]
+    spot, strike, rate, dividend, ttm = [np.broadcast_to(np.asarray(x, dtype=float), (n,)).ravel() for x in
+                                         (underlying_price, strike_price, risk_free_rate, dividend_yield,
+                                          time_to_maturity)]
+    call = np.broadcast_to(np.asarray(is_call, dtype=bool), (n,)).ravel()
+    if rate_discount is not None:
+        rate_discount = np.broadcast_to(np.asarray(rate_discount, dtype=float), (n,)).ravel()
+    if dividend_discount is not None:
+        dividend_discount = np.broadcast_to(np.asarray(dividend_discount, dtype=float), (n,)).ravel()
+    if initial_guess is not None:
+        initial_guess = np.asarray(initial_guess, dtype=float)
+        initial_guess = np.broadcast_to(initial_guess[:, None] if initial_guess.ndim == 1 else initial_guess,
+                                        price.shape)
+    return _solve_fields(price, spot, strike, rate, dividend, ttm, call, lower_bound, upper_bound, max_iteration, tol,
+                         initial_guess, rate_discount, dividend_discount)
+
+
+def _solve_fields(price, spot, strike, rate, dividend, ttm, call, lower_bound, upper_bound, max_iteration, tol,
+                  initial_guess, rate_discount, dividend_discount):
+    """
+    the solver of implied_volatility and implied_volatility_fields
+    :param price: 2D array (contracts, fields), every other array is 1D per contract
+    """
+    dividend_discount = np.exp(-dividend * ttm) if dividend_discount is None else dividend_discount
+    rate_discount = np.exp(-rate * ttm) if rate_discount is None else rate_discount
+    spot_pv = spot * dividend_discount
+    strike_pv = strike * rate_discount
+    intrinsic = np.where(call, np.maximum(spot_pv - strike_pv, 0), np.maximum(strike_pv - spot_pv, 0))
+    ceiling = np.where(call, spot_pv, strike_pv)
+    with np.errstate(invalid='ignore'):
+        valid = np.isfinite(price) & (ttm > 0)[:, None] & (price > intrinsic[:, None]) & (price < ceiling[:, None])
+
+    result = np.full(price.shape, np.nan)
+    contracts = np.flatnonzero(valid.any(axis=1))
+    if contracts.size == 0:
+        return result
+
+    def _price(vol, index):
+        metrics.count('solver_evaluations', index.size)
+        return bs_price(spot[index], strike[index], rate[index], dividend[index], vol, ttm[index], call[index],
+                        rate_discount[index], dividend_discount[index])
+
+    # one bracket per contract holding the roots of all its fields: price is increasing in volatility, so the upper
+    # bound has to price above the highest field and the lower bound below the lowest one
+    highest = np.where(valid, price, -np.inf)[contracts].max(axis=1)
+    lowest = np.where(valid, price, np.inf)[contracts].min(axis=1)
+    low = np.full(contracts.size, float(lower_bound))
+    high = np.full(contracts.size, float(upper_bound))
+    # a bound only moves past a field root when it is past the roots of all the fields
+    widen = np.arange(contracts.size)
+    high_price = _price(high, contracts)
+    for _ in range(64):
+        keep = high_price < highest[widen]
+        widen, high_price = widen[keep], high_price[keep]
+        if widen.size == 0:
+            break
+        below = high_price < lowest[widen]
+        low[widen[below]] = high[widen[below]]
+        high[widen] *= 2
+        high_price = _price(high[widen], contracts[widen])
+    narrow = np.arange(contracts.size)
+    low_price = _price(low, contracts)
+    for _ in range(64):
+        keep = low_price > lowest[narrow]
+        narrow, low_price = narrow[keep], low_price[keep]
+        if narrow.size == 0:
+            break
+        above = low_price > highest[narrow]
+        high[narrow[above]] = low[narrow[above]]
+        low[narrow] *= 0.5
+        low_price = _price(low[narrow], contracts[narrow])
+
+    # from here on every (contract, field) pair is solved on its own inside the bracket of its contract
+    bracket = np.full(price.shape[0], -1)
+    bracket[contracts] = np.arange(contracts.size)
+    row, column = np.nonzero(valid)
+    low, high = low[bracket[row]], high[bracket[row]]
+    target = price[row, column]
+
+    vol = 0.5 * (low + high)
+    if initial_guess is not None:
+        guess = initial_guess[row, column]
+        inside = np.isfinite(guess) & (guess > low) & (guess < high)
+        vol[inside] = guess[inside]
+
+    pair = np.arange(row.size)
+    # step before the last one, a newton step that does not halve it is crawling and is replaced by bisection
+    step_before, step = high - low, high - low
+    for _ in range(max_iteration):
+        index = row[pair]
+        f = _price(vol, index) - target[pair]
+        vega = spot_pv[index] * norm_pdf(get_d1(spot[index], strike[index], rate[index], dividend[index], vol,
+                                                ttm[index])) * np.sqrt(ttm[index])
+        above = f > 0
+        high = np.where(above, vol, high)
+        low = np.where(above, low, vol)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = vol - f / vega
+        bisect = ~np.isfinite(newton) | (newton <= low) | (newton >= high) | \
+            (np.abs(newton - vol) > 0.5 * step_before)
+        # an exact root is kept as it is, it sits on the bracket and would otherwise be bisected away
+        next_vol = np.where(f == 0, vol, np.where(bisect, 0.5 * (low + high), newton))
+
+        step_before, step = step, np.abs(next_vol - vol)
+        done = (step <= tol * (1 + vol)) | (f == 0)
+        result[row[pair[done]], column[pair[done]]] = next_vol[done]
+        keep = ~done
+        if not keep.any():
+            break
+        pair, vol, low, high = pair[keep], next_vol[keep], low[keep], high[keep]
+        step_before, step = step_before[keep], step[keep]
+    return result
+
+
+def broadcast_inputs(*args):
+    """
+    :param args: float arrays, the last one is the boolean is_call
+    :return: (broadcast shape, list of the flattened arrays)
+    """
+    arrays = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in args[:-1]], np.asarray(args[-1], dtype=bool))
+    return arrays[0].shape, [x.ravel() for x in arrays]
+
+
+def bracketed_root(function, index, lower_bound=1e-4, upper_bound=2, max_iteration=100, tol=1e-7):
+    """
+    batch root finder for the pricers without an analytic vega (american.py, lattice.py): the bracket is widened like
+    implied_volatility, then narrowed by the illinois variant of regula falsi
+    :param function: function(vol, index) -> model price - market price of the contracts index, increasing in vol
+    :param index: int array, the contracts to solve
+    :param lower_bound: float, or array aligned with index, as upper_bound
+    :return: numpy array of the roots, aligned with index, nan where no bracket was found
+    """
+    result = np.full(index.size, np.nan)
+    low = np.array(np.broadcast_to(np.asarray(lower_bound, dtype=float), index.shape))
+    high = np.array(np.broadcast_to(np.asarray(upper_bound, dtype=float), index.shape))
+    f_low, f_high = function(low, index), function(high, index)
+    for _ in range(64):
+        widen = np.flatnonzero(f_high < 0)
+        if widen.size == 0:
+            break
+        low[widen], f_low[widen] = high[widen], f_high[widen]
+        high[widen] *= 2
+        f_high[widen] = function(high[widen], index[widen])
+    for _ in range(64):
+        narrow = np.flatnonzero(f_low > 0)
+        if narrow.size == 0:
+            break
+        high[narrow], f_high[narrow] = low[narrow], f_low[narrow]
+        low[narrow] *= 0.5
+        f_low[narrow] = function(low[narrow], index[narrow])
+
+    exact = (f_low == 0) | (f_high == 0)
+    result[exact] = np.where(f_low[exact] == 0, low[exact], high[exact])
+    position = np.flatnonzero(~exact & (f_low < 0) & (f_high > 0))
+    a, f_a, b, f_b = low[position], f_low[position], high[position], f_high[position]
+    for _ in range(max_iteration):
+        if position.size == 0:
+            break
+        c = b - f_b * (b - a) / (f_b - f_a)
+        c = np.where(np.isfinite(c) & (c > np.minimum(a, b)) & (c < np.maximum(a, b)), c, 0.5 * (a + b))
+        f_c = function(c, index[position])
+        # the root stays between a and b; the end that is kept twice has its value halved (illinois)
+        crossed = np.sign(f_c) != np.sign(f_b)
+        a, f_a = np.where(crossed, b, a), np.where(crossed, f_b, 0.5 * f_a)
+        b, f_b = c, f_c
+        done = (np.abs(b - a) <= tol * (1 + b)) | (f_c == 0)
+        result[position[done]] = c[done]
+        keep = ~done
+        position, a, f_a, b, f_b = position[keep], a[keep], f_a[keep], b[keep], f_b[keep]
+    return result
+
+
+def black76_price(forward_price, strike_price, risk_free_rate, volatility, time_to_maturity, is_call, discount=None):
+    """
+    Black (1976) price of an option on a futures contract: the futures price is the forward, discounted at the risk
+    free rate, i.e. bs_price with a dividend yield equal to the rate
+    :param discount: optional cached exp(-risk_free_rate * time_to_maturity), e.g. one per underlying and expiry
+    """
+    discount = _discount(risk_free_rate, time_to_maturity, discount)
+    return bs_price(forward_price, strike_price, risk_free_rate, risk_free_rate, volatility, time_to_maturity, is_call,
+                    discount, discount)
+
+
+def black76_greeks(forward_price, strike_price, risk_free_rate, volatility, time_to_maturity, is_call, greeks=GREEKS,
+                   discount=None):
+    """
+    :return: dict, greek name -> array; delta and gamma are with respect to the futures price, rho holds the futures
+             price fixed (-time_to_maturity * price)
+    """
+    discount = _discount(risk_free_rate, time_to_maturity, discount)
+    result = bs_greeks(forward_price, strike_price, risk_free_rate, risk_free_rate, volatility, time_to_maturity,
+                       is_call, [x for x in greeks if x != 'rho'], discount, discount)
+    if 'rho' in greeks:
+        result['rho'] = -time_to_maturity * black76_price(forward_price, strike_price, risk_free_rate, volatility,
+                                                          time_to_maturity, is_call, discount)
+    return {name: result[name] for name in greeks}
+
+
+def black76_implied_volatility(option_price, forward_price, strike_price, risk_free_rate, time_to_maturity, is_call,
+                               discount=None, **kwargs):
+    """implied_volatility of Black (1976) prices, kwargs as implied_volatility"""
+    discount = _discount(risk_free_rate, time_to_maturity, discount)
+    return implied_volatility(option_price, forward_price, strike_price, risk_free_rate, risk_free_rate,
+                              time_to_maturity, is_call, rate_discount=discount, dividend_discount=discount, **kwargs)
+
+
+def group_discount(risk_free_rate, time_to_maturity, group):
+    """
+    exp(-risk_free_rate * time_to_maturity) computed once per group and shared by its rows
+    :param group: int array, group code of every row, e.g. one per (underlying, expiry); the rows of a group share
+                  their rate and time to maturity
+    :return: numpy array of discount factors, one per row
+    """
+    _, first, inverse = np.unique(np.asarray(group), return_index=True, return_inverse=True)
+    rate, ttm = np.asarray(risk_free_rate, dtype=float), np.asarray(time_to_maturity, dtype=float)
+    return np.exp(-rate[first] * ttm[first])[inverse.ravel()]
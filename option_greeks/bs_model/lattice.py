@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from .kernel import broadcast_inputs, bracketed_root, GREEKS
+from ..profiling import metrics
+"""
+    Batched binomial (Cox, Ross and Rubinstein) and trinomial (Kamrad and Ritchken) lattices, the reference pricer of
+    the american options. N contracts are priced together: the node values are an (N, nodes) array that is stepped
+    backward through time with one vectorized max(continuation, exercise) per step. Delta, gamma and theta are read
+    from the nodes of the first steps, vega and rho are central differences of lattices swept in the same batch.
+    Contracts are processed in chunks so that the node arrays stay under CHUNK_BYTES.
+    Same inputs as kernel.py, the cost of carry is risk_free_rate - dividend_yield.
+"""
+
+LATTICE_STEPS = 200
+CHUNK_BYTES = 64 << 20
+METHODS = ('binomial', 'trinomial')
+# bumps of vega and rho, wider than in american.py: a lattice price is only smooth in the inputs at the scale of its
+# discretization error
+VOL_BUMP = 1e-2
+RATE_BUMP = 1e-3
+
+
+def _min_volatility(rate, dividend, ttm, steps, method):
+    """
+    the lowest volatility whose lattice has probabilities in [0, 1]: below it the sweeps clip them and the lattice is
+    not arbitrage free, binomial needs vol sqrt(dt) >= |b| dt, trinomial vol sqrt(dt / 2) >= |b| dt / 2
+    """
+    dt = ttm / steps
+    return np.abs(rate - dividend) * np.sqrt(dt if method == 'binomial' else 0.5 * dt)
+
+
+def _chunks(size, nodes):
+    # the node prices, the exercise values, the node values and two buffers are alive during a sweep
+    rows = max(1, CHUNK_BYTES // (5 * 8 * nodes))
+    return [slice(start, min(start + rows, size)) for start in range(0, size, rows)]
+
+
+def _grid(spot, up, steps):
+    """
+    the prices of every level of the lattice, row i is spot * up^(steps - i), shape (2 steps + 1, contracts): the
+    arrays are node major, so the nodes of a step are a contiguous block of rows
+    """
+    return spot * np.power(up, (steps - np.arange(2 * steps + 1))[:, None])
+
+
+def _node_greeks(values, prices):
+    """delta and gamma from the values and the prices of three nodes, highest first"""
+    delta = (values[0] - values[2]) / (prices[0] - prices[2])
+    gamma = ((values[0] - values[1]) / (prices[0] - prices[1]) - (values[1] - values[2]) / (prices[1] - prices[2])) / \
+        (0.5 * (prices[0] - prices[2]))
+    return delta, gamma
+
+
+def _binomial(spot, strike, rate, dividend, vol, ttm, sign, steps, american):
+    """
+    :return: (value, delta, gamma, theta) of every contract, 1D arrays
+    """
+    dt = ttm / steps
+    up = np.exp(vol * np.sqrt(dt))
+    # a volatility too low for the drift would give a probability outside [0, 1]
+    p = np.clip((np.exp((rate - dividend) * dt) - 1 / up) / (up - 1 / up), 0, 1)
+    q = 1 - p
+    discount = np.exp(-rate * dt)
+    with np.errstate(over='ignore', invalid='ignore'):
+        # node j of step k is on level steps - k + 2j of the grid
+        grid = _grid(spot, up, steps)
+        exercise = sign * (grid - strike)
+        value = np.maximum(exercise[::2], 0)
+        buffer = np.empty_like(value)
+        kept = {}
+        # value is updated in place, step k only uses its first k + 1 rows
+        for step in range(steps - 1, -1, -1):
+            current, temp = value[:step + 1], buffer[:step + 1]
+            np.multiply(value[1:step + 2], q, out=temp)
+            current *= p
+            current += temp
+            current *= discount
+            if american:
+                np.maximum(current, exercise[steps - step:steps + step + 1:2], out=current)
+            if step <= 2:
+                kept[step] = current.copy()
+        _, gamma = _node_greeks(kept[2], grid[steps - 2:steps + 3:2])
+        delta = (kept[1][0] - kept[1][1]) / (grid[steps - 1] - grid[steps + 1])
+        # the middle node two steps ahead has the price of today
+        theta = (kept[2][1] - value[0]) / (2 * dt)
+    return value[0].copy(), delta, gamma, theta
+
+
+def _trinomial(spot, strike, rate, dividend, vol, ttm, sign, steps, american):
+    """
+    :return: (value, delta, gamma, theta) of every contract, 1D arrays
+    """
+    dt = ttm / steps
+    half = np.exp(vol * np.sqrt(0.5 * dt))
+    drift = np.exp(0.5 * (rate - dividend) * dt)
+    # a volatility too low for the drift would give probabilities outside [0, 1]
+    p_up = np.clip(np.square((drift - 1 / half) / (half - 1 / half)), 0, 1)
+    p_down = np.clip(np.square((half - drift) / (half - 1 / half)), 0, 1 - p_up)
+    p_middle = 1 - p_up - p_down
+    discount = np.exp(-rate * dt)
+    with np.errstate(over='ignore', invalid='ignore'):
+        # node j of step k is on level steps - k + j of the grid, up = exp(vol sqrt(2 dt))
+        grid = _grid(spot, np.square(half), steps)
+        exercise = sign * (grid - strike)
+        value = np.maximum(exercise, 0)
+        buffer, down_buffer = np.empty_like(value), np.empty_like(value)
+        kept = None
+        # value is updated in place, step k only uses the rows steps - k .. steps + k
+        for step in range(steps - 1, -1, -1):
+            nodes = slice(steps - step, steps + step + 1)
+            current, temp, down_temp = value[nodes], buffer[nodes], down_buffer[nodes]
+            # both neighbours are read before the nodes are overwritten
+            np.multiply(value[steps - step - 1:steps + step], p_up, out=temp)
+            np.multiply(value[steps - step + 1:steps + step + 2], p_down, out=down_temp)
+            current *= p_middle
+            current += temp
+            current += down_temp
+            current *= discount
+            if american:
+                np.maximum(current, exercise[nodes], out=current)
+            if step == 1:
+                kept = current.copy()
+        delta, gamma = _node_greeks(kept, grid[steps - 1:steps + 2])
+        theta = (kept[1] - value[steps]) / dt
+    return value[steps].copy(), delta, gamma, theta
+
+
+def _sweep(spot, strike, rate, dividend, vol, ttm, call, steps, method, american):
+    """the lattice of every contract, chunk by chunk; contracts without time value are priced at their payoff"""
+    if method not in METHODS:
+        raise ValueError('method {} is not supported, use one of {}'.format(method, METHODS))
+    sweep = _binomial if method == 'binomial' else _trinomial
+    sign = np.where(call, 1.0, -1.0)
+    result = [np.full(spot.shape, np.nan) for _ in range(4)]
+    alive = np.flatnonzero((ttm > 0) & (vol > 0))
+    expired = ttm <= 0
+    result[0][expired] = np.maximum(sign[expired] * (spot[expired] - strike[expired]), 0)
+    nodes = steps + 1 if method == 'binomial' else 2 * steps + 1
+    for chunk in _chunks(alive.size, nodes):
+        index = alive[chunk]
+        metrics.count('lattice_contracts', index.size)
+        values = sweep(spot[index], strike[index], rate[index], dividend[index], vol[index], ttm[index], sign[index],
+                       steps, american)
+        for target, value in zip(result, values):
+            target[index] = value
+    return result
+
+
+def lattice_price(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, is_call,
+                  steps=LATTICE_STEPS, method='binomial', american=True):
+    """
+    :param steps: time steps of the lattice
+    :param method: 'binomial' or 'trinomial'
+    :param american: early exercise at every node, False gives the european price of the same lattice
+    :return: numpy array of option prices, same shape as the broadcast inputs
+    """
+    shape, arrays = broadcast_inputs(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility,
+                                     time_to_maturity, is_call)
+    with metrics.stage('lattice'):
+        return _sweep(*arrays, steps, method, american)[0].reshape(shape)
+
+
+def lattice_greeks(underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity,
+                   is_call, greeks=GREEKS, steps=LATTICE_STEPS, method='binomial', american=True, futures=False):
+    """
+    :param futures: boolean (array), the underlying is a futures contract priced with a dividend yield equal to the
+                    rate, its rho moves both so that the carry stays 0, as american.baw_greeks
+    :return: dict, greek name -> array, the same greeks as kernel.bs_greeks; delta, gamma and theta from the nodes,
+             vega and rho from the lattices of the bumped inputs, swept in one batch
+    """
+    shape, (spot, strike, rate, dividend, vol, ttm, call) = broadcast_inputs(
+        underlying_price, strike_price, risk_free_rate, dividend_yield, volatility, time_to_maturity, is_call)
+    unknown = set(greeks) - set(GREEKS)
+    if unknown:
+        raise ValueError('greek {} is not supported'.format(sorted(unknown)[0]))
+    result = {}
+    with metrics.stage('lattice'):
+        if {'delta', 'gamma', 'theta'} & set(greeks):
+            _, result['delta'], result['gamma'], result['theta'] = _sweep(spot, strike, rate, dividend, vol, ttm,
+                                                                          call, steps, method, american)
+        bumps = [x for x in ('vega', 'rho') if x in greeks]
+        if bumps:
+            vol_down = np.maximum(vol - VOL_BUMP, 0.5 * vol)
+            dividend_bump = RATE_BUMP * np.broadcast_to(np.asarray(futures, dtype=float), shape).ravel()
+            up = {'vega': (rate, dividend, vol + VOL_BUMP), 'rho': (rate + RATE_BUMP, dividend + dividend_bump, vol)}
+            down = {'vega': (rate, dividend, vol_down), 'rho': (rate - RATE_BUMP, dividend - dividend_bump, vol)}
+            stacked = [np.concatenate([x[i] for name in bumps for x in (up[name], down[name])]) for i in range(3)]
+            copies = 2 * len(bumps)
+            prices = _sweep(np.tile(spot, copies), np.tile(strike, copies), stacked[0], stacked[1], stacked[2],
+                            np.tile(ttm, copies), np.tile(call, copies), steps, method,
+                            american)[0].reshape(copies, -1)
+            for i, name in enumerate(bumps):
+                width = vol + VOL_BUMP - vol_down if name == 'vega' else 2 * RATE_BUMP
+                result[name] = (prices[2 * i] - prices[2 * i + 1]) / width
+    return {name: result[name].reshape(shape) for name in greeks}
+
+
+def implied_volatility(option_price, underlying_price, strike_price, risk_free_rate, dividend_yield, time_to_maturity,
+                       is_call, steps=LATTICE_STEPS, method='binomial', american=True, lower_bound=1e-4,
+                       upper_bound=2, max_iteration=100, tol=1e-7):
+    """
+    implied volatility of the lattice prices with kernel.bracketed_root, every evaluation is one batched sweep of the
+    contracts still unsolved. Prices outside the no arbitrage bounds give nan: above the discounted forward intrinsic
+    value, and the intrinsic value with american. The bracket starts at the lowest volatility of an arbitrage free
+    lattice (see _min_volatility), a contract whose bracket has to go below it gives nan as well.
+    :return: numpy array of implied volatility, same shape as the broadcast inputs
+    """
+    shape, (price, spot, strike, rate, dividend, ttm, call) = broadcast_inputs(
+        option_price, underlying_price, strike_price, risk_free_rate, dividend_yield, time_to_maturity, is_call)
+    spot_pv, strike_pv = spot * np.exp(-dividend * ttm), strike * np.exp(-rate * ttm)
+    floor = np.where(call, np.maximum(spot_pv - strike_pv, 0), np.maximum(strike_pv - spot_pv, 0))
+    if american:
+        floor = np.maximum(floor, np.where(call, np.maximum(spot - strike, 0), np.maximum(strike - spot, 0)))
+    ceiling = np.where(call, spot, strike)
+    valid = np.isfinite(price) & (ttm > 0) & (price > floor) & (price < ceiling)
+    result = np.full(price.shape, np.nan)
+    active = np.flatnonzero(valid)
+    if active.size == 0:
+        return result.reshape(shape)
+    min_vol = _min_volatility(rate, dividend, ttm, steps, method)
+    degenerate = np.zeros(price.shape, dtype=bool)
+
+    def _target(vol, index):
+        metrics.count('solver_evaluations', index.size)
+        degenerate[index[vol < min_vol[index]]] = True
+        return _sweep(spot[index], strike[index], rate[index], dividend[index], vol, ttm[index], call[index], steps,
+                      method, american)[0] - price[index]
+
+    # the lower end of the bracket is a lattice with probabilities in [0, 1]
+    lower = np.maximum(lower_bound, min_vol[active] * (1 + 1e-9))
+    with metrics.stage('lattice'):
+        result[active] = bracketed_root(_target, active, lower, np.maximum(upper_bound, 2 * lower), max_iteration,
+                                        tol)
+    result[degenerate] = np.nan
+    return result.reshape(shape)
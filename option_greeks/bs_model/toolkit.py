@@ -23,11 +23,9 @@ def cal_risk_free_for_underlying_id(underlying_id, _data, distinct_price, strike
     option_data = construct_option_data(time_to_maturity, strike_price, status, option_type)
 
     this_time2mature = option_data['time_to_maturity']
-    unique_time = this_time2mature.unique().tolist()
     forward_risk_free = pd.Series(index=status.index.tolist())
 
-    for cur_time2mature in unique_time:
-        selected_option = select_option(option_data, cur_time2mature)
+    for cur_time2mature, selected_option in select_forward_options(option_data).items():
         tmp_rf = calc_implied_forward_and_risk_free(selected_option, option_price,
                                                     strike_price, underlying_price, cur_time2mature)
         cur_contract = this_time2mature[this_time2mature == cur_time2mature].index.tolist()
@@ -36,6 +34,21 @@ def cal_risk_free_for_underlying_id(underlying_id, _data, distinct_price, strike
     return forward_risk_free
 
 
+def select_forward_options(option_data, maturities=None):
+    """
+    the put call pairs around ATM that give the implied forward of every maturity, chosen from strikes, types and
+    status only, so no option price is needed yet
+    :param option_data: as returned by construct_option_data for one underlying
+    :param maturities: times to maturity to select for, default every maturity of option_data
+    :return: dict, time to maturity -> {call option id: put option id} (see select_option)
+    """
+    unique_time = option_data['time_to_maturity'].unique().tolist()
+    if maturities is not None:
+        maturities = set(maturities)
+        unique_time = [x for x in unique_time if x in maturities]
+    return {x: select_option(option_data, x) for x in unique_time}
+
+
 class StatusArgument:
     def __init__(self, points, values, precision=0):
         assert len(values) == len(points) + 1, "values length must be 1 more than points"
@@ -1,17 +1,34 @@
+import threading
 import numpy as np
 from pandas.core.generic import NDFrame
-from scipy.stats import norm
 
 _x_length = 2**23 - 1
-_x_array = np.geomspace(1e-12, 5, _x_length)
-_cdf_table_array = np.concatenate((-_x_array[::-1], np.array([0]),  _x_array,  np.array([np.inf])))
-cdf_table_array = norm.cdf(_cdf_table_array)
+# the 2**24 entries table takes a while to build, it is only built on the first check_cdf call
+_cdf_table = None
+# the fetch and shard threads may ask for the table together, only one of them builds it
+_cdf_table_lock = threading.Lock()
+
+
+def get_cdf_table():
+    """
+    :return: (_cdf_table_array, cdf_table_array), the sorted grid and the normal cdf on it
+    """
+    global _cdf_table
+    if _cdf_table is None:
+        with _cdf_table_lock:
+            if _cdf_table is None:
+                from scipy.stats import norm
+                _x_array = np.geomspace(1e-12, 5, _x_length)
+                _cdf_table_array = np.concatenate((-_x_array[::-1], np.array([0]),  _x_array,  np.array([np.inf])))
+                _cdf_table = _cdf_table_array, norm.cdf(_cdf_table_array)
+    return _cdf_table
 
 
 def check_cdf(x):
     if np.isnan(x):
         return np.nan
     if isinstance(x, float) or isinstance(x, np.ndarray):
+        _cdf_table_array, cdf_table_array = get_cdf_table()
         return cdf_table_array[_cdf_table_array.searchsorted(x)]
     if isinstance(x, NDFrame):
         return x.apply(check_cdf)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import pickle
+import hashlib
+import pandas as pd
+from .profiling import metrics
+"""
+    Memoization of the per date results across runs.
+    The key of a date is a sha256 of its inputs: the instrument set with strike, expiry and type, the option and
+    underlying closes, the rate and the model flags. Results are pickled in a local directory and the least recently
+    used ones are evicted beyond max_bytes. The key written to every collection and date is remembered as well, so an
+    unchanged date is neither recomputed nor written again, and only revised dates are.
+"""
+
+# bump when the model changes, so results of older code are not reused
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'option_greeks')
+
+
+def hash_inputs(market_data, rf_series, **flags):
+    """
+    :param market_data: computation.MarketData of the date
+    :param rf_series: the rate series the greeks are calculated with
+    :param flags: model flags, e.g. implied_price=True, dtype='float64'
+    :return: hex digest
+    """
+    ids = pd.Index(sorted(market_data.id_list), name='order_book_id')
+    inputs = pd.DataFrame({
+        'option_price': market_data.option_price.reindex(ids),
+        'udp_series': market_data.udp_series.reindex(ids),
+        'sp_series': market_data.sp_series.reindex(ids),
+        'ttm_series': market_data.ttm_series.reindex(ids),
+        'dd_series': market_data.dd_series.reindex(ids),
+        'rf_series': pd.Series(rf_series).reindex(ids),
+        'type_series': market_data.type_series.reindex(ids).astype(str),
+    }, index=ids)
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(inputs, index=True).values.tobytes())
+    digest.update(pd.util.hash_pandas_object(market_data.distinct_price.sort_index(), index=True).values.tobytes())
+    digest.update(json.dumps(dict(flags, date=market_data.date, version=CACHE_VERSION), sort_keys=True,
+                             default=str).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    :param directory: local directory of the cache, created if missing
+    :param max_bytes: size limit of the cached results, least recently used ones are removed beyond it
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._written = os.path.join(directory, '_written')
+        os.makedirs(self._written, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key):
+        """:return: the cached data frame, None on a miss"""
+        path = self._path(key)
+        try:
+            result = pd.read_pickle(path)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            # missing or corrupt, the result is recomputed and overwritten
+            metrics.count('cache_misses')
+            return None
+        # reading counts as a use for the eviction order
+        os.utime(path)
+        metrics.count('cache_hits')
+        return result
+
+    def put(self, key, result):
+        if result is None:
+            return
+        path = self._path(key)
+        atomic_write(path, lambda tmp_path: result.to_pickle(tmp_path))
+        self.evict()
+
+    def evict(self):
+        """remove the least recently used results until the cache fits in max_bytes"""
+        entries = [x for x in os.scandir(self.directory) if x.is_file() and x.name.endswith('.pkl')]
+        stats = [(x.stat().st_mtime, x.stat().st_size, x.path) for x in entries]
+        total = sum(x[1] for x in stats)
+        for _, size, path in sorted(stats):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            metrics.count('cache_evictions')
+
+    def _written_path(self, target, _date):
+        return os.path.join(self._written, '{}_{}'.format(target, pd.Timestamp(_date).strftime('%Y%m%d')))
+
+    def is_written(self, target, _date, key):
+        """True if the result of key is what was last written to target (e.g. 'db.collection') for _date"""
+        try:
+            with open(self._written_path(target, _date)) as f:
+                return f.read().strip() == key
+        except OSError:
+            return False
+
+    def mark_written(self, target, _date, key):
+        atomic_write(self._written_path(target, _date), lambda tmp_path: _write_text(tmp_path, key))
+
+    def clear(self):
+        for directory in (self.directory, self._written):
+            for entry in os.scandir(directory):
+                if entry.is_file():
+                    os.remove(entry.path)
+
+
+def _write_text(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def atomic_write(path, write):
+    """
+    :param write: function(tmp_path) writing the file, it is moved to path only once complete, so readers never see a
+                  partial file
+    """
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
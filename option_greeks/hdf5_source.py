@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+import warnings
+import numpy as np
+import pandas as pd
+from .lazy import lazy_import
+from .profiling import metrics
+"""
+    Local HDF5 daybar archives as a price source.
+    An archive holds one dataset per order_book_id (as read by update_nan.read_hd5), each row a daybar sorted by date,
+    either a compound dataset with named fields or a 2D array whose field names are in attrs['columns'].
+    The date column of every dataset is kept as an index inside the file (group _date_index, see build_date_index), so a
+    row is found with np.searchsorted and only that row, or that window of rows, is read. Contiguous uncompressed
+    datasets are memory-mapped instead of being read through h5py.
+    HDF5PriceSource has the get_option_price_each_day / get_underlying_price / get_window_close interface of computation,
+    so it can be passed as price_source to get_market_data, get_greeks and the panel functions.
+"""
+h5py = lazy_import('h5py')
+
+INDEX_GROUP = '_date_index'
+
+
+def to_date_key(_date):
+    """datetime / date / Timestamp / 'YYYY-MM-DD' / YYYYMMDD -> int YYYYMMDD"""
+    if isinstance(_date, (int, np.integer)):
+        return int(_date)
+    _date = pd.Timestamp(_date)
+    return _date.year * 10000 + _date.month * 100 + _date.day
+
+
+def from_date_key(keys):
+    return pd.to_datetime(np.asarray(keys).astype(str), format='%Y%m%d')
+
+
+def _column_names(dataset):
+    if dataset.dtype.names is not None:
+        return list(dataset.dtype.names)
+    columns = dataset.attrs.get('columns')
+    if columns is None:
+        raise ValueError('{} has neither named fields nor a columns attribute'.format(dataset.name))
+    return [x.decode() if isinstance(x, bytes) else str(x) for x in columns]
+
+
+def _read_dates(dataset, date_field='date', chunk_rows=1 << 16):
+    """the date column of a dataset as int YYYYMMDD, read chunk by chunk"""
+    names = _column_names(dataset)
+    position = names.index(date_field)
+    parts = []
+    for start in range(0, dataset.shape[0], chunk_rows):
+        block = dataset[start:start + chunk_rows]
+        parts.append(block[date_field] if dataset.dtype.names is not None else block[:, position])
+    dates = np.concatenate(parts) if parts else np.array([], dtype=np.int64)
+    if dates.dtype.kind in 'SUO':
+        dates = np.char.replace(np.char.replace(dates.astype(str), '-', ''), '/', '')
+    return dates.astype(np.int64)
+
+
+def build_date_index(filename, date_field='date', overwrite=False):
+    """
+    write the date column of every dataset to /_date_index/<name> of the file, once per archive update
+    :return: number of datasets indexed
+    """
+    count = 0
+    with h5py.File(filename, 'r+') as f:
+        group = f.require_group(INDEX_GROUP)
+        for name, dataset in f.items():
+            if name == INDEX_GROUP or not isinstance(dataset, h5py.Dataset):
+                continue
+            if name in group:
+                if not overwrite:
+                    continue
+                del group[name]
+            dates = _read_dates(dataset, date_field)
+            if (np.diff(dates) < 0).any():
+                warnings.warn('{} is not sorted by date, rows are looked up in date order'.format(name))
+            group.create_dataset(name, data=dates)
+            count += 1
+    return count
+
+
+class HDF5PriceSource:
+    """
+    :param filename: hdf5 archive of the options
+    :param underlying_filename: hdf5 archive of the underlyings, default the same file
+    :param close_field: price field read as close
+    :param date_field: date field of the rows, int YYYYMMDD (or a YYYYMMDD / YYYY-MM-DD string)
+    :param mmap: memory-map contiguous uncompressed datasets
+    """
+    def __init__(self, filename, underlying_filename=None, close_field='close', date_field='date', mmap=True):
+        self.close_field = close_field
+        self.date_field = date_field
+        self.mmap = mmap
+        self._files = {}
+        self._filenames = [filename] if underlying_filename in (None, filename) else [filename, underlying_filename]
+        self._dates = {}
+        self._order = {}
+        self._arrays = {}
+
+    def _file(self, filename):
+        if filename not in self._files:
+            self._files[filename] = h5py.File(filename, 'r')
+        return self._files[filename]
+
+    def _locate(self, _id):
+        """the archive holding the dataset of _id, None if no archive has it"""
+        for filename in self._filenames:
+            if str(_id) in self._file(filename):
+                return filename
+        return None
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        self._arrays.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _date_index(self, filename, name):
+        """(sorted dates, row of every sorted date) of dataset name, from the in-file index when there is one"""
+        key = (filename, name)
+        if key not in self._dates:
+            f = self._file(filename)
+            if INDEX_GROUP in f and name in f[INDEX_GROUP]:
+                dates = f[INDEX_GROUP][name][()]
+            else:
+                dates = _read_dates(f[name], self.date_field)
+            order = None if (np.diff(dates) >= 0).all() else np.argsort(dates, kind='stable')
+            self._dates[key] = dates if order is None else dates[order]
+            self._order[key] = order
+        return self._dates[key], self._order[key]
+
+    def _close_column(self, filename, name):
+        """the close column of dataset name: a memmap for contiguous datasets, else the h5py dataset and position"""
+        key = (filename, name)
+        if key not in self._arrays:
+            dataset = self._file(filename)[name]
+            array = dataset
+            offset = dataset.id.get_offset() if self.mmap and dataset.chunks is None and \
+                dataset.compression is None else None
+            if offset is not None:
+                array = np.memmap(filename, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape)
+            if dataset.dtype.names is not None:
+                self._arrays[key] = (array, self.close_field)
+            else:
+                self._arrays[key] = (array, _column_names(dataset).index(self.close_field))
+        return self._arrays[key]
+
+    def _read_rows(self, filename, name, rows):
+        array, column = self._close_column(filename, name)
+        if isinstance(column, str):
+            return np.asarray(array[rows][column], dtype=float)
+        return np.asarray(array[rows, column], dtype=float)
+
+    def get_close(self, ids, _date):
+        """
+        :return: pandas Series, index = ids found on _date, value = close
+        """
+        key = to_date_key(_date)
+        found, values = [], []
+        with metrics.stage('hdf5_read'):
+            for _id in ids:
+                filename = self._locate(_id)
+                if filename is None:
+                    continue
+                dates, order = self._date_index(filename, str(_id))
+                i = np.searchsorted(dates, key)
+                if i >= len(dates) or dates[i] != key:
+                    continue
+                row = int(i if order is None else order[i])
+                found.append(_id)
+                values.append(self._read_rows(filename, str(_id), slice(row, row + 1))[0])
+        metrics.count('hdf5_rows', len(found))
+        return pd.Series(values, index=found, dtype=float, name='close')
+
+    def get_window_close(self, ids, start_date, end_date):
+        """
+        :return: close prices of ids between start_date and end_date, index = date, columns = ids, like
+                 computation.get_window_close; every dataset is read as one contiguous slice of rows
+        """
+        start, end = to_date_key(start_date), to_date_key(end_date)
+        columns = {}
+        with metrics.stage('hdf5_read'):
+            for _id in ids:
+                filename = self._locate(_id)
+                if filename is None:
+                    continue
+                dates, order = self._date_index(filename, str(_id))
+                lo, hi = np.searchsorted(dates, start), np.searchsorted(dates, end, side='right')
+                if lo == hi:
+                    continue
+                if order is None:
+                    values = self._read_rows(filename, str(_id), slice(lo, hi))
+                else:
+                    rows = order[lo:hi]
+                    values = self._read_rows(filename, str(_id), slice(rows.min(), rows.max() + 1))[
+                        rows - rows.min()]
+                columns[_id] = pd.Series(values, index=from_date_key(dates[lo:hi]))
+        metrics.count('hdf5_rows', sum(len(x) for x in columns.values()))
+        if not columns:
+            return pd.DataFrame(columns=ids)
+        return pd.DataFrame(columns).reindex(columns=[x for x in ids if x in columns])
+
+    def iter_close(self, chunk_rows=1 << 16):
+        """
+        iterate over every dataset of the archives in blocks of chunk_rows rows, memory stays bounded by one block
+        :return: generator of (order_book_id, dates of the block as int YYYYMMDD, closes of the block)
+        """
+        for filename in self._filenames:
+            yield from self._iter_file(filename, chunk_rows)
+
+    def _iter_file(self, filename, chunk_rows):
+        f = self._file(filename)
+        for name in f:
+            if name == INDEX_GROUP or not isinstance(f[name], h5py.Dataset):
+                continue
+            length = f[name].shape[0]
+            for start in range(0, length, chunk_rows):
+                rows = slice(start, min(start + chunk_rows, length))
+                array, column = self._close_column(filename, name)
+                block = array[rows]
+                if isinstance(column, str):
+                    yield name, np.asarray(block[self.date_field]), np.asarray(block[column], dtype=float)
+                else:
+                    position = _column_names(f[name]).index(self.date_field)
+                    yield name, np.asarray(block[:, position]), np.asarray(block[:, column], dtype=float)
+
+    # same interface as computation.get_option_price_each_day and computation.get_underlying_price
+
+    def get_option_price_each_day(self, _date, all_ids_) -> pd.Series:
+        from .bs_model.computation import check_if_missing_items
+        price_ = self.get_close(all_ids_, _date).rename('option_price')
+        check_if_missing_items(price_.index.tolist(), all_ids_, 'Option price data missing')
+        return price_
+
+    def get_underlying_price(self, _partial, _date) -> (pd.Series, pd.Series):
+        from .bs_model.computation import check_if_missing_items
+        under_id_list = _partial['underlying_order_book_id']
+        distinct_id = under_id_list.drop_duplicates()
+        distinct_price = self.get_close(distinct_id.tolist(), _date)
+        if distinct_price.empty:
+            raise ValueError("{} is not a trading date".format(_date))
+        check_if_missing_items(distinct_price.index.tolist(), distinct_id,
+                               'Underlying price missing in date {}'.format(_date))
+        udp_series = pd.Series(under_id_list.map(distinct_price).values, index=_partial['order_book_id'].tolist(),
+                               name='udp_series').dropna()
+        return udp_series, distinct_price
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+from .bs_model.kernel import bs_price, bs_greeks, get_d1
+from .profiling import metrics
+"""
+    Incremental greek updates when only the underlying moves and the option quotes are stale.
+    Starting from stored greeks (the anchor), prices, delta and gamma are moved with a Taylor expansion in spot,
+    time and an optional volatility shift instead of solving iv and every greek again:
+        price ~ price_0 + delta_0 * dS + 0.5 * gamma_0 * dS^2 + theta_0 * dt + vega_0 * dvol
+        delta ~ delta_0 + gamma_0 * dS
+        gamma ~ gamma_0 + speed_0 * dS
+    The neglected third order price term |speed_0 * dS^3 / 6|, measured from the anchor, is kept as the accumulated
+    error estimate of every contract. Once the relative spot move, the elapsed time or the error estimate of a contract
+    crosses its threshold, that contract is repriced exactly with its anchor iv (sticky strike) and becomes the new
+    anchor.
+"""
+
+
+class IncrementalGreeks:
+    """
+    :param market_data: computation.MarketData of the anchor date
+    :param rf_series: risk free rate series, index = order_book_id
+    :param greeks_frame: stored iv / delta / gamma / theta / vega, index = order_book_id (or (order_book_id, date) as
+                         written by computation); contracts without an iv are left nan
+    :param spot_threshold: relative spot move from the anchor that triggers an exact recompute
+    :param time_threshold: elapsed time from the anchor (years) that triggers an exact recompute
+    :param error_threshold: error estimate, relative to the price, that triggers an exact recompute
+    """
+    def __init__(self, market_data, rf_series, greeks_frame, spot_threshold=0.01, time_threshold=1 / 365 / 24,
+                 error_threshold=1e-3):
+        ids = pd.Index(market_data.id_list)
+        if isinstance(greeks_frame.index, pd.MultiIndex):
+            greeks_frame = greeks_frame.reset_index(level=list(range(1, greeks_frame.index.nlevels)), drop=True)
+        greeks_frame = greeks_frame.reindex(ids)
+
+        self.order_book_id = ids.values
+        self.spot_threshold = spot_threshold
+        self.time_threshold = time_threshold
+        self.error_threshold = error_threshold
+
+        self.strike = market_data.sp_series.reindex(ids).values.astype(float)
+        self.ttm = market_data.ttm_series.reindex(ids).values.astype(float)
+        self.rate = pd.Series(rf_series).reindex(ids).values.astype(float)
+        self.dividend = market_data.dd_series.reindex(ids).values.astype(float)
+        self.is_call = (market_data.type_series.reindex(ids) == 'C').values
+        self.iv = greeks_frame['iv'].values.astype(float)
+
+        underlying = market_data.info.set_index('order_book_id')['underlying_order_book_id'].reindex(ids)
+        self._underlying_code, self.underlying_ids = pd.factorize(underlying)
+        self._underlying_position = pd.Series(np.arange(len(self.underlying_ids)), index=self.underlying_ids)
+        self.spot = market_data.distinct_price.reindex(self.underlying_ids).values.astype(float)
+        self.vol_shift = np.zeros(len(self.underlying_ids))
+        self.elapsed = 0.0
+
+        n = len(ids)
+        self.anchor_spot = self.spot[self._underlying_code].copy()
+        self.anchor_time = np.zeros(n)
+        self.anchor_shift = np.zeros(n)
+        self.anchor_price = bs_price(self.anchor_spot, self.strike, self.rate, self.dividend, self.iv, self.ttm,
+                                     self.is_call)
+        self.anchor = {greek: greeks_frame[greek].values.astype(float) for greek in ('delta', 'gamma', 'theta', 'vega')}
+        self.anchor['speed'] = self._speed(self.anchor_spot, self.ttm, self.anchor['gamma'])
+
+        self.price = self.anchor_price.copy()
+        self.delta = self.anchor['delta'].copy()
+        self.gamma = self.anchor['gamma'].copy()
+        self.error = np.zeros(n)
+
+    def _speed(self, spot, ttm, gamma, position=slice(None)):
+        d1 = get_d1(spot, self.strike[position], self.rate[position], self.dividend[position], self.iv[position], ttm)
+        return -gamma / spot * (1 + d1 / (self.iv[position] * np.sqrt(ttm)))
+
+    def _set(self, target, values):
+        values = pd.Series(values, dtype=float)
+        position = self._underlying_position.reindex(values.index).values
+        known = ~np.isnan(position)
+        target[position[known].astype(int)] = values.values[known]
+        return position[known].astype(int)
+
+    def update(self, underlying_price=None, elapsed=None, vol_shift=None):
+        """
+        :param underlying_price: dict or Series, underlying id -> latest price
+        :param elapsed: time since the anchor date in years, default unchanged
+        :param vol_shift: dict or Series, underlying id -> parallel shift of iv from the stored one, default unchanged
+        :return: DataFrame of the affected contracts: price, delta, gamma, error, exact
+        """
+        moved = []
+        if underlying_price is not None:
+            moved.append(self._set(self.spot, underlying_price))
+        if vol_shift is not None:
+            moved.append(self._set(self.vol_shift, vol_shift))
+        if elapsed is not None:
+            self.elapsed = float(elapsed)
+            affected = np.arange(len(self.order_book_id))
+        else:
+            affected = np.flatnonzero(np.isin(self._underlying_code, np.concatenate(moved or [[]])))
+        return self._update(affected)
+
+    def _update(self, position):
+        spot = self.spot[self._underlying_code[position]]
+        d_spot = spot - self.anchor_spot[position]
+        d_time = self.elapsed - self.anchor_time[position]
+        d_vol = self.vol_shift[self._underlying_code[position]] - self.anchor_shift[position]
+        anchor = {greek: value[position] for greek, value in self.anchor.items()}
+
+        price = self.anchor_price[position] + anchor['delta'] * d_spot + 0.5 * anchor['gamma'] * d_spot ** 2 + \
+            anchor['theta'] * d_time + anchor['vega'] * d_vol
+        error = np.abs(anchor['speed'] * d_spot ** 3 / 6)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            exact = (np.abs(d_spot) > self.spot_threshold * self.anchor_spot[position]) | \
+                    (d_time > self.time_threshold) | (error > self.error_threshold * np.abs(price))
+        approx = position[~exact]
+        self.price[approx] = price[~exact]
+        self.delta[approx] = anchor['delta'][~exact] + anchor['gamma'][~exact] * d_spot[~exact]
+        self.gamma[approx] = anchor['gamma'][~exact] + anchor['speed'][~exact] * d_spot[~exact]
+        self.error[approx] = error[~exact]
+        if exact.any():
+            self.recompute(position[exact])
+
+        return pd.DataFrame({'price': self.price[position], 'delta': self.delta[position],
+                             'gamma': self.gamma[position], 'error': self.error[position], 'exact': exact},
+                            index=pd.Index(self.order_book_id[position], name='order_book_id'))
+
+    def recompute(self, position=None):
+        """reprice exactly at the current spot, time and vol shift with the anchor iv, and move the anchor there"""
+        position = np.arange(len(self.order_book_id)) if position is None else np.asarray(position)
+        metrics.count('exact_recomputes', position.size)
+        spot = self.spot[self._underlying_code[position]]
+        shift = self.vol_shift[self._underlying_code[position]]
+        self.iv[position] += shift - self.anchor_shift[position]
+        self.anchor_shift[position] = shift
+        ttm = np.maximum(self.ttm[position] - self.elapsed, 1e-8)
+        args = (spot, self.strike[position], self.rate[position], self.dividend[position], self.iv[position], ttm,
+                self.is_call[position])
+        values = bs_greeks(*args, greeks=('delta', 'gamma', 'theta', 'vega'))
+        values['speed'] = self._speed(spot, ttm, values['gamma'], position)
+
+        self.anchor_spot[position] = spot
+        self.anchor_time[position] = self.elapsed
+        self.anchor_price[position] = bs_price(*args)
+        for greek, value in values.items():
+            self.anchor[greek][position] = value
+        self.price[position] = self.anchor_price[position]
+        self.delta[position] = values['delta']
+        self.gamma[position] = values['gamma']
+        self.error[position] = 0
+
+    def snapshot(self):
+        return pd.DataFrame({'price': self.price, 'delta': self.delta, 'gamma': self.gamma, 'error': self.error},
+                            index=pd.Index(self.order_book_id, name='order_book_id'))
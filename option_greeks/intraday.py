@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import datetime as dt
+import numpy as np
+import pandas as pd
+from .bs_model.kernel import implied_volatility, bs_greeks, GREEKS
+from .profiling import metrics
+from .lazy import lazy_import
+"""
+    Intraday history of implied volatility and greeks from minute bars.
+    For every trading day the minute closes of the options and their underlyings are aligned into 2D arrays of shape
+    (timestamps, contracts), and iv and greeks are solved for the whole day in one broadcast call of the vectorized
+    kernel instead of a loop over timestamps. Days are processed one at a time so memory stays bounded by one day.
+"""
+rqdatac = lazy_import('rqdatac')
+
+
+class MinutePanel:
+    """aligned arrays of one day, 2D arrays are (timestamps, contracts), 1D arrays are per contract"""
+    def __init__(self, timestamps, order_book_id, option_price, underlying_price, strike_price, time_to_maturity,
+                 risk_free_rate, dividend_yield, is_call):
+        self.timestamps = timestamps
+        self.order_book_id = order_book_id
+        self.option_price = option_price
+        self.underlying_price = underlying_price
+        self.strike_price = strike_price
+        self.time_to_maturity = time_to_maturity
+        self.risk_free_rate = risk_free_rate
+        self.dividend_yield = dividend_yield
+        self.is_call = is_call
+
+    @property
+    def shape(self):
+        return self.option_price.shape
+
+
+def get_minute_close(ids, _date, field='close'):
+    """
+    :return: pandas DataFrame, index = minute timestamps of _date, columns = ids
+    """
+    bars = rqdatac.get_price(ids, _date, _date, frequency='1m', fields=[field], expect_df=True)
+    if bars is None:
+        return pd.DataFrame(columns=ids)
+    return bars[field].unstack(level=0).reindex(columns=ids)
+
+
+def get_rates(_date, ids, ttm_series):
+    """the spot risk free rate of ids, see computation.get_risk_free_series"""
+    from .bs_model import computation
+    with metrics.stage('rates'):
+        return computation.get_risk_free_series(_date, ids, ttm_series)
+
+
+def build_panel(info, option_close, underlying_close, rf_series, dd_series=None):
+    """
+    :param info: instruments of the day, as returned by computation.get_basic_information
+    :param option_close: DataFrame, minute closes, columns = option ids
+    :param underlying_close: DataFrame, minute closes, columns = underlying ids
+    :param rf_series: risk free rate per option id
+    :param dd_series: dividend yield per option id, default 0
+    :return: MinutePanel
+    """
+    ids = pd.Index(info['order_book_id'])
+    timestamps = option_close.index.union(underlying_close.index).sort_values()
+    # illiquid options do not trade every minute, the last close stays valid until the next one
+    option_close = option_close.reindex(index=timestamps, columns=ids).ffill()
+    underlying_close = underlying_close.reindex(timestamps).ffill()
+
+    underlying_id = info['underlying_order_book_id'].values
+    codes = pd.Index(underlying_close.columns).get_indexer(underlying_id)
+    underlying_values = underlying_close.values
+    underlying_price = np.where(codes >= 0, underlying_values[:, np.maximum(codes, 0)], np.nan)
+
+    # calendar days to expiry, as in computation.get_date2maturity, but measured from every minute
+    expiry = pd.to_datetime(info['de_listed_date']).values.astype('datetime64[s]')
+    now = timestamps.values.astype('datetime64[s]')
+    seconds = (expiry[np.newaxis, :] - now[:, np.newaxis]).astype(float)
+    time_to_maturity = seconds / 86400 / 365
+
+    rate = pd.Series(rf_series).reindex(ids).values.astype(float)
+    dividend = np.zeros(len(ids)) if dd_series is None else pd.Series(dd_series).reindex(ids).values.astype(float)
+    return MinutePanel(timestamps, ids.values, option_close.values, underlying_price,
+                       info['strike_price'].values.astype(float), time_to_maturity, rate, dividend,
+                       (info['option_type'] == 'C').values)
+
+
+def solve_panel(panel, greeks=GREEKS):
+    """
+    :return: dict, 'iv' and every greek -> 2D array (timestamps, contracts), solved in one vectorized pass
+    """
+    metrics.count('contracts', panel.option_price.size)
+    with metrics.stage('iv'):
+        iv = implied_volatility(panel.option_price, panel.underlying_price, panel.strike_price, panel.risk_free_rate,
+                                panel.dividend_yield, panel.time_to_maturity, panel.is_call)
+    with metrics.stage('greeks'):
+        result = bs_greeks(panel.underlying_price, panel.strike_price, panel.risk_free_rate, panel.dividend_yield, iv,
+                           panel.time_to_maturity, panel.is_call, greeks)
+    return dict(iv=iv, **result)
+
+
+def panel_frames(panel, result):
+    """wrap the 2D arrays into DataFrames, index = timestamps, columns = order_book_id"""
+    return {name: pd.DataFrame(value, index=panel.timestamps, columns=panel.order_book_id)
+            for name, value in result.items()}
+
+
+def get_intraday_greeks(start_date, end_date, sc_only='all', implied_price=False, greeks=GREEKS):
+    """
+    iterate over the trading days between start_date and end_date, one day per chunk
+    :return: generator of (trading date, dict of DataFrames: 'iv' and every greek, index = minute, columns = ids)
+    """
+    from .bs_model import computation
+    for _date in computation.get_trading_dates_all_option(end_date, start_date):
+        _date = dt.datetime.combine(_date, dt.time()) if not isinstance(_date, dt.datetime) else _date
+        info = computation.filter_market(_date, sc_only)
+        if info.empty:
+            continue
+        ids = info['order_book_id'].tolist()
+        calls = {'option_close': (get_minute_close, (ids, _date)),
+                 'underlying_close': (get_minute_close, (info['underlying_order_book_id'].unique().tolist(), _date))}
+        if not implied_price:
+            calls['rf_series'] = (get_rates, (_date, ids, computation.get_date2maturity(info, _date)))
+        # the minute bars of the options and of the underlyings, and the rate, are independent requests
+        with metrics.stage('fetch_prices'):
+            fetched = computation.fetch_concurrently(calls)
+        option_close, underlying_close = fetched['option_close'], fetched['underlying_close']
+        if implied_price:
+            # the implied carry is a daily quantity, backed out from the daily closes
+            rf_series = computation.get_rate_series(computation.get_market_data(info, _date), True)
+        else:
+            rf_series = fetched['rf_series']
+        panel = build_panel(info, option_close, underlying_close, rf_series, computation.get_dividend(ids))
+        yield _date, panel_frames(panel, solve_panel(panel, greeks))
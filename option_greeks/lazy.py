@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import importlib
+"""
+    Deferred imports of the heavy or networked dependencies (rqdatac, rqanalysis, pymongo, scipy).
+    A LazyModule stands in for the module at import time and only imports it on the first attribute access, so
+    importing option_greeks for a quick calculation does not pull in the data and storage clients.
+"""
+
+
+class LazyModule:
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return '<lazy module {!r}{}>'.format(self._name, '' if self._module is None else ' (loaded)')
+
+
+def lazy_import(name):
+    """
+    :param name: dotted module name, e.g. 'rqdatac' or 'rqanalysis.risk'
+    :return: LazyModule, the module is imported on first use
+    """
+    return LazyModule(name)
+
+
+def is_loaded(lazy_module):
+    return lazy_module.__dict__['_module'] is not None
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import warnings
+import numpy as np
+import pandas as pd
+from .bs_model.toolkit import get_status
+"""
+    Position weighted portfolio greeks.
+    Positions are joined with the per contract greeks through integer positions (Index.get_indexer) instead of label
+    alignment, weighted by quantity × contract multiplier, and summed per underlying, expiry, moneyness bucket and in
+    total with sorted key segmented sums (np.add.reduceat). Grouping codes only depend on the positions, so they are
+    computed once and reused for every refresh.
+"""
+
+GROUPS = ('underlying', 'expiry', 'moneyness', 'total')
+
+
+def get_moneyness(market_data):
+    """ATM / ITM / OTM of every contract, by toolkit.get_option_status on each underlying"""
+    status = [get_status(_id, market_data.info, market_data.distinct_price, market_data.sp_series,
+                         market_data.type_series)
+              for _id in market_data.info['underlying_order_book_id'].unique()]
+    return pd.concat(status).rename('moneyness') if status else pd.Series(dtype=object, name='moneyness')
+
+
+def segmented_sum(codes, values):
+    """
+    :param codes: int array, group code of every row
+    :param values: 2D array, rows aligned with codes
+    :return: (group codes present, sums per group), groups in ascending code order
+    """
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    return sorted_codes[starts], np.add.reduceat(values[order], starts, axis=0)
+
+
+class PortfolioAggregator:
+    """
+    :param positions: DataFrame, columns order_book_id, quantity, contract_multiplier and optionally book
+    :param info: instruments, columns order_book_id, underlying_order_book_id, de_listed_date
+    :param moneyness: optional Series, index = order_book_id, value = 'ATM' / 'ITM' / 'OTM' (see get_moneyness)
+    :param market_data: optional computation.MarketData, the moneyness is computed from it when not given
+    """
+    def __init__(self, positions, info, moneyness=None, market_data=None):
+        self.positions = positions.reset_index(drop=True)
+        self.weight = (self.positions['quantity'].values * self.positions['contract_multiplier'].values).astype(float)
+        self.order_book_id = pd.Index(self.positions['order_book_id'])
+
+        info_position = pd.Index(info['order_book_id']).get_indexer(self.order_book_id)
+        if (info_position < 0).any():
+            warnings.warn('{} not found in the instruments'.format(
+                self.order_book_id[info_position < 0].unique().tolist()))
+        keys = {
+            'underlying': _take(info['underlying_order_book_id'].values, info_position),
+            'expiry': _take(info['de_listed_date'].values, info_position),
+            'total': np.zeros(len(self.positions), dtype=int),
+        }
+        if moneyness is None and market_data is not None:
+            moneyness = get_moneyness(market_data)
+        if moneyness is not None:
+            keys['moneyness'] = _take(moneyness.values, pd.Index(moneyness.index).get_indexer(self.order_book_id))
+
+        books = self.positions['book'].values if 'book' in self.positions else None
+        self._groups = {}
+        for name, key in keys.items():
+            codes, uniques = pd.factorize(key, sort=True, use_na_sentinel=False)
+            if books is None:
+                self._groups[name] = (codes, pd.Index(uniques, name=name))
+            else:
+                # a position without book is a group of its own, nan book
+                book_codes, book_uniques = pd.factorize(books, sort=True, use_na_sentinel=False)
+                combined = book_codes * len(uniques) + codes
+                self._groups[name] = (combined, pd.MultiIndex.from_product([book_uniques, uniques],
+                                                                           names=['book', name]))
+
+    def weighted(self, greeks_frame, columns=None):
+        """
+        :param greeks_frame: per contract greeks, index = order_book_id or (order_book_id, trading_date)
+        :return: DataFrame of position weighted greeks, one row per position
+        """
+        columns = [x for x in greeks_frame.columns if x != 'iv'] if columns is None else list(columns)
+        greek_ids = greeks_frame.index.get_level_values(0) if isinstance(greeks_frame.index, pd.MultiIndex) \
+            else greeks_frame.index
+        position = pd.Index(greek_ids).get_indexer(self.order_book_id)
+        values = _take(greeks_frame[columns].values.astype(float), position)
+        return pd.DataFrame(values * self.weight[:, np.newaxis], columns=columns, index=self.positions.index)
+
+    def aggregate(self, greeks_frame, columns=None, groups=GROUPS):
+        """
+        :return: dict, group name -> DataFrame of summed weighted greeks (nan greeks count as 0)
+        """
+        weighted = self.weighted(greeks_frame, columns)
+        values = np.nan_to_num(weighted.values)
+        result = {}
+        for name in groups:
+            if name not in self._groups:
+                warnings.warn('{} group needs the moneyness or the market data of the positions, it is left out'
+                              .format(name))
+                continue
+            codes, labels = self._groups[name]
+            present, sums = segmented_sum(codes, values)
+            result[name] = pd.DataFrame(sums, index=labels[present], columns=weighted.columns)
+        return result
+
+
+def _take(values, position):
+    """values[position] with nan (or None) where position is -1"""
+    missing = position < 0
+    taken = values[np.maximum(position, 0)]
+    if not missing.any():
+        return taken
+    taken = taken.astype(float if taken.dtype.kind in 'fiub' else object)
+    taken[missing] = np.nan
+    return taken
+
+
+def aggregate_portfolio_greeks(positions, greeks_frame, info, moneyness=None, groups=GROUPS, market_data=None):
+    return PortfolioAggregator(positions, info, moneyness, market_data).aggregate(greeks_frame, groups=groups)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import json
+import timeit
+import threading
+import datetime as dt
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+"""
+    Stage level instrumentation for the greeks job.
+    Timers are context managers, counters are plain integers, and the result can be read as a dict or
+    appended to a file as one json line per run, so that nightly runs can be compared with each other.
+"""
+
+
+class Metrics:
+    """collect elapsed time per stage, counters and peak memory of one run"""
+    def __init__(self):
+        self.timings = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.peak_memory = None
+        # stages and counters are also updated from the fetch and shard threads
+        self._lock = threading.Lock()
+
+    def reset(self):
+        self.timings.clear()
+        self.calls.clear()
+        self.counters.clear()
+        self.peak_memory = None
+
+    @contextmanager
+    def stage(self, name):
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            elapsed = timeit.default_timer() - start
+            with self._lock:
+                self.timings[name] += elapsed
+                self.calls[name] += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    @contextmanager
+    def track_memory(self):
+        """record the peak traced memory (bytes) of the block, tracemalloc slows the block down noticeably"""
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            self.peak_memory = max(peak, self.peak_memory or 0)
+            if not already_tracing:
+                tracemalloc.stop()
+
+    def to_dict(self):
+        return {
+            'timings': dict(self.timings),
+            'calls': dict(self.calls),
+            'counters': dict(self.counters),
+            'peak_memory': self.peak_memory,
+        }
+
+    def to_json_line(self, **extra):
+        record = {'time': dt.datetime.now().isoformat()}
+        record.update(extra)
+        record.update(self.to_dict())
+        return json.dumps(record, default=str)
+
+    def dump(self, path, **extra):
+        """append the metrics of this run to path as a json line"""
+        with open(path, 'a') as f:
+            f.write(self.to_json_line(**extra) + '\n')
+
+
+# process wide metrics used by the computation and storage modules
+metrics = Metrics()
+stage = metrics.stage
+count = metrics.count
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+from .profiling import metrics
+from .lazy import lazy_import
+from .cache import atomic_write
+"""
+    Risk free term structure of a date, so that every contract is discounted at the rate of its own maturity instead
+    of one rate for the whole market.
+    The yield curve of a date is requested once and kept in memory (and in a local directory when one is given), a
+    window of dates is requested with a single call. The rate of every contract is interpolated in one np.interp call
+    over its time to maturity; the same series feeds the implied volatility and the greeks, rho included.
+"""
+rqdatac = lazy_import('rqdatac')
+
+# a tenor label of the yield curve, e.g. 0S (overnight), 1M, 3M, 1Y
+_TENOR = re.compile(r'^(\d+)([SDWMY])$')
+_TENOR_YEARS = {'S': 1 / 365, 'D': 1 / 365, 'W': 7 / 365, 'M': 1 / 12, 'Y': 1.}
+
+
+def tenor_years(tenor):
+    """:return: the length of a tenor label in years, the overnight rate (0S) is one day"""
+    match = _TENOR.match(str(tenor).upper())
+    if match is None:
+        raise ValueError('tenor {} is not supported'.format(tenor))
+    number, unit = match.groups()
+    return max(int(number), 1) * _TENOR_YEARS[unit]
+
+
+class RateCurve:
+    """
+    :param tenors: tenor lengths in years
+    :param rates: rate of every tenor, continuously compounded decimals
+    """
+    def __init__(self, tenors, rates):
+        tenors = np.asarray(tenors, dtype=float)
+        rates = np.asarray(rates, dtype=float)
+        known = np.isfinite(rates)
+        order = np.argsort(tenors[known], kind='stable')
+        self.tenors = tenors[known][order]
+        self.rates = rates[known][order]
+        if self.tenors.size == 0:
+            raise ValueError('the curve has no rate')
+
+    @classmethod
+    def from_row(cls, row):
+        """:param row: pandas Series, index = tenor labels, as one row of rqdatac.get_yield_curve"""
+        return cls([tenor_years(x) for x in row.index], row.values)
+
+    def rate(self, time_to_maturity):
+        """
+        linear interpolation between the tenors, flat beyond the first and the last one
+        :param time_to_maturity: array of any shape, in years
+        :return: numpy array of rates, same shape
+        """
+        time_to_maturity = np.asarray(time_to_maturity, dtype=float)
+        return np.interp(time_to_maturity, self.tenors, self.rates)
+
+    def rate_series(self, ttm_series):
+        """:return: rate series of the contracts of ttm_series (index = order_book_id), named rf_series"""
+        return pd.Series(self.rate(ttm_series.values), index=ttm_series.index, name='rf_series')
+
+
+class CurveCache:
+    """
+    yield curves per date
+    :param directory: optional local directory, curves are kept there across runs
+    """
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._curves = {}
+        # the rate requests of a date run on the fetch threads
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, _date):
+        return os.path.join(self.directory, 'curve_{}.pkl'.format(pd.Timestamp(_date).strftime('%Y%m%d')))
+
+    def _read(self, _date):
+        if self.directory is None:
+            return None
+        try:
+            return RateCurve.from_row(pd.read_pickle(self._path(_date)))
+        except (OSError, EOFError, ValueError, KeyError, TypeError, AttributeError, pickle.UnpicklingError):
+            return None
+
+    def _keep(self, _date, row):
+        self._curves[pd.Timestamp(_date).normalize()] = RateCurve.from_row(row)
+        if self.directory is not None:
+            atomic_write(self._path(_date), lambda tmp_path: row.to_pickle(tmp_path))
+
+    def get(self, _date):
+        """:return: RateCurve of _date, requested on the first call only"""
+        key = pd.Timestamp(_date).normalize()
+        with self._lock:
+            if key in self._curves:
+                metrics.count('curve_hits')
+                return self._curves[key]
+            curve = self._read(key)
+            if curve is not None:
+                self._curves[key] = curve
+                metrics.count('curve_hits')
+                return self._curves[key]
+            metrics.count('curve_misses')
+            with metrics.stage('rates'):
+                curve = rqdatac.get_yield_curve(key, key)
+            if curve is None or curve.empty:
+                raise ValueError('{} yield curve is not available'.format(key))
+            self._keep(key, curve.iloc[-1])
+            return self._curves[key]
+
+    def load(self, start_date, end_date):
+        """request the curves of every date of a window in one call, the dates already held are kept"""
+        with metrics.stage('rates'):
+            curves = rqdatac.get_yield_curve(start_date, end_date)
+        if curves is None:
+            return
+        with self._lock:
+            for _date, row in curves.iterrows():
+                if pd.Timestamp(_date).normalize() not in self._curves:
+                    self._keep(_date, row)
+
+    def rate_series(self, _date, ttm_series):
+        """:return: rate series of the contracts of ttm_series on _date, see RateCurve.rate_series"""
+        return self.get(_date).rate_series(ttm_series)
+
+    def clear(self):
+        with self._lock:
+            self._curves.clear()
+
+
+# the curves of the process, shared by every run
+curve_cache = CurveCache()
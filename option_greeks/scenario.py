@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+from .bs_model.kernel import bs_price, bs_greeks, GREEKS
+from .profiling import metrics
+"""
+    Scenario and stress grid engine.
+    A chain with its implied volatilities is repriced on every point of a spot shock × vol shock × day roll grid by
+    numpy broadcasting: scenarios on the first axis, contracts on the second. The contract axis is cut into chunks so
+    the intermediate arrays never exceed max_elements, only the requested output cube is held in full.
+"""
+
+
+def scenario_grid(spot_shocks=(0,), vol_shocks=(0,), day_rolls=(0,)):
+    """
+    :param spot_shocks: relative underlying moves, e.g. [-0.1, -0.05, 0, 0.05, 0.1]
+    :param vol_shocks: absolute iv moves, e.g. [-0.05, 0, 0.05]
+    :param day_rolls: calendar days forward, e.g. [0, 1, 7]
+    :return: DataFrame, one row per scenario, columns spot_shock, vol_shock, day_roll
+    """
+    spot, vol, day = np.meshgrid(np.asarray(spot_shocks, dtype=float), np.asarray(vol_shocks, dtype=float),
+                                 np.asarray(day_rolls, dtype=float), indexing='ij')
+    return pd.DataFrame({'spot_shock': spot.ravel(), 'vol_shock': vol.ravel(), 'day_roll': day.ravel()})
+
+
+class ScenarioCube:
+    """values: name -> array (scenario, contract), for 'price', 'pnl' and every requested greek"""
+    def __init__(self, scenarios, order_book_id, values):
+        self.scenarios = scenarios
+        self.order_book_id = order_book_id
+        self.values = values
+
+    def frame(self, name):
+        return pd.DataFrame(self.values[name], index=self.scenarios.index,
+                            columns=pd.Index(self.order_book_id, name='order_book_id'))
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+
+def run_scenarios(market_data, rf_series, iv_series, scenarios, greeks=GREEKS, max_elements=4000000,
+                  min_vol=1e-4, dtype=np.float64):
+    """
+    :param market_data: computation.MarketData (or anything with the same attributes)
+    :param rf_series: risk free rate series, index = order_book_id
+    :param iv_series: implied volatility series, e.g. the 'iv' column of get_greeks or get_implied_volatility result
+    :param scenarios: DataFrame from scenario_grid
+    :param greeks: greeks evaluated in every scenario, the price and the pnl against the base price are always there
+    :param max_elements: upper bound of scenario × contract elements of one chunk
+    :param min_vol: shocked volatilities are floored here
+    :param dtype: dtype of the output cube
+    :return: ScenarioCube, contracts without an iv are nan
+    """
+    ids = pd.Index(market_data.id_list)
+    spot = market_data.udp_series.reindex(ids).values.astype(float)
+    strike = market_data.sp_series.reindex(ids).values.astype(float)
+    ttm = market_data.ttm_series.reindex(ids).values.astype(float)
+    rate = pd.Series(rf_series).reindex(ids).values.astype(float)
+    dividend = market_data.dd_series.reindex(ids).values.astype(float)
+    is_call = (market_data.type_series.reindex(ids) == 'C').values
+    iv = pd.Series(iv_series).reindex(ids).values.astype(float)
+
+    spot_shock = scenarios['spot_shock'].values[:, np.newaxis]
+    vol_shock = scenarios['vol_shock'].values[:, np.newaxis]
+    roll = scenarios['day_roll'].values[:, np.newaxis] / 365
+
+    n_scenarios, n_contracts = len(scenarios), len(ids)
+    names = ('price', 'pnl') + tuple(greeks)
+    values = {name: np.empty((n_scenarios, n_contracts), dtype=dtype) for name in names}
+    base_price = bs_price(spot, strike, rate, dividend, iv, ttm, is_call)
+
+    chunk = max(1, int(max_elements // max(n_scenarios, 1)))
+    metrics.count('contracts', n_scenarios * n_contracts)
+    with metrics.stage('scenarios'):
+        for start in range(0, n_contracts, chunk):
+            part = slice(start, start + chunk)
+            shocked_spot = spot[part] * (1 + spot_shock)
+            shocked_vol = np.maximum(iv[part] + vol_shock, min_vol)
+            shocked_ttm = ttm[part] - roll
+            # contracts rolled past their expiry are worth their intrinsic value and have no greeks
+            expired = shocked_ttm <= 0
+            shocked_ttm = np.where(expired, np.nan, shocked_ttm)
+            args = (shocked_spot, strike[part], rate[part], dividend[part], shocked_vol, shocked_ttm, is_call[part])
+
+            price = bs_price(*args)
+            intrinsic = np.where(is_call[part], np.maximum(shocked_spot - strike[part], 0),
+                                 np.maximum(strike[part] - shocked_spot, 0))
+            price = np.where(expired, intrinsic, price)
+            values['price'][:, part] = price
+            values['pnl'][:, part] = price - base_price[part]
+            for greek, value in bs_greeks(*args, greeks=greeks).items():
+                values[greek][:, part] = value
+    return ScenarioCube(scenarios, ids.values, values)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import csv
+import itertools
+import numpy as np
+import pandas as pd
+from .bs_model.kernel import implied_volatility, bs_greeks, GREEKS
+from .profiling import metrics
+"""
+    Intraday streaming greeks.
+    The chain of a day is loaded once and every per contract constant (strike, time to maturity, rate, dividend,
+    discount factors, option type, last implied volatility) is kept in numpy arrays. Price ticks or snapshots of
+    options and underlyings then only trigger a recomputation of the contracts they affect: the option itself for an
+    option tick, every option on it for an underlying tick.
+"""
+
+
+class GreekUpdate:
+    """the contracts recomputed by one tick batch, as small arrays aligned with order_book_id"""
+    def __init__(self, timestamp, order_book_id, option_price, underlying_price, iv, greeks):
+        self.timestamp = timestamp
+        self.order_book_id = order_book_id
+        self.option_price = option_price
+        self.underlying_price = underlying_price
+        self.iv = iv
+        self.greeks = greeks
+
+    def __len__(self):
+        return len(self.order_book_id)
+
+    def to_frame(self):
+        data = {'option_price': self.option_price, 'underlying_price': self.underlying_price, 'iv': self.iv}
+        data.update(self.greeks)
+        return pd.DataFrame(data, index=pd.Index(self.order_book_id, name='order_book_id'))
+
+
+class StreamingGreeks:
+    """
+    :param market_data: computation.MarketData (or anything with the same attributes) of the trading day
+    :param rf_series: risk free rate series of the day, index = order_book_id
+    :param greeks: greeks recomputed on every update
+    """
+    def __init__(self, market_data, rf_series, greeks=GREEKS):
+        self.date = market_data.date
+        self.greeks = tuple(greeks)
+        ids = pd.Index(market_data.id_list)
+        self.order_book_id = ids.values
+        self._position = pd.Series(np.arange(len(ids)), index=ids)
+
+        # per contract constants of the day
+        self.strike = market_data.sp_series.reindex(ids).values.astype(float)
+        self.ttm = market_data.ttm_series.reindex(ids).values.astype(float)
+        self.rate = pd.Series(rf_series).reindex(ids).values.astype(float)
+        self.dividend = market_data.dd_series.reindex(ids).values.astype(float)
+        self.is_call = (market_data.type_series.reindex(ids) == 'C').values
+        self.rate_discount = np.exp(-self.rate * self.ttm)
+        self.dividend_discount = np.exp(-self.dividend * self.ttm)
+
+        # underlying of every contract as an integer code, and the contracts of every underlying
+        underlying = market_data.info.set_index('order_book_id')['underlying_order_book_id'].reindex(ids)
+        codes, self.underlying_ids = pd.factorize(underlying)
+        self._underlying_code = codes
+        self._underlying_position = pd.Series(np.arange(len(self.underlying_ids)), index=self.underlying_ids)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(self.underlying_ids) + 1))
+        self._contracts_of_underlying = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.underlying_ids))]
+
+        # market state
+        self.underlying_last = market_data.distinct_price.reindex(self.underlying_ids).values.astype(float)
+        self.option_last = market_data.option_price.reindex(ids).values.astype(float)
+        self.iv = np.full(len(ids), np.nan)
+        self.values = {greek: np.full(len(ids), np.nan) for greek in self.greeks}
+        self._subscribers = []
+        self._recompute(np.arange(len(ids)))
+
+    @classmethod
+    def from_date(cls, _date, sc_only='all', implied_price=False, greeks=GREEKS):
+        """load the chain of _date through computation, the rate is fixed for the day"""
+        from .bs_model import computation
+        market_data = computation.get_market_data(computation.filter_market(_date, sc_only), _date,
+                                                  risk_free=not implied_price)
+        if market_data is None:
+            raise ValueError('{} has no option on the market'.format(_date))
+        return cls(market_data, computation.get_rate_series(market_data, implied_price), greeks)
+
+    def subscribe(self, callback):
+        """callback(GreekUpdate) is called after every update that recomputed at least one contract"""
+        self._subscribers.append(callback)
+
+    @property
+    def underlying_price(self):
+        return self.underlying_last[self._underlying_code]
+
+    def on_snapshot(self, order_book_id, price, timestamp=None):
+        """
+        :param order_book_id: ids of options and / or underlyings
+        :param price: latest prices, aligned with order_book_id
+        :return: GreekUpdate of the affected contracts, None if nothing changed
+        """
+        order_book_id = pd.Index(order_book_id)
+        price = np.asarray(price, dtype=float)
+        affected = []
+
+        option_position = self._position.reindex(order_book_id).values
+        is_option = ~np.isnan(option_position)
+        if is_option.any():
+            position = option_position[is_option].astype(int)
+            changed = self.option_last[position] != price[is_option]
+            self.option_last[position[changed]] = price[is_option][changed]
+            affected.append(position[changed])
+
+        underlying_position = self._underlying_position.reindex(order_book_id).values
+        is_underlying = ~np.isnan(underlying_position)
+        if is_underlying.any():
+            position = underlying_position[is_underlying].astype(int)
+            changed = self.underlying_last[position] != price[is_underlying]
+            self.underlying_last[position[changed]] = price[is_underlying][changed]
+            affected.extend(self._contracts_of_underlying[i] for i in position[changed])
+
+        if not affected:
+            return None
+        affected = np.unique(np.concatenate(affected))
+        if affected.size == 0:
+            return None
+        return self._publish(self._recompute(affected), timestamp)
+
+    def on_ticks(self, ticks):
+        """
+        :param ticks: iterable of (timestamp, order_book_id, price), published one snapshot per timestamp
+        """
+        for timestamp, batch in itertools.groupby(ticks, key=lambda x: x[0]):
+            batch = list(batch)
+            self.on_snapshot([x[1] for x in batch], [x[2] for x in batch], timestamp)
+
+    def _recompute(self, position):
+        metrics.count('contracts', position.size)
+        spot = self.underlying_last[self._underlying_code[position]]
+        with metrics.stage('iv'):
+            iv = implied_volatility(self.option_last[position], spot, self.strike[position], self.rate[position],
+                                    self.dividend[position], self.ttm[position], self.is_call[position],
+                                    initial_guess=self.iv[position], rate_discount=self.rate_discount[position],
+                                    dividend_discount=self.dividend_discount[position])
+        with metrics.stage('greeks'):
+            values = bs_greeks(spot, self.strike[position], self.rate[position], self.dividend[position], iv,
+                               self.ttm[position], self.is_call[position], self.greeks,
+                               rate_discount=self.rate_discount[position],
+                               dividend_discount=self.dividend_discount[position])
+        self.iv[position] = iv
+        for greek, value in values.items():
+            self.values[greek][position] = value
+        return position
+
+    def _publish(self, position, timestamp):
+        update = GreekUpdate(timestamp, self.order_book_id[position], self.option_last[position],
+                             self.underlying_last[self._underlying_code[position]], self.iv[position],
+                             {greek: self.values[greek][position] for greek in self.greeks})
+        for callback in self._subscribers:
+            callback(update)
+        return update
+
+    def snapshot(self):
+        """current iv and greeks of the whole chain"""
+        data = {'option_price': self.option_last, 'underlying_price': self.underlying_price, 'iv': self.iv}
+        data.update(self.values)
+        return pd.DataFrame(data, index=pd.Index(self.order_book_id, name='order_book_id'))
+
+
+class ReplaySource:
+    """
+    stands in for the live feed: replays (timestamp, order_book_id, price) ticks, ordered by timestamp,
+    from memory or from a csv file with the columns timestamp, order_book_id, price
+    """
+    def __init__(self, ticks):
+        self._ticks = ticks
+
+    @classmethod
+    def from_csv(cls, filename):
+        def read():
+            with open(filename, newline='') as f:
+                for row in csv.DictReader(f):
+                    yield row['timestamp'], row['order_book_id'], float(row['price'])
+        return cls(read())
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls(frame[['timestamp', 'order_book_id', 'price']].itertuples(index=False, name=None))
+
+    def __iter__(self):
+        return iter(self._ticks)
+
+    def replay(self, engine):
+        engine.on_ticks(self)
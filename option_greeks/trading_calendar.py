@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import datetime as dt
+import threading
+import numpy as np
+import pandas as pd
+from .profiling import metrics
+from .lazy import lazy_import
+from .cache import atomic_write, DEFAULT_CACHE_DIR
+"""
+    In memory trading calendar, requested once from rqdatac and kept on disk across runs.
+    Dates are a sorted datetime64[D] array: a date is located by a dict lookup (searchsorted for the days that are not
+    trading days), stepping n trading days is index arithmetic, and the time to maturity of all contracts is one array
+    operation, in calendar days or in trading days.
+"""
+rqdatac = lazy_import('rqdatac')
+
+# first date requested, before the first listed option
+CALENDAR_START = dt.date(2005, 1, 1)
+# trading dates past today are requested as well, as far as the exchanges published them
+CALENDAR_AHEAD = dt.timedelta(days=366)
+TRADING_DAYS_PER_YEAR = 244
+
+
+def _day(_date):
+    return np.datetime64(pd.Timestamp(_date).date(), 'D')
+
+
+def calendar_ttm(expiry, _date):
+    """
+    :param expiry: array like of expiry dates
+    :return: numpy array, whole calendar days from _date to every expiry / 365, no calendar needed
+    """
+    expiry = pd.to_datetime(np.asarray(expiry)).values
+    return np.floor((expiry - np.datetime64(pd.Timestamp(_date))) / np.timedelta64(1, 'D')) / 365
+
+
+class TradingCalendar:
+    """
+    :param dates: trading dates, any order
+    :param as_of: date the dates were requested on, the calendar is trusted up to it
+    """
+    def __init__(self, dates, as_of=None):
+        self.dates = np.unique(np.asarray(pd.to_datetime(list(dates)).values, dtype='datetime64[D]'))
+        self.as_of = _day(dt.date.today() if as_of is None else as_of)
+        self._position = {x: i for i, x in enumerate(self.dates.tolist())}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def is_trading_date(self, _date):
+        return _day(_date).tolist() in self._position
+
+    def position(self, _date, side='left'):
+        """
+        :param side: for a date that is not a trading date, 'left' gives the next trading date, 'right' the previous one
+        :return: index of _date in dates
+        """
+        day = _day(_date)
+        position = self._position.get(day.tolist())
+        if position is not None:
+            return position
+        position = int(np.searchsorted(self.dates, day))
+        return position if side == 'left' else position - 1
+
+    def _at(self, position):
+        if position < 0 or position >= len(self.dates):
+            raise ValueError('the trading calendar has no date at offset {}'.format(position))
+        return self.dates[position].astype(dt.date)
+
+    def offset(self, _date, n):
+        """
+        :param n: number of trading days, negative for the past
+        :return: datetime.date, the trading date n steps from _date (a non trading date is between two steps)
+        """
+        if n == 0:
+            return self._at(self.position(_date))
+        return self._at(self.position(_date, 'right' if n > 0 else 'left') + n)
+
+    def next(self, _date, n=1):
+        return self.offset(_date, n)
+
+    def previous(self, _date, n=1):
+        return self.offset(_date, -n)
+
+    def trading_dates(self, start_date, end_date):
+        """:return: list of datetime.date, the trading dates between start_date and end_date, both included"""
+        start = np.searchsorted(self.dates, _day(start_date))
+        end = np.searchsorted(self.dates, _day(end_date), side='right')
+        return self.dates[start:end].astype(dt.date).tolist()
+
+    def last_n(self, end_date, n):
+        """:return: list of datetime.date, the n trading dates up to end_date (included), newest first"""
+        end = int(np.searchsorted(self.dates, _day(end_date), side='right'))
+        return self.dates[max(end - n, 0):end][::-1].astype(dt.date).tolist()
+
+    def trading_ttm(self, expiry, _date, days_per_year=TRADING_DAYS_PER_YEAR):
+        """
+        :param expiry: array like of expiry dates
+        :return: numpy array, trading days after _date up to every expiry (included) / days_per_year
+        """
+        expiry = np.asarray(pd.to_datetime(np.asarray(expiry)).values, dtype='datetime64[D]')
+        start = np.searchsorted(self.dates, _day(_date), side='right')
+        return (np.searchsorted(self.dates, expiry, side='right') - start) / days_per_year
+
+
+class CalendarCache:
+    """
+    the calendar of the process, read from directory or requested from rqdatac; a date after the request date of the
+    calendar requests it again, at most once a day
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+        self._calendar = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, 'trading_dates.pkl')
+
+    def _read(self):
+        # a missing, truncated or foreign file is requested again and overwritten
+        try:
+            saved = pd.read_pickle(self.path)
+            return TradingCalendar(saved['dates'], saved['as_of'])
+        except (OSError, EOFError, ValueError, KeyError, TypeError, AttributeError, pickle.UnpicklingError):
+            return None
+
+    def _request(self):
+        today = dt.date.today()
+        with metrics.stage('fetch_calendar'):
+            dates = rqdatac.get_trading_dates(CALENDAR_START, today + CALENDAR_AHEAD)
+        metrics.count('calendar_requests')
+        calendar = TradingCalendar(dates, today)
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(self.path, lambda tmp_path: pd.to_pickle({'dates': pd.to_datetime(list(dates)), 'as_of': today},
+                                                              tmp_path))
+        return calendar
+
+    def get(self, until=None):
+        """
+        :param until: latest date the caller needs, default today
+        :return: TradingCalendar
+        """
+        until = _day(dt.date.today() if until is None else until)
+        with self._lock:
+            if self._calendar is None:
+                self._calendar = self._read()
+            if self._calendar is None or (until > self._calendar.as_of and
+                                          self._calendar.as_of < _day(dt.date.today())):
+                self._calendar = self._request()
+            return self._calendar
+
+    def clear(self):
+        with self._lock:
+            self._calendar = None
+
+
+calendar_cache = CalendarCache()
+
+
+def get_calendar(until=None):
+    """the trading calendar of calendar_cache, see CalendarCache.get"""
+    return calendar_cache.get(until)
@@ -7,7 +7,7 @@ setup(
     name="update_greeks",
     version='3.1',
     description="daily schedule for update",
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     python_requires='>=3.6',
     install_requires=[
         'pandas',
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import datetime as dt
+import pytest
+from benchmarks.synthetic import make_chain
+from option_greeks import intraday, mongo_insert, rate_curve, trading_calendar
+from option_greeks.bs_model import computation
+from stubs import FakeRQData, FakePyMongo, as_market_data
+
+
+@pytest.fixture
+def chain():
+    # every product of the synthetic generator: the etf options and the options on futures
+    return make_chain(200, seed=1)
+
+
+@pytest.fixture
+def market_data(chain):
+    return as_market_data(chain)
+
+
+@pytest.fixture
+def rqdata(chain, monkeypatch, tmp_path):
+    """FakeRQData of chain on its date and the 4 following days, in place of rqdatac and rqanalysis.risk"""
+    fake = FakeRQData(chain, [chain.date + dt.timedelta(days=x) for x in range(5)])
+    for module in (computation, rate_curve, trading_calendar, mongo_insert, intraday):
+        monkeypatch.setattr(module, 'rqdatac', fake)
+    monkeypatch.setattr(computation, '_risk', fake)
+    monkeypatch.setattr(rate_curve, 'curve_cache', rate_curve.CurveCache())
+    monkeypatch.setattr(trading_calendar, 'calendar_cache', trading_calendar.CalendarCache(str(tmp_path / 'cal')))
+    return fake
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    fake = FakePyMongo()
+    monkeypatch.setattr(mongo_insert, 'pymongo', fake)
+    return fake
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+from option_greeks.bs_model.computation import MarketData
+"""
+    In memory stand-ins of the rqdatac, rqanalysis.risk and pymongo calls made by option_greeks, serving a
+    benchmarks.synthetic chain, so that the fetch and write paths run without network.
+"""
+
+TENORS = ('0S', '1M', '3M', '6M', '1Y', '2Y')
+TENOR_RATES = (0.015, 0.018, 0.021, 0.024, 0.027, 0.03)
+
+
+class FakeRQData:
+    """
+    :param chain: benchmarks.synthetic chain, its closes are the closes of every date
+    :param dates: trading dates served
+    :param risk_free: the spot risk free rate of get_risk_free_rate
+    """
+    def __init__(self, chain, dates, risk_free=0.03):
+        self.chain = chain
+        self.dates = [pd.Timestamp(x) for x in dates]
+        self.risk_free = risk_free
+        self.requests = []
+        closes = pd.concat([chain.option_price, chain.distinct_price])
+        self.closes = closes[~closes.index.duplicated()]
+
+    def _log(self, name, *args):
+        self.requests.append((name,) + args)
+
+    def all_instruments(self, type='Option', date=None):
+        self._log('all_instruments', date)
+        info = self.chain.info.copy()
+        for column in ('de_listed_date', 'listed_date'):
+            info[column] = pd.to_datetime(info[column]).dt.strftime('%Y-%m-%d')
+        return info
+
+    def get_price(self, ids, start_date, end_date, expect_df=True, **kwargs):
+        ids = [ids] if isinstance(ids, str) else list(ids)
+        self._log('get_price', tuple(ids), start_date, end_date)
+        dates = [x for x in self.dates if pd.Timestamp(start_date) <= x <= pd.Timestamp(end_date)]
+        ids = [x for x in ids if x in self.closes.index]
+        if not dates or not ids:
+            return None
+        index = pd.MultiIndex.from_product([ids, dates], names=['order_book_id', 'date'])
+        return pd.DataFrame({'close': np.repeat(self.closes.reindex(ids).values, len(dates))}, index=index)
+
+    def get_yield_curve(self, start_date, end_date):
+        self._log('get_yield_curve', start_date, end_date)
+        dates = [x for x in self.dates if pd.Timestamp(start_date) <= x <= pd.Timestamp(end_date)]
+        return pd.DataFrame([TENOR_RATES] * len(dates), index=pd.DatetimeIndex(dates), columns=list(TENORS))
+
+    def get_trading_dates(self, start_date, end_date):
+        return [x.date() for x in self.dates if pd.Timestamp(start_date) <= x <= pd.Timestamp(end_date)]
+
+    def get_risk_free_rate(self, start_date, end_date):
+        self._log('get_risk_free_rate', start_date, end_date)
+        return self.risk_free
+
+    def init(self, *args, **kwargs):
+        pass
+
+
+class FakeCollection:
+    def __init__(self, full_name):
+        self.full_name = full_name
+        self.documents = []
+
+    def insert_many(self, documents):
+        self.documents.extend(dict(x) for x in documents)
+
+    def bulk_write(self, operations):
+        for operation in operations:
+            self.documents = [x for x in self.documents
+                              if any(x.get(k) != v for k, v in operation.filter.items())]
+            self.documents.append(dict(operation.update['$set']))
+
+
+class FakePyMongo:
+    """pymongo.MongoClient and UpdateOne, every collection is a list of documents"""
+    DESCENDING = -1
+
+    def __init__(self):
+        self.collections = {}
+
+    def MongoClient(self, url):
+        pymongo = self
+
+        class Client:
+            def __getitem__(self, db):
+                class Database:
+                    def __getitem__(self, col):
+                        full_name = '{}.{}'.format(db, col)
+                        return pymongo.collections.setdefault(full_name, FakeCollection(full_name))
+                return Database()
+
+            def close(self):
+                pass
+        return Client()
+
+    class UpdateOne:
+        def __init__(self, _filter, update, upsert=False):
+            self.filter = _filter
+            self.update = update
+
+
+def as_market_data(chain):
+    """computation.MarketData of a benchmarks.synthetic chain"""
+    return MarketData(chain.info, chain.date, chain.option_price, chain.udp_series, chain.distinct_price,
+                      chain.sp_series, chain.ttm_series, chain.dd_series, chain.type_series)
+
+
+def by_id(pd_data):
+    """result frame indexed by order_book_id only, as str, whatever the categories of the id level"""
+    pd_data = pd_data.reset_index(level='trading_date', drop=True)
+    return pd_data.set_axis(pd_data.index.astype(str), axis=0).sort_index()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+from option_greeks.bs_model.computation import get_greeks
+from option_greeks.cache import ResultCache
+from option_greeks.mongo_insert import CustomizedMongo, insert_once, spot_col
+from option_greeks.profiling import metrics
+
+
+def _run(chain, cache):
+    metrics.reset()
+    return get_greeks(chain.date, sc_only='all', cache=cache)
+
+
+def test_unchanged_inputs_hit_the_cache(chain, rqdata, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    first = _run(chain, cache)
+    assert metrics.counters['cache_misses'] == 1
+    second = _run(chain, cache)
+    assert metrics.counters['cache_hits'] == 1 and 'cache_misses' not in metrics.counters
+    pd.testing.assert_frame_equal(second, first)
+    assert second.attrs['input_hash'] == first.attrs['input_hash']
+
+
+def test_changed_inputs_miss_the_cache(chain, rqdata, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    first = _run(chain, cache)
+    rqdata.closes[chain.id_list[0]] += 0.5
+    second = _run(chain, cache)
+    assert metrics.counters['cache_misses'] == 1
+    assert second.attrs['input_hash'] != first.attrs['input_hash']
+
+
+def test_corrupt_file_is_recomputed(chain, rqdata, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    first = _run(chain, cache)
+    with open(cache._path(first.attrs['input_hash']), 'wb') as f:
+        f.write(b'\x80\x04truncated')
+    second = _run(chain, cache)
+    assert metrics.counters['cache_misses'] == 1
+    pd.testing.assert_frame_equal(second, first)
+    # the recomputed result replaced the corrupt file
+    pd.testing.assert_frame_equal(cache.get(first.attrs['input_hash']), first)
+
+
+def test_written_date_is_not_written_again(chain, rqdata, mongo, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    collection = CustomizedMongo('mongodb://fake', 'db', spot_col)
+    result = _run(chain, cache)
+    assert insert_once(collection, result, chain.date, cache)
+    assert not insert_once(collection, _run(chain, cache), chain.date, cache)
+    assert len(mongo.collections['db.' + spot_col].documents) == len(result)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+from option_greeks.bs_model.computation import calc_greeks_cached, AMERICAN_PRODUCTS
+from option_greeks.bs_model.kernel import GREEKS, HIGHER_GREEKS
+
+
+def _by_id(pd_data):
+    return pd_data.reset_index(level='trading_date', drop=True)
+
+
+def _etf_ids(chain):
+    return chain.info['order_book_id'][chain.info['underlying_symbol'] == '510050.XSHG']
+
+
+def test_american_leaves_the_european_contracts_unchanged(chain, market_data):
+    base = _by_id(calc_greeks_cached(market_data, chain.rf_series))
+    american = _by_id(calc_greeks_cached(market_data, chain.rf_series, american=AMERICAN_PRODUCTS))
+
+    assert american.index.equals(base.index)
+    pd.testing.assert_frame_equal(american.loc[_etf_ids(chain)], base.loc[_etf_ids(chain)])
+    futures = base.index.difference(_etf_ids(chain))
+    assert not american.loc[futures].equals(base.loc[futures])
+
+
+def test_black76_leaves_the_etf_options_unchanged(chain, market_data):
+    base = _by_id(calc_greeks_cached(market_data, chain.rf_series))
+    black76 = _by_id(calc_greeks_cached(market_data, chain.rf_series, black76=True))
+
+    assert black76.index.equals(base.index)
+    pd.testing.assert_frame_equal(black76.loc[_etf_ids(chain)], base.loc[_etf_ids(chain)])
+    futures = base.index.difference(_etf_ids(chain))
+    assert not black76.loc[futures].equals(base.loc[futures])
+
+
+def test_higher_greeks_leave_the_first_order_columns_unchanged(chain, market_data):
+    base = calc_greeks_cached(market_data, chain.rf_series)
+    extended = calc_greeks_cached(market_data, chain.rf_series, greeks=GREEKS + HIGHER_GREEKS)
+
+    pd.testing.assert_frame_equal(extended[base.columns], base)
+    assert list(extended.columns) == ['iv'] + list(GREEKS + HIGHER_GREEKS)
+    priced = extended['iv'].notna()
+    assert extended.loc[priced, list(HIGHER_GREEKS)].notna().all().all()
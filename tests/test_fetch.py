@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+from option_greeks.bs_model.computation import get_greeks, get_greeks_both
+from stubs import by_id
+
+
+def _price_requests(rqdata):
+    return [x for x in rqdata.requests if x[0] == 'get_price']
+
+
+def test_both_results_from_one_fetch(chain, rqdata):
+    implied, spot = get_greeks_both(chain.date, sc_only='all')
+    # the option closes and the underlying closes, once for both results
+    assert len(_price_requests(rqdata)) == 2
+
+    pd.testing.assert_frame_equal(implied, get_greeks(chain.date, sc_only='all', implied_price=True))
+    pd.testing.assert_frame_equal(spot, get_greeks(chain.date, sc_only='all', implied_price=False))
+
+
+@pytest.mark.parametrize('implied_price', [False, True])
+def test_filters_equal_a_filtered_full_run(chain, rqdata, implied_price):
+    full = by_id(get_greeks(chain.date, sc_only='all', implied_price=implied_price))
+    info = chain.info
+    underlying = info['underlying_order_book_id'].iloc[-1]
+    expiry = info['de_listed_date'].iloc[0]
+    ids = chain.id_list[::7]
+
+    selected = by_id(get_greeks(chain.date, ids=ids, sc_only='all', implied_price=implied_price))
+    pd.testing.assert_frame_equal(selected, full.loc[sorted(ids)])
+    selected = by_id(get_greeks(chain.date, underlying=underlying, sc_only='all', implied_price=implied_price))
+    pd.testing.assert_frame_equal(selected, full.loc[sorted(info['order_book_id'][
+        info['underlying_order_book_id'] == underlying])])
+    selected = by_id(get_greeks(chain.date, expiry=expiry, sc_only='all', implied_price=implied_price))
+    pd.testing.assert_frame_equal(selected, full.loc[sorted(info['order_book_id'][info['de_listed_date'] == expiry])])
+
+
+def test_filters_fetch_the_selected_contracts_only(chain, rqdata):
+    ids = chain.id_list[:3]
+    get_greeks(chain.date, ids=ids, sc_only='all')
+    requested = set().union(*[set(x[1]) for x in _price_requests(rqdata)])
+    assert set(ids) <= requested
+    assert not requested & (set(chain.id_list) - set(ids))
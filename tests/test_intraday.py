@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from option_greeks.bs_model.computation import get_greeks
+from option_greeks.intraday import get_intraday_greeks
+
+
+def test_minute_panel_of_a_day_matches_the_daily_greeks(chain, rqdata):
+    # the fake minute bars are the daily closes, one timestamp per day
+    (_date, frames), = list(get_intraday_greeks(chain.date, chain.date))
+    daily = get_greeks(chain.date, sc_only='all').reset_index(level='trading_date', drop=True)
+
+    assert frames['iv'].shape == (1, len(chain))
+    iv = frames['iv'].iloc[0].reindex(daily.index)
+    solved = daily['iv'] > 0.01
+    assert np.allclose(iv[solved], daily.loc[solved, 'iv'], rtol=0, atol=1e-3)
+    assert {x[0] for x in rqdata.requests} >= {'get_price', 'get_yield_curve'}
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import datetime as dt
+import numpy as np
+from option_greeks.bs_model.computation import get_greeks_both, get_greeks_panel_both
+from option_greeks.mongo_insert import CustomizedMongo, backfill_panel, data_processing_both, implied_col, spot_col
+from stubs import by_id
+
+
+def test_panel_equals_the_daily_runs(rqdata):
+    dates = [x.to_pydatetime() for x in rqdata.dates[:3]]
+    implied_panel, spot_panel = get_greeks_panel_both(dates, sc_only='all')
+    assert sorted(spot_panel) == dates
+    for _date in dates:
+        # the panel solves with the vectorized kernel, as the sharded daily run does
+        implied, spot = get_greeks_both(_date, sc_only='all', sharded=True)
+        for panel, daily in ((implied_panel[_date], implied), (spot_panel[_date], spot)):
+            panel, daily = by_id(panel), by_id(daily)
+            assert panel.index.equals(daily.index)
+            assert np.allclose(panel.values, daily.values, rtol=1e-9, atol=1e-12, equal_nan=True)
+
+
+def test_backfill_and_daily_runs_write_the_same_documents(rqdata, mongo):
+    start, end = rqdata.dates[0].to_pydatetime(), rqdata.dates[1].to_pydatetime()
+    backfill_panel('mongodb://fake', 'db', start, end, window=2)
+    documents = mongo.collections['db.' + spot_col].documents
+    written = len(documents)
+    assert {type(x['trading_date']) for x in documents} == {dt.date}
+
+    data_processing_both(CustomizedMongo('mongodb://fake', 'db', implied_col),
+                         CustomizedMongo('mongodb://fake', 'db', spot_col), [start.date(), end.date()],
+                         sc_only='all', upsert=True)
+    # the daily documents have the keys of the backfilled ones, the upsert replaced them
+    for col in (implied_col, spot_col):
+        documents = mongo.collections['db.' + col].documents
+        assert len(documents) == written
+        assert {type(x['trading_date']) for x in documents} == {dt.date}
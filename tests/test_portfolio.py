@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.synthetic import make_chain
+from option_greeks.portfolio import PortfolioAggregator, get_moneyness
+
+
+def _greeks(ids):
+    return pd.DataFrame({'iv': 0.2, 'delta': 1.0, 'gamma': 0.5}, index=pd.Index(ids, name='order_book_id'))
+
+
+def test_position_without_book_is_its_own_group():
+    chain = make_chain(6)
+    ids = chain.id_list[:3]
+    positions = pd.DataFrame({'order_book_id': ids, 'quantity': [1, 2, 4], 'contract_multiplier': 10,
+                              'book': ['x', np.nan, 'y']})
+    total = PortfolioAggregator(positions, chain.info).aggregate(_greeks(ids), groups=('total',))['total']
+
+    assert len(total) == 3
+    assert not total.index.duplicated().any()
+    assert total.loc[('x', 0), 'delta'] == 10
+    assert total.loc[('y', 0), 'delta'] == 40
+    assert total.loc[total.index.get_level_values('book').isna(), 'delta'].tolist() == [20]
+
+
+def test_moneyness_from_market_data():
+    chain = make_chain(22)
+    positions = pd.DataFrame({'order_book_id': chain.id_list, 'quantity': 1, 'contract_multiplier': 1})
+    result = PortfolioAggregator(positions, chain.info, market_data=chain).aggregate(_greeks(chain.id_list))
+
+    counts = get_moneyness(chain).value_counts()
+    assert result['moneyness']['delta'].to_dict() == counts.astype(float).to_dict()
+    assert result['total']['delta'].tolist() == [len(chain)]
+
+
+def test_moneyness_requested_without_data_warns():
+    chain = make_chain(4)
+    positions = pd.DataFrame({'order_book_id': chain.id_list, 'quantity': 1, 'contract_multiplier': 1})
+    with pytest.warns(UserWarning, match='moneyness'):
+        result = PortfolioAggregator(positions, chain.info).aggregate(_greeks(chain.id_list))
+    assert 'moneyness' not in result
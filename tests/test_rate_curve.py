@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from option_greeks import rate_curve
+from option_greeks.bs_model.computation import get_greeks
+from option_greeks.bs_model.kernel import bs_price, bs_greeks
+from stubs import TENORS, TENOR_RATES
+
+
+def test_iv_and_rho_use_the_curve_rate_of_every_contract(chain, rqdata):
+    result = get_greeks(chain.date, sc_only='all').reset_index(level='trading_date', drop=True)
+    ids = result.index
+    ttm = chain.ttm_series.reindex(ids).values
+    rate = rate_curve.RateCurve([rate_curve.tenor_years(x) for x in TENORS], TENOR_RATES).rate(ttm)
+    assert len(np.unique(rate)) > 1
+    assert 'get_risk_free_rate' not in [x[0] for x in rqdata.requests]
+
+    args = (chain.udp_series.reindex(ids).values, chain.sp_series.reindex(ids).values, rate, np.zeros(len(ids)),
+            result['iv'].values, ttm, (chain.type_series.reindex(ids) == 'C').values)
+    # contracts at the price floor of the solver have no informative iv
+    solved = result['iv'].values > 0.01
+    price = chain.option_price.reindex(ids).values
+    assert np.allclose(bs_price(*args)[solved], price[solved], rtol=1e-4, atol=1e-2)
+    assert np.allclose(bs_greeks(*args, greeks=('rho',))['rho'][solved], result['rho'].values[solved], rtol=1e-5,
+                       atol=1e-2)
+
+
+def test_flat_rate_without_curve(chain, rqdata, monkeypatch):
+    monkeypatch.setattr(rqdata, 'get_yield_curve', lambda *args: None)
+    result = get_greeks(chain.date, sc_only='all')
+    assert result['iv'].notna().all()
+    assert 'get_risk_free_rate' in [x[0] for x in rqdata.requests]
@@ -1,29 +1,109 @@
 
-import numpy as np
+import os
 import pandas as pd
-import datetime as dt
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from option_greeks.cache import atomic_write
 
+"""
+    Bulk repair of the daybar files: prev_settlement of the (id, date) pairs listed in the patch list is replaced by the
+    value of the source file. The patch list and the source are read once and joined into one long table, every daybar
+    file is then patched with a single aligned assignment, written to a temporary file and moved into place, the files
+    are spread over a process pool.
+"""
 
-def update_data_csv(filename, datafile, target_file):
-    check = 'prev_settlement'
-    pd_price = pd.read_csv(filename, index_col=[0])
-    id_list = pd_price.index.tolist()
-    id_list = list(set(id_list))
+CHECK = 'prev_settlement'
 
+
+def load_patch_source(datafile, suffix='.SH'):
+    """
+    :param datafile: csv, column date as YYYY/MM/DD and one column per underlying, e.g. 10001333.SH
+    :return: long DataFrame, columns id, date_key (YYYYMMDD str), value
+    """
     pd_data = pd.read_csv(datafile)
-    pd_data['date'] = pd_data['date'].apply(lambda x: dt.datetime.strptime(x, '%Y/%m/%d'))
-    pd_data['date'] = pd_data['date'].apply(lambda x: dt.datetime.strftime(x, '%Y%m%d'))
-    pd_data = pd_data.set_index('date')
-
-    for i in id_list:
-        t = target_file + '/' + str(i) + '_Day.csv'
-        temp = pd.read_csv(t, index_col=[0])
-        for d in pd_price['date'][i]:
-            u_i = str(i) + '.SH'
-            temp.at[d, check] = pd_data[u_i][str(d)]
-        temp.to_csv(t)
-        print(temp)
+    pd_data['date'] = pd.to_datetime(pd_data['date'], format='%Y/%m/%d').dt.strftime('%Y%m%d')
+    columns = [x for x in pd_data.columns if str(x).endswith(suffix)]
+    long_data = pd_data.melt(id_vars='date', value_vars=columns, var_name='id', value_name='value')
+    long_data['id'] = long_data['id'].str[:-len(suffix)]
+    return long_data.rename(columns={'date': 'date_key'})
+
+
+def get_patches(filename, datafile, suffix='.SH'):
+    """
+    join the patch list with the source once for all the files
+    :param filename: csv, index = id, column date, one row per cell to patch
+    :return: DataFrame, columns id, date (as in the patch list), value; pairs missing in the source are dropped
+    """
+    pd_price = pd.read_csv(filename, index_col=[0])
+    patch_list = pd.DataFrame({'id': pd_price.index.astype(str), 'date': pd_price['date'].values})
+    patch_list['date_key'] = patch_list['date'].astype(str)
+    patches = patch_list.merge(load_patch_source(datafile, suffix), on=['id', 'date_key'], how='left',
+                               indicator=True)
+    missing = patches['_merge'] != 'both'
+    if missing.any():
+        print('{} cells not found in {}, e.g. {}'.format(
+            missing.sum(), datafile, patches.loc[missing, ['id', 'date']].head().values.tolist()))
+    # the last row of a repeated (id, date) wins, as the cell by cell update did
+    patches = patches[~missing].drop_duplicates(['id', 'date'], keep='last')
+    return patches[['id', 'date', 'value']]
+
+
+def patch_file(path, dates, values, output_format='csv', check=CHECK):
+    """
+    :param dates: dates to patch, same type as the index of the daybar file
+    :param values: new values, aligned with dates
+    :return: (path written, cells updated, rows appended)
+    """
+    temp = pd.read_csv(path, index_col=[0])
+    new_values = pd.Series(values, index=pd.Index(dates, name=temp.index.name))
+    existing = new_values.index.isin(temp.index)
+    temp.loc[new_values.index[existing], check] = new_values.values[existing]
+    if not existing.all():
+        # dates missing in the file are appended, as DataFrame.at did
+        temp = pd.concat([temp, new_values[~existing].to_frame(check)])
+    target = os.path.splitext(path)[0] + '.parquet' if output_format == 'parquet' else path
+    # written to a temporary file next to target and moved into place, readers never see a partial file
+    atomic_write(target, temp.to_parquet if output_format == 'parquet' else temp.to_csv)
+    return target, int(existing.sum()), int((~existing).sum())
+
+
+def _patch_file(args):
+    return patch_file(*args)
+
+
+def repair_daybar(filename, datafile, target_file, output_format='csv', processes=None, suffix='.SH'):
+    """
+    :param filename: patch list csv, index = id, column date
+    :param datafile: source csv of the correct values
+    :param target_file: directory of the {id}_Day.csv files
+    :param output_format: 'csv' (in place) or 'parquet' (written next to the csv)
+    :param processes: size of the process pool, 1 runs in this process, default os.cpu_count()
+    :return: DataFrame, one row per file: id, path, updated, appended
+    """
+    patches = get_patches(filename, datafile, suffix)
+    tasks, ids = [], []
+    for i, group in patches.groupby('id', sort=True):
+        path = os.path.join(target_file, '{}_Day.csv'.format(i))
+        if not os.path.exists(path):
+            print('{} not found'.format(path))
+            continue
+        ids.append(i)
+        tasks.append((path, group['date'].values, group['value'].values, output_format))
+
+    if processes == 1 or len(tasks) <= 1:
+        result = [_patch_file(x) for x in tasks]
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            result = list(executor.map(_patch_file, tasks, chunksize=16))
+    summary = pd.DataFrame(result, columns=['path', 'updated', 'appended'])
+    summary.insert(0, 'id', ids)
+    print('{} files, {} cells updated, {} rows appended'.format(len(summary), summary['updated'].sum(),
+                                                               summary['appended'].sum()))
+    return summary
+
+
+def update_data_csv(filename, datafile, target_file):
+    repair_daybar(filename, datafile, target_file, processes=1)
     return True
 
 
@@ -35,12 +115,14 @@ def read_hd5(filename):
 
 if __name__ == '__main__':
 
-    if len(sys.argv) != 4:
-        raise EnvironmentError('4 arguments required')
+    if len(sys.argv) not in (4, 5, 6):
+        raise EnvironmentError('usage: update_nan.py patch_list datafile target_dir [csv|parquet] [processes]')
 
     output = sys.argv[1]
     dataf = sys.argv[2]
     target = sys.argv[3]
-    update_data_csv('output.csv', dataf, target)
+    file_format = sys.argv[4] if len(sys.argv) > 4 else 'csv'
+    n_processes = int(sys.argv[5]) if len(sys.argv) > 5 else None
+    repair_daybar(output, dataf, target, file_format, n_processes)
 
     # read_hd5(r'C:\Users\rice\Desktop\etf_daybar\h5_data.h5')